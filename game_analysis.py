@@ -0,0 +1,322 @@
+# =============================================================================
+# Beetle Battle - Game Analysis Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Optional
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
+import argparse
+import csv
+import os
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_engine import Game
+from game_engine import DummyGui
+from game_engine import EVENT_BEETLE_MOVED
+from game_cache import PositionCache
+from game_search import INFINITE_SCORE
+from game_search import Search
+from game_search import TranspositionTable
+from game_search import get_child
+from game_search import get_move_index
+from game_search import get_position_hash
+
+# =============================================================================
+# Constants
+# =============================================================================
+DEFAULT_ANALYSIS_DEPTH = 2  # Number of plies that each move is searched
+
+# =============================================================================
+# Global Variables
+# =============================================================================
+position_cache = None  # Position cache of this process (see open_position_cache)
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: read_game_file
+# This function reads a game saved by GameGui.save_game and returns the
+# dimension of the board and the moves as (color, row, column) tuples.
+# -----------------------------------------------------------------------------
+def read_game_file(file_path: str) -> tuple[int, list[tuple[str, int, int]]]:
+    with open(file_path, newline='', encoding='utf-8') as file:
+        lines = file.read().splitlines()
+
+    dimension = None
+    header_index = None
+    for index, line in enumerate(lines):
+        if line.startswith("dimension:"):
+            dimension = int(line.split(":")[1])
+        elif line.startswith("move_number"):
+            header_index = index
+            break
+
+    if dimension is None or header_index is None:
+        raise ValueError(f"{file_path} is not a saved game")
+
+    moves = []
+    for row in csv.DictReader(lines[header_index:]):
+        moves.append((row["color"], int(row["row"]), int(row["column"])))
+    return dimension, moves
+
+# -----------------------------------------------------------------------------
+# Function: analyze_position
+# This function takes a position (see Game.to_bytes) and the depth and
+# returns the score of each possible move, by square index, for the player
+# to move. The scores are the heuristic value of the position after the move
+# searched to the indicated depth. If a position cache is indicated, the
+# searches use and extend it.
+# -----------------------------------------------------------------------------
+def analyze_position(position: bytes, depth: int, cache: Optional[PositionCache] = None) -> dict[int, int]:
+    game = Game.from_bytes(position)
+    search = Search(game, TranspositionTable(cache=cache))
+    scores = {}
+    for location in game.get_possible_moves():
+        score = -search.alpha_beta(get_child(game, location), depth - 1, -INFINITE_SCORE, INFINITE_SCORE, 1)
+        scores[get_move_index(game, location)] = score
+    return scores
+
+# -----------------------------------------------------------------------------
+# Function: open_position_cache
+# This function opens the position cache of this process if its path is
+# indicated. The cache is kept open for all positions that the process
+# analyzes and closed by close_position_cache.
+# -----------------------------------------------------------------------------
+def open_position_cache(cache_path: Optional[str]) -> None:
+    global position_cache
+    if cache_path is not None:
+        position_cache = PositionCache(cache_path)
+
+# -----------------------------------------------------------------------------
+# Function: close_position_cache
+# This function writes the new entries of the position cache of this
+# process, if it is open, and closes it.
+# -----------------------------------------------------------------------------
+def close_position_cache() -> None:
+    global position_cache
+    if position_cache is not None:
+        cache, position_cache = position_cache, None
+        cache.close()
+
+# -----------------------------------------------------------------------------
+# Function: init_analysis_worker
+# This function is the initializer of the processes of the worker pool. It
+# opens the position cache of the process, which is closed when the process
+# ends after the pool is closed.
+# -----------------------------------------------------------------------------
+def init_analysis_worker(cache_path: Optional[str]) -> None:
+    open_position_cache(cache_path)
+    Finalize(None, close_position_cache, exitpriority=10)
+
+# -----------------------------------------------------------------------------
+# Function: analyze_position_worker
+# This function is run by the processes of the worker pool. It takes the
+# hash of a position, the position and the depth and returns the hash with
+# the scores of the moves. The searches use the position cache of the
+# process.
+# -----------------------------------------------------------------------------
+def analyze_position_worker(arguments) -> tuple[int, dict[int, int]]:
+    position_hash, position, depth = arguments
+    return position_hash, analyze_position(position, depth, position_cache)
+
+# -----------------------------------------------------------------------------
+# Function: replay_game
+# This function replays the moves on a new board and returns for each move
+# the hash and bytes of the position before the move and the cascade size,
+# which is the number of beetle jumps of the move.
+# -----------------------------------------------------------------------------
+def replay_game(dimension: int, moves: list[tuple[str, int, int]]) -> list[tuple[int, bytes, int]]:
+    game = Game(dimension, DummyGui())
+    positions = []
+    for color, row, column in moves:
+        if color != game.turn or not game.check_move(row, column):
+            raise ValueError(f"Move {len(positions) + 1} ({color} {row},{column}) is not valid")
+        position_hash = get_position_hash(game)
+        position = game.to_bytes()
+        events = game.do_move_events(row, column)
+        cascade_size = sum(1 for event in events if event[0] == EVENT_BEETLE_MOVED)
+        positions.append((position_hash, position, cascade_size))
+    return positions
+
+# -----------------------------------------------------------------------------
+# Function: analyze_games
+# This function analyzes the games in the indicated files and returns the
+# analysis of each file. Positions that occur more than once, also in
+# different files, are analyzed only once. The positions are divided over
+# the indicated number of processes. The cache maps the hash of a position
+# to the scores of its moves and can be reused for other calls. The searches
+# use the position cache file if its path is indicated, so that a later run
+# starts warm. Each process opens the file once. A file of another
+# evaluation raises a ValueError, unless reset_cache is set: then the file
+# is emptied first.
+# -----------------------------------------------------------------------------
+def analyze_games(file_paths: list[str], depth=DEFAULT_ANALYSIS_DEPTH, processes=1,
+                  cache=None, cache_path=None, reset_cache=False) -> list["GameAnalysis"]:
+    cache = {} if cache is None else cache
+    if cache_path is not None:
+        # Check the file here, before the processes open it.
+        PositionCache(cache_path, reset=reset_cache).close()
+
+    games = []
+    for file_path in file_paths:
+        dimension, moves = read_game_file(file_path)
+        games.append((file_path, dimension, moves, replay_game(dimension, moves)))
+
+    # Collect the positions that have not been analyzed yet.
+    positions = {}
+    for _, _, _, game_positions in games:
+        for position_hash, position, _ in game_positions:
+            if position_hash not in cache:
+                positions[position_hash] = position
+    arguments = [(position_hash, position, depth) for position_hash, position in positions.items()]
+
+    if processes > 1:
+        # The pool is closed instead of terminated, so that the processes
+        # write their position caches when they end.
+        pool = Pool(processes, initializer=init_analysis_worker, initargs=(cache_path,))
+        try:
+            for position_hash, scores in pool.imap_unordered(analyze_position_worker, arguments, chunksize=8):
+                cache[position_hash] = scores
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        open_position_cache(cache_path)
+        try:
+            for argument in arguments:
+                position_hash, scores = analyze_position_worker(argument)
+                cache[position_hash] = scores
+        finally:
+            close_position_cache()
+
+    analyses = []
+    for file_path, dimension, moves, game_positions in games:
+        analysis = GameAnalysis(file_path, dimension)
+        for (color, row, column), (position_hash, _, cascade_size) in zip(moves, game_positions):
+            analysis.add_move(color, row, column, cache[position_hash], cascade_size)
+        analyses.append(analysis)
+    return analyses
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: MoveAnalysis
+# The analysis of a move: the score of the move, the best alternative (see
+# GameAnalysis.add_move) with its own score, the loss and the cascade size.
+# The loss is how much the score of the move is below the score of the
+# alternative, and 0 if the move scores at least as much.
+# -----------------------------------------------------------------------------
+class MoveAnalysis:
+
+    # -------------------------------------------------------------------------
+    # MoveAnalysis constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, move_number, color, row, column, score, best_row, best_column, best_score, cascade_size):
+        self.move_number  = move_number
+        self.color        = color
+        self.row          = row
+        self.column       = column
+        self.score        = score
+        self.best_row     = best_row
+        self.best_column  = best_column
+        self.best_score   = best_score
+        self.loss         = max(0, best_score - score)
+        self.cascade_size = cascade_size
+
+# -----------------------------------------------------------------------------
+# Class: GameAnalysis
+# The analysis of the moves of a saved game.
+# -----------------------------------------------------------------------------
+class GameAnalysis:
+
+    # -------------------------------------------------------------------------
+    # GameAnalysis constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, file_path, dimension):
+        self.file_path = file_path
+        self.dimension = dimension
+        self.moves = []
+
+    # -------------------------------------------------------------------------
+    # GameAnalysis method: add_move
+    # This method takes a move, the scores of the possible moves by square
+    # index and the cascade size and adds the analysis of the move. The best
+    # alternative is the best move other than the move itself if the move is
+    # the best, otherwise the best move. It is shown with its own score, so
+    # the loss of the best move is 0 and the loss of another move is its
+    # difference with the best move.
+    # -------------------------------------------------------------------------
+    def add_move(self, color, row, column, scores, cascade_size) -> None:
+        index = row * self.dimension + column
+        best_index = max(scores, key=lambda move_index: (scores[move_index], -move_index))
+        if best_index == index and len(scores) > 1:
+            best_index = max((move_index for move_index in scores if move_index != index),
+                             key=lambda move_index: (scores[move_index], -move_index))
+        best_row, best_column = divmod(best_index, self.dimension)
+        best_score = scores[best_index]
+        self.moves.append(MoveAnalysis(len(self.moves) + 1, color, row, column, scores[index],
+                                       best_row, best_column, best_score, cascade_size))
+
+    # -------------------------------------------------------------------------
+    # GameAnalysis method: get_total_loss
+    # This method returns the total loss of the moves of the indicated color.
+    # -------------------------------------------------------------------------
+    def get_total_loss(self, color) -> int:
+        return sum(move.loss for move in self.moves if move.color == color)
+
+    # -------------------------------------------------------------------------
+    # GameAnalysis method: write_csv
+    # This method writes the annotated moves to a CSV file.
+    # -------------------------------------------------------------------------
+    def write_csv(self, file_path) -> None:
+        with open(file_path, 'w', newline='', encoding='utf-8') as file:
+            file.write(f"dimension: {self.dimension}\n\n")
+            writer = csv.writer(file)
+            writer.writerow(("move_number", "color", "row", "column", "score",
+                             "best_row", "best_column", "best_score", "loss", "cascade_size"))
+            for move in self.moves:
+                writer.writerow((move.move_number, move.color, move.row, move.column, move.score,
+                                 move.best_row, move.best_column, move.best_score, move.loss,
+                                 move.cascade_size))
+
+# =============================================================================
+# Main
+# =============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Annotate the moves of saved games.")
+    parser.add_argument("files", nargs="+", help="CSV files saved by the game")
+    parser.add_argument("--depth", type=int, default=DEFAULT_ANALYSIS_DEPTH, help="search depth per move")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument("--csv", action="store_true", help="write <file>-analysis.csv next to each file")
+    parser.add_argument("--cache", help="position cache file that is shared across runs")
+    parser.add_argument("--reset-cache", action="store_true",
+                        help="empty the position cache file if it was made with another evaluation")
+    args = parser.parse_args()
+
+    for analysis in analyze_games(args.files, args.depth, args.processes, cache_path=args.cache,
+                                  reset_cache=args.reset_cache):
+        print(f"{analysis.file_path} (dimension {analysis.dimension})")
+        print(" move color  move   score   best   score   loss  cascade")
+        for move in analysis.moves:
+            print(f"{move.move_number:5} {move.color:5} {move.row:2},{move.column:<2} {move.score:7} "
+                  f"{move.best_row:2},{move.best_column:<2} {move.best_score:7} {move.loss:6} "
+                  f"{move.cascade_size:8}")
+        print(f"total loss: red {analysis.get_total_loss('red')}, blue {analysis.get_total_loss('blue')}")
+        print()
+
+        if args.csv:
+            analysis.write_csv(os.path.splitext(analysis.file_path)[0] + "-analysis.csv")
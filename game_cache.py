@@ -0,0 +1,311 @@
+# =============================================================================
+# Beetle Battle - Game Cache Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Optional
+import mmap
+import os
+import struct
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_search import get_evaluator_fingerprint
+
+# =============================================================================
+# Constants
+# =============================================================================
+CACHE_MAGIC = b"BBCACHE1"
+CACHE_VERSION = 2
+HEADER_FORMAT = struct.Struct("<8sIIQQ")  # magic, version, entry size, capacity, fingerprint
+HEADER_SIZE = 64
+
+# An entry: position hash, search score, search depth, bound, flags, best
+# move, then a checksum of these fields and padding.
+ENTRY_FIELDS = struct.Struct("<QihbBH")
+ENTRY_FORMAT = struct.Struct("<QihbBHI2x")
+ENTRY_SIZE = ENTRY_FORMAT.size
+
+HAS_SEARCH = 1  # The entry has a search result; the flags of an empty entry are 0
+
+NO_MOVE = 0xFFFF              # Best move of a search result without a move
+DEFAULT_CAPACITY = 1 << 20    # Number of entries of a new cache file
+MAX_PROBES = 8                # Number of entries that are considered per hash
+MAX_PENDING_ENTRIES = 100000  # New entries are written when there are this many
+EMPTY_DEPTH = -1              # Replacement depth of an empty entry
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: pack_entry
+# This function returns the bytes of an entry with its checksum.
+# -----------------------------------------------------------------------------
+def pack_entry(position_hash, score, depth, bound, flags, best_move) -> bytes:
+    fields = ENTRY_FIELDS.pack(position_hash, score, depth, bound, flags, best_move)
+    return ENTRY_FORMAT.pack(position_hash, score, depth, bound, flags, best_move, zlib.crc32(fields))
+
+# -----------------------------------------------------------------------------
+# Function: unpack_entry
+# This function takes the bytes of an entry and returns its fields, or None
+# if the entry is empty or its checksum does not match. The checksum does not
+# match when the entry was read while it was being written.
+# -----------------------------------------------------------------------------
+def unpack_entry(data: bytes) -> Optional[tuple]:
+    position_hash, score, depth, bound, flags, best_move, checksum = ENTRY_FORMAT.unpack(data)
+    if flags == 0:
+        return None
+    if zlib.crc32(data[:ENTRY_FIELDS.size]) != checksum:
+        return None
+    return position_hash, score, depth, bound, flags, best_move
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: CacheEntry
+# The search result that is stored for a position. The best move is a square
+# index or None.
+# -----------------------------------------------------------------------------
+class CacheEntry:
+
+    # -------------------------------------------------------------------------
+    # CacheEntry constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, depth, score, bound, best_move=None):
+        self.depth     = depth
+        self.score     = score
+        self.bound     = bound
+        self.best_move = best_move
+
+    # -------------------------------------------------------------------------
+    # CacheEntry method: merge
+    # This method takes a newer entry for the same position and takes over
+    # its search result if it is at least as deep.
+    # -------------------------------------------------------------------------
+    def merge(self, entry) -> None:
+        if entry.depth >= self.depth:
+            self.depth = entry.depth
+            self.score = entry.score
+            self.bound = entry.bound
+            self.best_move = entry.best_move
+
+# -----------------------------------------------------------------------------
+# Class: PositionCache
+# The position cache stores search results by position hash in a file, so
+# that they can be used by other processes and later runs. The file is a
+# table with a fixed number of entries that is memory mapped. A hash is
+# stored in one of the MAX_PROBES entries after its home entry (open
+# addressing); if all are in use, the entry with the shallowest search is
+# replaced.
+# Any number of processes can read the file at the same time. New entries
+# are collected in memory and written by flush, while the file is locked so
+# that only one process writes at a time. A reader that reads an entry while
+# it is written sees a wrong checksum and treats it as not stored.
+# On systems without fcntl, the file is not locked and the caller has to make
+# sure that only one process flushes at a time.
+# The scores depend on the evaluation, so the header of the file has the
+# fingerprint of the evaluation that computed them (see
+# Evaluator.fingerprint). A file with another fingerprint is not used.
+# -----------------------------------------------------------------------------
+class PositionCache:
+
+    # -------------------------------------------------------------------------
+    # PositionCache constructor
+    # The constructor opens the cache file. If the file does not exist, it is
+    # created with the indicated number of entries, rounded up to a power of
+    # two. Without a fingerprint, the fingerprint of the default evaluator of
+    # the searches is taken (see set_default_evaluator), which is the
+    # heuristic with the weights in use unless a model was loaded as the
+    # default. If the fingerprint of the file is different, a ValueError is
+    # raised, unless reset is set: then the file is emptied and gets the new
+    # fingerprint. Only reset a file that no other process has open.
+    # -------------------------------------------------------------------------
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, fingerprint=None, reset=False):
+        self.path = path
+        self.pending = {}
+        self.fingerprint = get_evaluator_fingerprint() if fingerprint is None else fingerprint
+
+        if not os.path.exists(path):
+            self.create_file(1 << max(capacity - 1, 1).bit_length())
+
+        self.file = open(path, "rb")
+        magic, version, entry_size, capacity, fingerprint = HEADER_FORMAT.unpack(
+            self.file.read(HEADER_FORMAT.size))
+        if magic != CACHE_MAGIC or version != CACHE_VERSION or entry_size != ENTRY_SIZE:
+            self.file.close()
+            raise ValueError(f"{path} is not a position cache")
+        if fingerprint != self.fingerprint:
+            self.file.close()
+            if not reset:
+                raise ValueError(f"{path} is a position cache of another evaluation")
+            self.create_file(capacity)
+            self.file = open(path, "rb")
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # -------------------------------------------------------------------------
+    # PositionCache method: create_file
+    # This method creates an empty cache file with the indicated number of
+    # entries, or empties the existing file.
+    # -------------------------------------------------------------------------
+    def create_file(self, capacity) -> None:
+        with open(self.path, "wb") as file:
+            header = HEADER_FORMAT.pack(CACHE_MAGIC, CACHE_VERSION, ENTRY_SIZE, capacity, self.fingerprint)
+            file.write(header.ljust(HEADER_SIZE, b"\0"))
+            file.truncate(HEADER_SIZE + capacity * ENTRY_SIZE)
+
+    # -------------------------------------------------------------------------
+    # PositionCache method: close
+    # This method writes the new entries and closes the file.
+    # -------------------------------------------------------------------------
+    def close(self) -> None:
+        self.flush()
+        self.map.close()
+        self.file.close()
+
+    # -------------------------------------------------------------------------
+    # PositionCache method: read_entry
+    # This method takes a memory map and a slot and returns the fields of the
+    # entry in the slot or None.
+    # -------------------------------------------------------------------------
+    def read_entry(self, memory_map, slot) -> Optional[tuple]:
+        offset = HEADER_SIZE + slot * ENTRY_SIZE
+        return unpack_entry(memory_map[offset:offset + ENTRY_SIZE])
+
+    # -------------------------------------------------------------------------
+    # PositionCache method: probe
+    # This method takes a position hash and returns the stored entry or None.
+    # New entries that have not been written yet are also found.
+    # -------------------------------------------------------------------------
+    def probe(self, position_hash) -> Optional[CacheEntry]:
+        stored_entry = None
+        for probe in range(MAX_PROBES):
+            fields = self.read_entry(self.map, (position_hash + probe) & self.mask)
+            if fields is not None and fields[0] == position_hash:
+                stored_entry = self.create_entry(fields)
+                break
+
+        pending_entry = self.pending.get(position_hash)
+        if pending_entry is None:
+            return stored_entry
+        if stored_entry is None:
+            return pending_entry
+        stored_entry.merge(pending_entry)
+        return stored_entry
+
+    # -------------------------------------------------------------------------
+    # PositionCache method: create_entry
+    # This method returns the entry for the fields of a stored entry.
+    # -------------------------------------------------------------------------
+    def create_entry(self, fields) -> CacheEntry:
+        _, score, depth, bound, _, best_move = fields
+        return CacheEntry(depth, score, bound, None if best_move == NO_MOVE else best_move)
+
+    # -------------------------------------------------------------------------
+    # PositionCache method: store_search
+    # This method stores the result of a search of a position. It is written
+    # by flush.
+    # -------------------------------------------------------------------------
+    def store_search(self, position_hash, depth, score, bound, best_move) -> None:
+        self.add_pending(position_hash, CacheEntry(depth, score, bound, best_move))
+
+    # -------------------------------------------------------------------------
+    # PositionCache method: add_pending
+    # This method adds a new entry to the entries that are written by flush.
+    # When there are too many new entries, they are written right away.
+    # -------------------------------------------------------------------------
+    def add_pending(self, position_hash, entry) -> None:
+        pending_entry = self.pending.get(position_hash)
+        if pending_entry is None:
+            self.pending[position_hash] = entry
+            if len(self.pending) >= MAX_PENDING_ENTRIES:
+                self.flush()
+        else:
+            pending_entry.merge(entry)
+
+    # -------------------------------------------------------------------------
+    # PositionCache method: flush
+    # This method writes the new entries to the file while the file is locked.
+    # The entries are merged with the stored entries of the same positions,
+    # which may have been written by other processes in the meantime.
+    # -------------------------------------------------------------------------
+    def flush(self) -> None:
+        if len(self.pending) == 0:
+            return
+
+        with open(self.path, "r+b") as file:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                memory_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE)
+                try:
+                    for position_hash, entry in self.pending.items():
+                        self.write_entry(memory_map, position_hash, entry)
+                    memory_map.flush()
+                finally:
+                    memory_map.close()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+        self.pending.clear()
+
+    # -------------------------------------------------------------------------
+    # PositionCache method: write_entry
+    # This method writes an entry in the slot of its position, in an empty
+    # slot or in the slot of the entry with the shallowest search.
+    # -------------------------------------------------------------------------
+    def write_entry(self, memory_map, position_hash, entry) -> None:
+        target_slot = None
+        target_depth = None
+        for probe in range(MAX_PROBES):
+            slot = (position_hash + probe) & self.mask
+            fields = self.read_entry(memory_map, slot)
+            if fields is None:
+                if target_depth != EMPTY_DEPTH:
+                    target_slot, target_depth = slot, EMPTY_DEPTH
+                continue
+            if fields[0] == position_hash:
+                stored_entry = self.create_entry(fields)
+                stored_entry.merge(entry)
+                entry = stored_entry
+                target_slot = slot
+                break
+            if target_depth is None or fields[2] < target_depth:
+                target_slot, target_depth = slot, fields[2]
+
+        best_move = NO_MOVE if entry.best_move is None else entry.best_move
+        data = pack_entry(position_hash, entry.score, entry.depth, entry.bound, HAS_SEARCH, best_move)
+        offset = HEADER_SIZE + target_slot * ENTRY_SIZE
+        memory_map[offset:offset + ENTRY_SIZE] = data
+
+    # -------------------------------------------------------------------------
+    # PositionCache method: merge_file
+    # This method adds the entries of another cache file to the new entries,
+    # so that they are written by the next flush. The other file must have
+    # the same fingerprint.
+    # -------------------------------------------------------------------------
+    def merge_file(self, path) -> None:
+        other_cache = PositionCache(path, fingerprint=self.fingerprint)
+        try:
+            for slot in range(other_cache.capacity):
+                fields = other_cache.read_entry(other_cache.map, slot)
+                if fields is not None:
+                    self.add_pending(fields[0], other_cache.create_entry(fields))
+        finally:
+            other_cache.close()
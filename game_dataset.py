@@ -0,0 +1,485 @@
+# =============================================================================
+# Beetle Battle - Game Dataset Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Optional
+import argparse
+import multiprocessing
+import os
+import struct
+import time
+import numpy as np
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_analysis import analyze_position
+from game_analysis import read_game_file
+from game_engine import DummyGui
+from game_engine import Game
+from game_vector import BLUE
+from game_vector import EMPTY
+from game_vector import OWNER_CODES
+from game_vector import RED
+from game_vector import VectorSelfPlay
+from game_vector import get_position_arrays
+from game_vector import get_position_planes
+
+# =============================================================================
+# Constants
+# =============================================================================
+NPY_HEADER_SIZE = 256  # Fixed size of the .npy header, so that it can be rewritten when the file grows
+
+DEFAULT_SHARD_ROWS = 1 << 16  # Number of records a new shard has room for
+COMMIT_INTERVAL = 1 << 20     # Number of records after which the self-play shards are committed
+
+UNKNOWN_OUTCOME = -128  # Outcome of a record of a game that did not finish
+NO_VALUE = np.nan       # Search value of a record without a search
+
+# The fields of a record: name, data type and shape of a record (the
+# dimension of the board is filled in for "N" and "S" is the number of
+# squares).
+RECORD_FIELDS = (
+    ("planes",   np.uint8,   (2, "N", "N")),  # See get_position_planes
+    ("turns",    np.int8,    ()),             # Owner code of the player to move
+    ("masks",    np.bool_,   ("S",)),         # Possible moves
+    ("moves",    np.int16,   ()),             # Square index of the chosen move
+    ("values",   np.float32, ()),             # Search value for the player to move
+    ("outcomes", np.int8,    ()),             # 1 if the player to move won, -1 if it lost, 0 for a draw
+)
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: get_record_shape
+# This function returns the shape of a record of a field for the dimension.
+# -----------------------------------------------------------------------------
+def get_record_shape(shape, dimension) -> tuple:
+    sizes = {"N": dimension, "S": dimension * dimension}
+    return tuple(sizes.get(size, size) for size in shape)
+
+# -----------------------------------------------------------------------------
+# Function: write_npy_header
+# This function writes a .npy header (version 1.0) at the start of the file.
+# The header is padded to NPY_HEADER_SIZE bytes, so that it can be written
+# again with another number of rows without moving the data.
+# -----------------------------------------------------------------------------
+def write_npy_header(file, dtype, shape) -> None:
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                   "fortran_order": False, "shape": tuple(shape)}).encode("latin1")
+    magic = np.lib.format.magic(1, 0)
+    header_size = NPY_HEADER_SIZE - len(magic) - 2
+    if len(header) >= header_size:
+        raise ValueError(f"The header of shape {shape} does not fit")
+    file.seek(0)
+    file.write(magic + struct.pack("<H", header_size) + header.ljust(header_size - 1) + b"\n")
+
+# -----------------------------------------------------------------------------
+# Function: get_outcomes
+# This function takes the move numbers of moves (0 for the first move of a
+# game) and the owner codes of the winners of their games (EMPTY for a draw)
+# and returns the outcome of each move for the player who made it. Red makes
+# the first move.
+# -----------------------------------------------------------------------------
+def get_outcomes(move_numbers, winners) -> np.ndarray:
+    movers = np.where(np.asarray(move_numbers) % 2 == 0, RED, BLUE)
+    return np.where(winners == EMPTY, 0, np.where(movers == winners, 1, -1)).astype(np.int8)
+
+# -----------------------------------------------------------------------------
+# Function: write_self_play
+# This function plays the indicated number of steps with the self-play batch
+# and writes a record for every move. The records are written before the
+# games are over; when a game is finished, the outcomes of its records are
+# set. The records of games that are unresolved or not finished at the end
+# keep an unknown outcome.
+# -----------------------------------------------------------------------------
+def write_self_play(writer, self_play: VectorSelfPlay, num_steps: int) -> None:
+    batch_size = self_play.batch_size
+    step_rows = np.zeros(num_steps, dtype=np.int64)  # First row of each step
+    first_steps = np.zeros(batch_size, dtype=np.int64)  # Step of the first move of each game
+    values = np.full(batch_size, NO_VALUE, dtype=np.float32)
+    outcomes = np.full(batch_size, UNKNOWN_OUTCOME, dtype=np.int8)
+    next_commit = writer.num_rows + COMMIT_INTERVAL
+
+    for step_number in range(num_steps):
+        masks = self_play.get_legal_masks()
+        moves = self_play.sample_moves(masks)
+        planes = get_position_planes(self_play.counts, self_play.owners, self_play.turns)
+        step_rows[step_number] = writer.add_records(planes, self_play.turns, masks, moves, values, outcomes)
+        self_play.step(moves)
+
+        # Set the outcomes of the records of the finished games at once.
+        finished = self_play.finished_numbers
+        finished = finished[~self_play.unresolved_games[finished]]
+        if len(finished) > 0:
+            lengths = step_number + 1 - first_steps[finished]
+            move_numbers = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            rows = step_rows[np.repeat(first_steps[finished], lengths) + move_numbers] + np.repeat(finished, lengths)
+            writer.set_outcomes(rows, get_outcomes(move_numbers, np.repeat(self_play.winners[finished], lengths)))
+        first_steps[self_play.finished_numbers] = step_number + 1
+
+        if writer.num_rows >= next_commit:
+            writer.commit()
+            next_commit = writer.num_rows + COMMIT_INTERVAL
+    writer.commit()
+
+# -----------------------------------------------------------------------------
+# Function: self_play_worker
+# This function is run by the processes of the worker pool. It plays random
+# self-play games and writes them to its own shard. It returns the number of
+# records and the number of finished games.
+# -----------------------------------------------------------------------------
+def self_play_worker(arguments) -> tuple[int, int]:
+    directory, dimension, batch_size, num_steps, seed = arguments
+    writer = DatasetWriter(directory, dimension, f"self-play-{seed}-{os.getpid()}-{time.time_ns()}")
+    self_play = VectorSelfPlay(dimension, batch_size, seed)
+    try:
+        write_self_play(writer, self_play, num_steps)
+    finally:
+        writer.close()
+    return self_play.moves, self_play.games
+
+# -----------------------------------------------------------------------------
+# Function: generate_self_play
+# This function plays random self-play games in the indicated number of
+# processes, each with a batch of games and its own shard. It returns the
+# number of records and the number of finished games.
+# -----------------------------------------------------------------------------
+def generate_self_play(directory, dimension, batch_size, num_steps, processes=1, seed=0) -> tuple[int, int]:
+    tasks = [(directory, dimension, batch_size, num_steps, seed + number) for number in range(processes)]
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(self_play_worker, tasks)
+    else:
+        results = [self_play_worker(task) for task in tasks]
+    return sum(result[0] for result in results), sum(result[1] for result in results)
+
+# -----------------------------------------------------------------------------
+# Function: write_game_file
+# This function replays a game saved by GameGui.save_game and writes a record
+# for every move. If a depth is indicated, the value of each record is the
+# score of the best move searched to that depth. It returns the number of
+# records.
+# -----------------------------------------------------------------------------
+def write_game_file(writer, file_path: str, depth: Optional[int] = None) -> int:
+    dimension, moves = read_game_file(file_path)
+    if dimension != writer.dimension:
+        raise ValueError(f"{file_path} is a game on a board of dimension {dimension}")
+    game = Game(dimension, DummyGui())
+    counts, owners, turns, masks, move_indices, values = [], [], [], [], [], []
+    for color, row, column in moves:
+        if color != game.turn or not game.check_move(row, column):
+            raise ValueError(f"Move {len(move_indices) + 1} ({color} {row},{column}) of {file_path} is not valid")
+        position_counts, position_owners, turn = get_position_arrays(game)
+        counts.append(position_counts)
+        owners.append(position_owners)
+        turns.append(turn)
+        masks.append((position_owners == EMPTY) | (position_owners == turn))
+        move_indices.append(row * dimension + column)
+        if depth is None:
+            values.append(NO_VALUE)
+        else:
+            values.append(max(analyze_position(game.to_bytes(), depth).values()))
+        game.do_move(row, column)
+
+    if len(moves) == 0:
+        return 0
+    winner = game.get_winner()
+    outcomes = (get_outcomes(np.arange(len(moves)), OWNER_CODES[winner]) if winner is not None
+                else np.full(len(moves), UNKNOWN_OUTCOME, dtype=np.int8))
+    turns = np.array(turns, dtype=np.int8)
+    writer.add_records(get_position_planes(np.array(counts), np.array(owners), turns), turns,
+                       np.array(masks).reshape(len(moves), -1), np.array(move_indices),
+                       np.array(values, dtype=np.float32), outcomes)
+    return len(moves)
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: GrowableArray
+# A .npy file with room for more rows than it contains, which is memory
+# mapped for writing. The header only counts the rows up to the last
+# commit, so the file can be loaded with numpy.load (also as a memory map)
+# while it is being written. When the file is full, it is made twice as
+# large and mapped again.
+# -----------------------------------------------------------------------------
+class GrowableArray:
+
+    # -------------------------------------------------------------------------
+    # GrowableArray constructor
+    # The constructor creates the file with room for the indicated number of
+    # rows of the indicated shape.
+    # -------------------------------------------------------------------------
+    def __init__(self, path, dtype, row_shape, capacity=DEFAULT_SHARD_ROWS):
+        self.path      = path
+        self.dtype     = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.row_size  = self.dtype.itemsize * int(np.prod(self.row_shape, dtype=np.int64))
+        self.num_rows  = 0
+        self.capacity  = 0
+        self.file      = open(path, "w+b")
+        self.data      = None
+        write_npy_header(self.file, self.dtype, (0,) + self.row_shape)
+        self.resize(max(capacity, 1))
+
+    # -------------------------------------------------------------------------
+    # GrowableArray method: resize
+    # This method makes room for the indicated number of rows and maps the
+    # file again.
+    # -------------------------------------------------------------------------
+    def resize(self, capacity) -> None:
+        if self.data is not None:
+            self.data.flush()
+            self.data = None
+        self.file.truncate(NPY_HEADER_SIZE + capacity * self.row_size)
+        self.capacity = capacity
+        self.data = np.memmap(self.file, dtype=self.dtype, mode="r+", offset=NPY_HEADER_SIZE,
+                              shape=(capacity,) + self.row_shape)
+
+    # -------------------------------------------------------------------------
+    # GrowableArray method: append
+    # This method writes the rows after the last row and returns the index of
+    # the first one.
+    # -------------------------------------------------------------------------
+    def append(self, rows) -> int:
+        start = self.num_rows
+        end = start + len(rows)
+        if end > self.capacity:
+            self.resize(max(end, 2 * self.capacity))
+        self.data[start:end] = rows
+        self.num_rows = end
+        return start
+
+    # -------------------------------------------------------------------------
+    # GrowableArray method: commit
+    # This method writes the rows to the file and then the header with the
+    # number of rows, so that readers never see rows that are not written.
+    # -------------------------------------------------------------------------
+    def commit(self) -> None:
+        self.data.flush()
+        write_npy_header(self.file, self.dtype, (self.num_rows,) + self.row_shape)
+        self.file.flush()
+
+    # -------------------------------------------------------------------------
+    # GrowableArray method: close
+    # This method commits the rows, removes the unused room and closes the
+    # file.
+    # -------------------------------------------------------------------------
+    def close(self) -> None:
+        self.commit()
+        self.data = None
+        self.file.truncate(NPY_HEADER_SIZE + self.num_rows * self.row_size)
+        self.file.close()
+
+# -----------------------------------------------------------------------------
+# Class: DatasetWriter
+# A writer of training records to a shard of a dataset. A dataset is a
+# directory with a subdirectory per shard, which has a .npy file per field
+# of the records (see RECORD_FIELDS). Each process writes its own shard, so
+# the writers never have to wait for each other.
+# -----------------------------------------------------------------------------
+class DatasetWriter:
+
+    # -------------------------------------------------------------------------
+    # DatasetWriter constructor
+    # The constructor creates a new shard with the indicated name in the
+    # dataset directory.
+    # -------------------------------------------------------------------------
+    def __init__(self, directory, dimension, shard_name=None, capacity=DEFAULT_SHARD_ROWS):
+        if shard_name is None:
+            shard_name = f"shard-{os.getpid()}-{time.time_ns()}"
+        self.dimension = dimension
+        self.path = os.path.join(directory, shard_name)
+        os.makedirs(self.path)
+        self.arrays = {name: GrowableArray(os.path.join(self.path, f"{name}.npy"), dtype,
+                                           get_record_shape(shape, dimension), capacity)
+                       for name, dtype, shape in RECORD_FIELDS}
+
+    # -------------------------------------------------------------------------
+    # DatasetWriter property: num_rows
+    # -------------------------------------------------------------------------
+    @property
+    def num_rows(self):
+        return self.arrays["moves"].num_rows
+
+    # -------------------------------------------------------------------------
+    # DatasetWriter method: add_records
+    # This method writes records for the positions and returns the index of
+    # the first record. Without values or outcomes, the records get no value
+    # and an unknown outcome.
+    # -------------------------------------------------------------------------
+    def add_records(self, planes, turns, masks, moves, values=None, outcomes=None) -> int:
+        num_records = len(moves)
+        if values is None:
+            values = np.full(num_records, NO_VALUE, dtype=np.float32)
+        if outcomes is None:
+            outcomes = np.full(num_records, UNKNOWN_OUTCOME, dtype=np.int8)
+        first_row = self.num_rows
+        fields = {"planes": planes, "turns": turns, "masks": masks, "moves": moves,
+                  "values": values, "outcomes": outcomes}
+        for name, rows in fields.items():
+            self.arrays[name].append(rows)
+        return first_row
+
+    # -------------------------------------------------------------------------
+    # DatasetWriter method: set_outcomes
+    # This method sets the outcomes of the records with the indicated indices.
+    # -------------------------------------------------------------------------
+    def set_outcomes(self, rows, outcomes) -> None:
+        self.arrays["outcomes"].data[rows] = outcomes
+
+    # -------------------------------------------------------------------------
+    # DatasetWriter method: commit
+    # This method makes the records that were written visible to readers.
+    # -------------------------------------------------------------------------
+    def commit(self) -> None:
+        for array in self.arrays.values():
+            array.commit()
+
+    # -------------------------------------------------------------------------
+    # DatasetWriter method: close
+    # -------------------------------------------------------------------------
+    def close(self) -> None:
+        for array in self.arrays.values():
+            array.close()
+
+# -----------------------------------------------------------------------------
+# Class: RecordBatch
+# A batch of training records, with an array per field (see RECORD_FIELDS).
+# -----------------------------------------------------------------------------
+class RecordBatch:
+
+    # -------------------------------------------------------------------------
+    # RecordBatch constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, planes, turns, masks, moves, values, outcomes):
+        self.planes   = planes
+        self.turns    = turns
+        self.masks    = masks
+        self.moves    = moves
+        self.values   = values
+        self.outcomes = outcomes
+
+    # -------------------------------------------------------------------------
+    # RecordBatch method: __len__
+    # -------------------------------------------------------------------------
+    def __len__(self):
+        return len(self.moves)
+
+# -----------------------------------------------------------------------------
+# Class: DatasetReader
+# A reader of the records of a dataset with a known outcome. The shards are
+# memory mapped, so only the records that are read are loaded. Only the
+# records that were committed when the reader was created are read.
+# -----------------------------------------------------------------------------
+class DatasetReader:
+
+    # -------------------------------------------------------------------------
+    # DatasetReader constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, directory, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.shards = []
+        self.rows = []  # Per shard, the indices of the records with a known outcome
+        self.dimension = None
+        for shard_name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, shard_name)
+            if not all(os.path.exists(os.path.join(path, f"{name}.npy")) for name, _, _ in RECORD_FIELDS):
+                continue
+            shard = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                     for name, _, _ in RECORD_FIELDS}
+            num_rows = min(len(array) for array in shard.values())
+            dimension = shard["planes"].shape[-1]
+            if self.dimension is None:
+                self.dimension = dimension
+            elif dimension != self.dimension:
+                raise ValueError(f"{path} is for a board of dimension {dimension}")
+            self.shards.append(shard)
+            self.rows.append(np.flatnonzero(shard["outcomes"][:num_rows] != UNKNOWN_OUTCOME))
+        self.offsets = np.cumsum([0] + [len(rows) for rows in self.rows])
+
+    # -------------------------------------------------------------------------
+    # DatasetReader method: __len__
+    # -------------------------------------------------------------------------
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    # -------------------------------------------------------------------------
+    # DatasetReader method: get_records
+    # This method returns the records with the indicated indices (0 to the
+    # number of records) as a batch. The records are read shard by shard in
+    # file order.
+    # -------------------------------------------------------------------------
+    def get_records(self, indices) -> RecordBatch:
+        indices = np.asarray(indices, dtype=np.int64)
+        shard_numbers = np.searchsorted(self.offsets, indices, side="right") - 1
+        fields = {}
+        for name, dtype, shape in RECORD_FIELDS:
+            fields[name] = np.empty((len(indices),) + get_record_shape(shape, self.dimension), dtype=dtype)
+        for shard_number in np.unique(shard_numbers):
+            positions = np.flatnonzero(shard_numbers == shard_number)
+            rows = self.rows[shard_number][indices[positions] - self.offsets[shard_number]]
+            order = np.argsort(rows)
+            for name, array in self.shards[shard_number].items():
+                fields[name][positions[order]] = array[rows[order]]
+        return RecordBatch(**fields)
+
+    # -------------------------------------------------------------------------
+    # DatasetReader method: sample_batch
+    # This method returns a batch of randomly chosen records.
+    # -------------------------------------------------------------------------
+    def sample_batch(self, batch_size) -> RecordBatch:
+        if len(self) == 0:
+            raise ValueError("The dataset has no records with a known outcome")
+        return self.get_records(self.rng.integers(0, len(self), batch_size))
+
+# =============================================================================
+# Main
+# =============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write and inspect training data.")
+    parser.add_argument("directory", help="directory of the dataset")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    self_play_parser = subparsers.add_parser("self-play", help="write random self-play games")
+    self_play_parser.add_argument("--dimension", type=int, default=5, help="dimension of the board")
+    self_play_parser.add_argument("--batch", type=int, default=1024, help="number of games per process")
+    self_play_parser.add_argument("--steps", type=int, default=1000, help="number of moves per game slot")
+    self_play_parser.add_argument("--processes", type=int, default=1, help="number of processes")
+    self_play_parser.add_argument("--seed", type=int, default=0, help="seed of the first process")
+
+    replay_parser = subparsers.add_parser("replay", help="write games saved by the GUI")
+    replay_parser.add_argument("files", nargs="+", help="saved game files")
+    replay_parser.add_argument("--depth", type=int, default=None, help="depth of the searches of the values")
+
+    subparsers.add_parser("info", help="show the number of records")
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    if args.command == "self-play":
+        start_time = time.perf_counter()
+        records, games = generate_self_play(args.directory, args.dimension, args.batch, args.steps,
+                                            args.processes, args.seed)
+        seconds = time.perf_counter() - start_time
+        print(f"records: {records}, games: {games}")
+        print(f"time: {seconds:.1f} s ({records / max(seconds, 1e-9):.0f} records/s)")
+    elif args.command == "replay":
+        writer = None
+        for file_path in args.files:
+            if writer is None:
+                writer = DatasetWriter(args.directory, read_game_file(file_path)[0])
+            print(f"{file_path}: {write_game_file(writer, file_path, args.depth)} records")
+        writer.close()
+    else:
+        reader = DatasetReader(args.directory)
+        print(f"shards: {len(reader.shards)}, records with an outcome: {len(reader)}, "
+              f"dimension: {reader.dimension}")
@@ -9,7 +9,172 @@
 # =============================================================================
 from typing import Protocol
 from typing import Optional
+from array import array
+from itertools import count
+import json
+import os
 import random
+import warnings
+import zlib
+
+# =============================================================================
+# Constants
+# =============================================================================
+POSITION_FORMAT_VERSION = 1  # Version of the format of Game.to_bytes
+MAX_DIMENSION = 15           # Largest dimension for which a square index fits in a byte
+
+# Types of the events in GameEvents. Each event has four values:
+EVENT_BEETLE_ADDED   = 0  # beetle id, color, row, column
+EVENT_BEETLE_MOVED   = 1  # source row, source column, destination row, destination column
+EVENT_BEETLE_COLOR   = 2  # beetle id, color, 0, 0
+EVENT_SQUARE_COLOR   = 3  # row, column, color, 0
+EVENT_TURN_CHANGED   = 4  # color, 0, 0, 0
+EVENT_WINNER         = 5  # color, 0, 0, 0
+EVENT_SIZE           = 5  # Number of values per event, including the type
+
+COLOR_CODES = {"red": 0, "blue": 1, "white": 2}  # Colors of the events
+COLOR_NAMES = ["red", "blue", "white"]
+
+CASCADE_JUMP_LIMIT = 100000  # Default maximum number of jumps of a single cascade
+CASCADE_CYCLE_JUMPS = 1000   # Number of jumps after which a cascade is checked for cycles
+MAX_CASCADE_STOPS = 100      # Maximum number of stopped cascades that are kept
+
+# Reasons why a cascade is stopped before all beetles have jumped.
+CASCADE_STOP_CYCLE      = "cycle"       # The state after a wave of jumps repeated
+CASCADE_STOP_JUMP_LIMIT = "jump limit"  # The jump limit was reached
+CASCADE_STOP_DEADLOCK   = "deadlock"    # None of the beetles can jump
+
+# Weights of the heuristic of Game.calculate_board_value. Tuned weights (see
+# game_tuning.py) are loaded from the weights file at startup, if it exists.
+DEFAULT_HEURISTIC_WEIGHTS = {
+    "vulnerability": 5,  # A vulnerable square loses this minus its capacity per critical neighbor
+    "edge": 2,           # Bonus of an edge square that is not vulnerable
+    "corner": 3,         # Bonus of a corner square that is not vulnerable
+    "instability": 2,    # Bonus of a critical square that is not vulnerable
+    "beetle": 1,         # Value of each beetle
+    "chain": 2,          # Value of each square of a chain of critical squares
+}
+HEURISTIC_WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "heuristic_weights.json")
+HEURISTIC_WEIGHTS_VARIABLE = "BEETLE_BATTLE_WEIGHTS"  # Environment variable with the path of another file
+HEURISTIC_WEIGHT_STEPS = 16  # Weights are rounded to multiples of 1/16
+HEURISTIC_VERSION = 1        # Version of the heuristic; increase it when the heuristic changes
+
+# =============================================================================
+# Global Variables
+# =============================================================================
+neighbor_indices = {}  # Indices of the neighboring squares per board dimension
+board_generations = count(1)  # Generations of the boards (see Board.snapshot)
+
+heuristic_weights = dict(DEFAULT_HEURISTIC_WEIGHTS)  # Weights in use (see set_heuristic_weights)
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: set_heuristic_weights
+# This function sets the weights of the heuristic. Weights that are not
+# indicated get their default value. The weights are rounded to multiples of
+# 1 / HEURISTIC_WEIGHT_STEPS, so that the sums of the square values are
+# exact and do not depend on the order in which the board evaluator adds
+# and removes them. The square values that the board evaluators already
+# computed are not changed, so the weights should be set before the games
+# are created (or their evaluators recalculated).
+# -----------------------------------------------------------------------------
+def set_heuristic_weights(weights: dict) -> None:
+    unknown_names = set(weights) - set(DEFAULT_HEURISTIC_WEIGHTS)
+    if len(unknown_names) > 0:
+        raise ValueError(f"Unknown heuristic weights: {', '.join(sorted(unknown_names))}")
+    heuristic_weights.clear()
+    heuristic_weights.update(DEFAULT_HEURISTIC_WEIGHTS)
+    for name, value in weights.items():
+        value = round(value * HEURISTIC_WEIGHT_STEPS) / HEURISTIC_WEIGHT_STEPS
+        heuristic_weights[name] = int(value) if value == int(value) else value
+
+# -----------------------------------------------------------------------------
+# Function: read_heuristic_weights
+# This function returns the weights of a JSON file with a value per weight
+# name, without setting them. It raises a ValueError if the file does not
+# contain such weights.
+# -----------------------------------------------------------------------------
+def read_heuristic_weights(path: str) -> dict:
+    with open(path, encoding="utf-8") as file:
+        try:
+            weights = json.load(file)
+        except json.JSONDecodeError as error:
+            raise ValueError(f"{path} is not a JSON file: {error}") from error
+    if not isinstance(weights, dict):
+        raise ValueError(f"The weights in {path} are not an object")
+    unknown_names = set(weights) - set(DEFAULT_HEURISTIC_WEIGHTS)
+    if len(unknown_names) > 0:
+        raise ValueError(f"Unknown heuristic weights in {path}: {', '.join(sorted(unknown_names))}")
+    for name, value in weights.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"The weight {name} in {path} is not a number")
+    return weights
+
+# -----------------------------------------------------------------------------
+# Function: load_heuristic_weights
+# This function sets the weights of the heuristic from a JSON file with a
+# value per weight name. Without a path, the file in the environment
+# variable or the default weights file is used. It returns whether the file
+# existed.
+# -----------------------------------------------------------------------------
+def load_heuristic_weights(path: Optional[str] = None) -> bool:
+    if path is None:
+        path = os.environ.get(HEURISTIC_WEIGHTS_VARIABLE, HEURISTIC_WEIGHTS_FILE)
+    if not os.path.exists(path):
+        return False
+    set_heuristic_weights(read_heuristic_weights(path))
+    return True
+
+# -----------------------------------------------------------------------------
+# Function: get_heuristic_fingerprint
+# This function returns a number that identifies the heuristic with the
+# weights in use, so that stored scores of another heuristic can be
+# recognized (see game_cache.PositionCache).
+# -----------------------------------------------------------------------------
+def get_heuristic_fingerprint() -> int:
+    weights = json.dumps(heuristic_weights, sort_keys=True).encode()
+    return HEURISTIC_VERSION << 32 | zlib.crc32(weights)
+
+# -----------------------------------------------------------------------------
+# Function: get_neighbor_indices
+# This function returns for each square index of a board with the indicated
+# dimension the tuple of indices of the neighboring squares. The order is the
+# same as that of Board.get_neighboring_locations.
+# -----------------------------------------------------------------------------
+def get_neighbor_indices(dimension: int) -> list[tuple[int, ...]]:
+    if dimension not in neighbor_indices:
+        board = Board(dimension)
+        neighbor_indices[dimension] = [tuple(location.row * dimension + location.column
+                                             for location in square.neighbors)
+                                       for square in board.squares]
+    return neighbor_indices[dimension]
+
+# -----------------------------------------------------------------------------
+# Function: encode_position
+# This function takes the dimension, the number of beetles and the color of
+# each square, the turn and optionally the square indices of the moves and
+# returns them as bytes in the format of Game.to_bytes.
+# -----------------------------------------------------------------------------
+def encode_position(dimension: int, counts: list[int], colors: list[Optional[str]], turn: str,
+                    move_indices: Optional[list[int]] = None) -> bytes:
+    flags = (1 if turn == "blue" else 0) | (0 if move_indices is None else 2)
+    data = bytearray([POSITION_FORMAT_VERSION, dimension, flags])
+
+    nibbles = [count | (8 if color == "blue" else 0) for count, color in zip(counts, colors)]
+    if len(nibbles) % 2 == 1:
+        nibbles.append(0)
+    data.extend(nibbles[index] << 4 | nibbles[index + 1] for index in range(0, len(nibbles), 2))
+
+    if move_indices is not None:
+        if dimension > MAX_DIMENSION:
+            raise ValueError("Dimension too large to include the moves")
+        data.extend(len(move_indices).to_bytes(2, "big"))
+        data.extend(move_indices)
+
+    return bytes(data)
 
 # =============================================================================
 # Protocol: GameGuiProtocol
@@ -113,6 +278,178 @@ class DummyGui(GameGuiProtocol):
                             color: str) -> None:
             pass
 
+# -----------------------------------------------------------------------------
+# Class: GameEvents
+# This class implements the GameGuiProtocol by storing the calls as events in
+# an array of integers instead of handling them. The events can be processed
+# at once, sent as bytes or replayed on a GUI later. Each event is stored as
+# its type followed by four values (see the EVENT constants).
+# -----------------------------------------------------------------------------
+class GameEvents(GameGuiProtocol):
+
+    # -------------------------------------------------------------------------
+    # GameEvents constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, data=None):
+        self.values = array("i") if data is None else array("i", data)
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: __len__
+    # This method returns the number of events.
+    # -------------------------------------------------------------------------
+    def __len__(self):
+        return len(self.values) // EVENT_SIZE
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: __iter__
+    # This method iterates over the events as tuples of the type and the four
+    # values of the event.
+    # -------------------------------------------------------------------------
+    def __iter__(self):
+        values = self.values
+        for index in range(0, len(values), EVENT_SIZE):
+            yield tuple(values[index:index + EVENT_SIZE])
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: add_event
+    # This method adds an event of the indicated type with its values.
+    # -------------------------------------------------------------------------
+    def add_event(self, event_type, value_1=0, value_2=0, value_3=0, value_4=0) -> None:
+        self.values.extend((event_type, value_1, value_2, value_3, value_4))
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: to_bytes
+    # This method returns the events as bytes.
+    # -------------------------------------------------------------------------
+    def to_bytes(self) -> bytes:
+        return self.values.tobytes()
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: from_bytes
+    # This method takes bytes created by to_bytes and returns the events.
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        events = cls()
+        events.values.frombytes(data)
+        return events
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: get_winner
+    # This method returns the color of the winner if the events contain one.
+    # -------------------------------------------------------------------------
+    def get_winner(self) -> Optional[str]:
+        for event in self:
+            if event[0] == EVENT_WINNER:
+                return COLOR_NAMES[event[1]]
+        return None
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: replay
+    # This method calls the methods of the GUI for the events in order, with
+    # the indicated sender.
+    # -------------------------------------------------------------------------
+    def replay(self, gui: GameGuiProtocol, sender) -> None:
+        for event_type, value_1, value_2, value_3, value_4 in self:
+            if event_type == EVENT_BEETLE_ADDED:
+                gui.new_beetle_added(sender, value_1, COLOR_NAMES[value_2], value_3, value_4)
+            elif event_type == EVENT_BEETLE_MOVED:
+                gui.beetle_moved(sender, value_1, value_2, value_3, value_4)
+            elif event_type == EVENT_BEETLE_COLOR:
+                gui.set_beetle_color(sender, value_1, COLOR_NAMES[value_2])
+            elif event_type == EVENT_SQUARE_COLOR:
+                gui.set_square_color(sender, value_1, value_2, COLOR_NAMES[value_3])
+            elif event_type == EVENT_TURN_CHANGED:
+                gui.turn_changed(sender, COLOR_NAMES[value_1])
+            elif event_type == EVENT_WINNER:
+                gui.announce_winner(sender, COLOR_NAMES[value_1])
+
+    # -------------------------------------------------------------------------
+    # -- GameGuiProtocol Methods --
+    # -------------------------------------------------------------------------
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: turn_changed
+    # -------------------------------------------------------------------------
+    def turn_changed(self, sender, color: str) -> None:
+        self.add_event(EVENT_TURN_CHANGED, COLOR_CODES[color])
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: beetle_moved
+    # -------------------------------------------------------------------------
+    def beetle_moved(self, sender,
+                     source_row: int, source_column: int,
+                     destination_row: int, destination_column: int) -> None:
+        self.add_event(EVENT_BEETLE_MOVED, source_row, source_column, destination_row, destination_column)
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: new_beetle_added
+    # -------------------------------------------------------------------------
+    def new_beetle_added(self, sender,
+                         beetle_id: int, color: str, row: int, column: int) -> None:
+        self.add_event(EVENT_BEETLE_ADDED, beetle_id, COLOR_CODES[color], row, column)
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: set_square_color
+    # -------------------------------------------------------------------------
+    def set_square_color(self, sender,
+                         row: int, column: int, color: str) -> None:
+        self.add_event(EVENT_SQUARE_COLOR, row, column, COLOR_CODES[color])
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: set_beetle_color
+    # -------------------------------------------------------------------------
+    def set_beetle_color(self, sender,
+                         beetle_id: int, color: str) -> None:
+        self.add_event(EVENT_BEETLE_COLOR, beetle_id, COLOR_CODES[color])
+
+    # -------------------------------------------------------------------------
+    # GameEvents method: announce_winner
+    # -------------------------------------------------------------------------
+    def announce_winner(self, sender,
+                        color: str) -> None:
+        self.add_event(EVENT_WINNER, COLOR_CODES[color])
+
+# -----------------------------------------------------------------------------
+# Class: CascadeStatistics
+# The cascade statistics count the cascades of a game and of its copies: the
+# number of cascades and jumps, the longest cascade and the number of
+# cascades that were stopped for each reason. For the last stopped cascades,
+# the reason, the number of jumps, the dimension and the moves of the game,
+# as (row, column) tuples, are kept so that the positions can be found and
+# analyzed later. A game only keeps statistics if it is given them.
+# -----------------------------------------------------------------------------
+class CascadeStatistics:
+
+    # -------------------------------------------------------------------------
+    # CascadeStatistics constructor
+    # -------------------------------------------------------------------------
+    def __init__(self):
+        self.cascades = 0
+        self.jumps = 0
+        self.longest = 0
+        self.stops = {CASCADE_STOP_CYCLE: 0, CASCADE_STOP_JUMP_LIMIT: 0, CASCADE_STOP_DEADLOCK: 0}
+        self.stopped_cascades = []
+
+    # -------------------------------------------------------------------------
+    # CascadeStatistics method: record
+    # This method takes the number of jumps of a cascade and the reason why
+    # it was stopped, which is None if all beetles have jumped, and updates
+    # the statistics.
+    # -------------------------------------------------------------------------
+    def record(self, jumps: int, reason: Optional[str] = None,
+               dimension: int = 0, moves: Optional[list[tuple[int, int]]] = None) -> None:
+        self.cascades += 1
+        self.jumps += jumps
+        if jumps > self.longest:
+            self.longest = jumps
+        if reason is None:
+            return
+        self.stops[reason] += 1
+        self.stopped_cascades.append((reason, jumps, dimension, moves))
+        if len(self.stopped_cascades) > MAX_CASCADE_STOPS:
+            del self.stopped_cascades[0]
+
 # -----------------------------------------------------------------------------
 # Class: Location
 # A location indicates the row and column on a grid of squares.
@@ -211,10 +548,11 @@ class Square:
     # -------------------------------------------------------------------------
     # Square constructor
     # -------------------------------------------------------------------------
-    def __init__(self, location):
+    def __init__(self, location, generation=0):
         self.location = location
         self.beetles = []
         self.neighbors = []
+        self.generation = generation
 
     @property
     def color(self):
@@ -250,6 +588,19 @@ class Square:
         square_copy.beetles = [beetle.deep_copy() for beetle in self.beetles]
         return square_copy
 
+    # -------------------------------------------------------------------------
+    # Square method: copy_for_writing
+    # This method returns a copy of the square that can be changed without
+    # changing the original square, for the board of the indicated generation
+    # (see Board.get_writable_square). The location and the neighbors are
+    # never changed, so they are shared with the original square.
+    # -------------------------------------------------------------------------
+    def copy_for_writing(self, generation):
+        square_copy = Square(self.location, generation)
+        square_copy.neighbors = self.neighbors
+        square_copy.beetles = [beetle.deep_copy() for beetle in self.beetles]
+        return square_copy
+
     # -------------------------------------------------------------------------
     # Square method: add_beetle
     # This method takes a beetle and adds it to the square. The color of the
@@ -292,9 +643,20 @@ class Board:
     def __init__(self, dimension):
         self.dimension = dimension
         self.num_beetles = 0
-        self.squares = [Square(Location(row, column)) for row in range(dimension) for column in range(dimension)]
+        self.generation = next(board_generations)
+        self.is_shared = False
+        self.squares = [Square(Location(row, column), self.generation)
+                        for row in range(dimension) for column in range(dimension)]
         for square in self.squares:
             square.neighbors = self.get_neighboring_locations(square.location)
+        self.evaluator = BoardEvaluator(dimension)
+        self.chain_tracker = ChainTracker(dimension)
+
+        # The indices of the empty squares and of the squares of each color.
+        # Together they are the possible moves of a color.
+        self.empty_squares = set(range(dimension * dimension))
+        self.colored_squares = {"red": set(), "blue": set()}
+        self.square_colors = [None] * (dimension * dimension)
 
     # -------------------------------------------------------------------------
     # Board method: deep_copy
@@ -303,22 +665,96 @@ class Board:
     def deep_copy(self):
         board_copy = Board(self.dimension)
         board_copy.squares = [square.deep_copy() for square in self.squares]
+        for square in board_copy.squares:
+            square.generation = board_copy.generation
+        board_copy.num_beetles = self.num_beetles
+        board_copy.evaluator = self.evaluator.deep_copy(self)
+        board_copy.chain_tracker = self.chain_tracker.deep_copy(self)
+        self.copy_possible_moves(board_copy)
+        return board_copy
+
+    # -------------------------------------------------------------------------
+    # Board method: copy_possible_moves
+    # This method copies the sets of empty and colored squares to the copy of
+    # the board.
+    # -------------------------------------------------------------------------
+    def copy_possible_moves(self, board_copy) -> None:
+        board_copy.empty_squares = set(self.empty_squares)
+        board_copy.colored_squares = {color: set(indices) for color, indices in self.colored_squares.items()}
+        board_copy.square_colors = self.square_colors[:]
+
+    # -------------------------------------------------------------------------
+    # Board method: snapshot
+    # This method returns a copy of the board that shares the squares, the
+    # sets of possible moves and the arrays of the evaluator and the chain
+    # tracker with this board. Nothing is copied here: both boards get a new
+    # generation, so that the squares of the older generations are shared,
+    # and are marked as shared. Before either board changes a square, the
+    # square is copied by get_writable_square, and before it changes a list
+    # or set, it is copied by unshare. That way a snapshot holds the squares
+    # that changed after it was made and, once it changes, its own copy of
+    # the lists and sets. These lists and sets have an entry per square, so
+    # a snapshot that is changed still takes memory proportional to the
+    # board size, but they are copied at once instead of square by square.
+    # -------------------------------------------------------------------------
+    def snapshot(self):
+        board_copy = Board.__new__(Board)
+        board_copy.dimension = self.dimension
         board_copy.num_beetles = self.num_beetles
+        board_copy.generation = next(board_generations)
+        board_copy.is_shared = True
+        board_copy.squares = self.squares
+        board_copy.evaluator = self.evaluator.snapshot(self)
+        board_copy.chain_tracker = self.chain_tracker.snapshot(self)
+        board_copy.empty_squares = self.empty_squares
+        board_copy.colored_squares = self.colored_squares
+        board_copy.square_colors = self.square_colors
+        self.generation = next(board_generations)
+        self.is_shared = True
         return board_copy
 
+    # -------------------------------------------------------------------------
+    # Board method: unshare
+    # This method copies the list of squares and the sets of possible moves
+    # that this board shares with a snapshot, so that they can be changed.
+    # -------------------------------------------------------------------------
+    def unshare(self) -> None:
+        self.squares = self.squares[:]
+        self.empty_squares = set(self.empty_squares)
+        self.colored_squares = {color: set(indices) for color, indices in self.colored_squares.items()}
+        self.square_colors = self.square_colors[:]
+        self.is_shared = False
+
     # -------------------------------------------------------------------------
     # Board method: get_square_by_location
     # This method takes a location and returns the square at that location.
     # -------------------------------------------------------------------------
     def get_square_by_location(self, row, column) -> Optional[Square]:
         return self.squares[row * self.dimension + column]
+
+    # -------------------------------------------------------------------------
+    # Board method: get_writable_square
+    # This method returns the square at the location so that it can be
+    # changed. A square of another generation may be shared with a snapshot,
+    # so it is copied first. Every change of the board starts here, so this
+    # is also where a shared board copies its lists and sets.
+    # -------------------------------------------------------------------------
+    def get_writable_square(self, row, column) -> Square:
+        index = row * self.dimension + column
+        square = self.squares[index]
+        if square.generation != self.generation:
+            if self.is_shared:
+                self.unshare()
+            square = square.copy_for_writing(self.generation)
+            self.squares[index] = square
+        return square
     
     # -------------------------------------------------------------------------
     # Board method: get_empty_squares
     # This method returns the list of squares that have no beetles.
     # -------------------------------------------------------------------------
     def get_empty_squares(self) -> list[Square]:
-        return [square for square in self.squares if len(square.beetles) == 0]
+        return [self.squares[index] for index in sorted(self.empty_squares)]
 
     # -------------------------------------------------------------------------
     # Board method: get_squares_by_color
@@ -326,7 +762,37 @@ class Board:
     # beetle of that color.
     # -------------------------------------------------------------------------
     def get_squares_by_color(self, color) -> list[Square]:
-        return [square for square in self.squares if square.color == color]
+        if color == "white":
+            return self.get_empty_squares()
+        return [self.squares[index] for index in sorted(self.colored_squares[color])]
+
+    # -------------------------------------------------------------------------
+    # Board method: count_squares_by_color
+    # This method takes a color and returns the number of squares that have a
+    # beetle of that color.
+    # -------------------------------------------------------------------------
+    def count_squares_by_color(self, color) -> int:
+        return len(self.colored_squares[color])
+
+    # -------------------------------------------------------------------------
+    # Board method: is_possible_move
+    # This method returns whether the indicated color can place a beetle on
+    # the square at the location, i.e. the square is empty or has beetles of
+    # that color.
+    # -------------------------------------------------------------------------
+    def is_possible_move(self, row, column, color) -> bool:
+        if row < 0 or row >= self.dimension or column < 0 or column >= self.dimension:
+            return False
+        index = row * self.dimension + column
+        return index in self.empty_squares or index in self.colored_squares[color]
+
+    # -------------------------------------------------------------------------
+    # Board method: get_possible_move_indices
+    # This method returns the set of indices of the squares on which the
+    # indicated color can place a beetle.
+    # -------------------------------------------------------------------------
+    def get_possible_move_indices(self, color) -> set[int]:
+        return self.empty_squares | self.colored_squares[color]
         
     # -------------------------------------------------------------------------
     # Board method: place_new_beetle
@@ -334,11 +800,40 @@ class Board:
     # color at that location.
     # -------------------------------------------------------------------------
     def place_new_beetle(self, color, location) -> Beetle:
-        square = self.get_square_by_location(location.row, location.column)
+        square = self.get_writable_square(location.row, location.column)
         beetle = Beetle(color, location, self.num_beetles )
         square.beetles.append(beetle)
+        self.square_changed(square)
         self.num_beetles += 1
         return beetle
+
+    # -------------------------------------------------------------------------
+    # Board method: square_changed
+    # This method is called when the number or color of the beetles on the
+    # square changed. It informs the evaluator and the chain tracker and
+    # moves the square to the set of empty squares or of its new color.
+    # -------------------------------------------------------------------------
+    def square_changed(self, square) -> None:
+        self.evaluator.mark_changed(square)
+        self.chain_tracker.mark_changed(square)
+
+        index = square.location.row * self.dimension + square.location.column
+        color = None if len(square.beetles) == 0 else square.beetles[0].color
+        old_color = self.square_colors[index]
+        if color == old_color:
+            return
+
+        if old_color is None:
+            self.empty_squares.discard(index)
+        else:
+            self.colored_squares[old_color].discard(index)
+
+        if color is None:
+            self.empty_squares.add(index)
+        else:
+            self.colored_squares[color].add(index)
+
+        self.square_colors[index] = color
     
     # -------------------------------------------------------------------------
     # Board method: get_neighboring_locations
@@ -370,6 +865,349 @@ class Board:
 
         return neighboring_locations
 
+# -----------------------------------------------------------------------------
+# Class: BoardEvaluator
+# The board evaluator keeps the terms of the heuristic board value as running
+# totals per color: the number of beetles and the sum of the square values.
+# The value of a square depends on the square and its neighbors, so when a
+# square changes, that square and its neighbors are marked as changed. Only
+# the marked squares are evaluated again when the totals are needed.
+# The board is passed to the methods that need it, so that the evaluator and
+# the board do not refer to each other and copies are freed right away.
+# -----------------------------------------------------------------------------
+class BoardEvaluator:
+
+    # -------------------------------------------------------------------------
+    # BoardEvaluator constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, dimension):
+        self.dimension = dimension
+        num_squares = dimension * dimension
+        self.square_colors = [None] * num_squares
+        self.square_values = [0] * num_squares
+        self.square_beetles = [0] * num_squares
+        self.values = {"red": 0, "blue": 0}
+        self.beetles = {"red": 0, "blue": 0}
+        self.changed_squares = set()
+        self.is_shared = False
+
+    # -------------------------------------------------------------------------
+    # BoardEvaluator method: deep_copy
+    # This method returns a copy of the evaluator of the indicated board.
+    # The evaluator is updated first, so that the copies only need to
+    # evaluate the squares that change after the copy.
+    # -------------------------------------------------------------------------
+    def deep_copy(self, board):
+        self.update(board)
+        evaluator_copy = BoardEvaluator.__new__(BoardEvaluator)
+        evaluator_copy.dimension = self.dimension
+        evaluator_copy.square_colors = self.square_colors[:]
+        evaluator_copy.square_values = self.square_values[:]
+        evaluator_copy.square_beetles = self.square_beetles[:]
+        evaluator_copy.values = dict(self.values)
+        evaluator_copy.beetles = dict(self.beetles)
+        evaluator_copy.changed_squares = set(self.changed_squares)
+        evaluator_copy.is_shared = False
+        return evaluator_copy
+
+    # -------------------------------------------------------------------------
+    # BoardEvaluator method: snapshot
+    # This method returns a copy of the evaluator of the indicated board that
+    # shares the lists of square values with this evaluator (see
+    # Board.snapshot). The lists are copied by the first update that changes
+    # them.
+    # -------------------------------------------------------------------------
+    def snapshot(self, board):
+        self.update(board)
+        evaluator_copy = BoardEvaluator.__new__(BoardEvaluator)
+        evaluator_copy.dimension = self.dimension
+        evaluator_copy.square_colors = self.square_colors
+        evaluator_copy.square_values = self.square_values
+        evaluator_copy.square_beetles = self.square_beetles
+        evaluator_copy.values = dict(self.values)
+        evaluator_copy.beetles = dict(self.beetles)
+        evaluator_copy.changed_squares = set()
+        evaluator_copy.is_shared = True
+        self.is_shared = True
+        return evaluator_copy
+
+    # -------------------------------------------------------------------------
+    # BoardEvaluator method: recalculate
+    # This method marks all squares as changed. This is needed when the
+    # squares of the board were changed without the evaluator.
+    # -------------------------------------------------------------------------
+    def recalculate(self) -> None:
+        self.changed_squares = set(range(self.dimension * self.dimension))
+
+    # -------------------------------------------------------------------------
+    # BoardEvaluator method: mark_changed
+    # This method is called when the number or color of the beetles on the
+    # square changed. The square and its neighbors need to be evaluated again.
+    # -------------------------------------------------------------------------
+    def mark_changed(self, square) -> None:
+        dimension = self.dimension
+        self.changed_squares.add(square.location.row * dimension + square.location.column)
+        for neighbor_location in square.neighbors:
+            self.changed_squares.add(neighbor_location.row * dimension + neighbor_location.column)
+
+    # -------------------------------------------------------------------------
+    # BoardEvaluator method: update
+    # This method evaluates the changed squares of the board again and updates
+    # the totals.
+    # -------------------------------------------------------------------------
+    def update(self, board) -> None:
+        if len(self.changed_squares) == 0:
+            return
+
+        if self.is_shared:
+            self.square_colors = self.square_colors[:]
+            self.square_values = self.square_values[:]
+            self.square_beetles = self.square_beetles[:]
+            self.is_shared = False
+
+        for index in self.changed_squares:
+
+            # Remove the old value of the square from the totals.
+            color = self.square_colors[index]
+            if color is not None:
+                self.values[color] -= self.square_values[index]
+                self.beetles[color] -= self.square_beetles[index]
+
+            # Add the new value of the square to the totals.
+            square = board.squares[index]
+            if len(square.beetles) == 0:
+                self.square_colors[index] = None
+                continue
+            color = square.color
+            square_value = self.get_square_value(board, square)
+            self.square_colors[index] = color
+            self.square_values[index] = square_value
+            self.square_beetles[index] = len(square.beetles)
+            self.values[color] += square_value
+            self.beetles[color] += len(square.beetles)
+
+        self.changed_squares.clear()
+
+    # -------------------------------------------------------------------------
+    # BoardEvaluator method: get_square_value
+    # This method returns the value of the square for the player that owns it.
+    # A square that is next to a critical square of the opponent is vulnerable
+    # and gets a penalty. Otherwise, edges, corners and critical squares get
+    # a bonus.
+    # -------------------------------------------------------------------------
+    def get_square_value(self, board, square) -> int:
+        weights = heuristic_weights
+        square_value = 0
+        flag_not_vulnerable = True
+        color = square.color
+
+        # Loop through all neighbors of the square.
+        for neighbor_location in square.neighbors:
+            neighbor = board.get_square_by_location(neighbor_location.row, neighbor_location.column)
+
+            # Check if the neighbor is owned by the opponent and if the
+            # neighbor is critical.
+            if neighbor.color != color and neighbor.is_critical:
+                square_value -= weights["vulnerability"] - square.capacity
+                flag_not_vulnerable = False
+
+        if flag_not_vulnerable:
+            #The edge Heuristic
+            if square.capacity == 3:
+                square_value += weights["edge"]
+            #The corner Heuristic
+            elif square.capacity == 2:
+                square_value += weights["corner"]
+            #The unstability Heuristic
+            if square.is_critical:
+                square_value += weights["instability"]
+
+        return square_value
+
+    # -------------------------------------------------------------------------
+    # BoardEvaluator method: get_value
+    # This method returns the sum of the square values of the player.
+    # -------------------------------------------------------------------------
+    def get_value(self, board, color) -> int:
+        self.update(board)
+        return self.values[color]
+
+    # -------------------------------------------------------------------------
+    # BoardEvaluator method: get_beetles
+    # This method returns the number of beetles of the player.
+    # -------------------------------------------------------------------------
+    def get_beetles(self, board, color) -> int:
+        self.update(board)
+        return self.beetles[color]
+
+# -----------------------------------------------------------------------------
+# Class: ChainTracker
+# The chain tracker keeps the chains of critical squares per color in a
+# disjoint-set (union-find) structure. Each chain has a root square, which
+# holds the list of squares in the chain. A square that becomes critical is
+# joined with the critical neighbors of the same color. When a square stops
+# being critical, its chain is split up by adding the remaining squares
+# again. Like the evaluator, the changed squares are only processed when the
+# chains are needed.
+# -----------------------------------------------------------------------------
+class ChainTracker:
+
+    # -------------------------------------------------------------------------
+    # ChainTracker constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, dimension):
+        self.dimension = dimension
+        num_squares = dimension * dimension
+        self.colors = [None] * num_squares
+        self.parents = list(range(num_squares))
+        self.members = {}
+        self.changed_squares = set()
+        self.is_shared = False
+
+    # -------------------------------------------------------------------------
+    # ChainTracker method: deep_copy
+    # This method returns a copy of the chain tracker of the indicated board.
+    # -------------------------------------------------------------------------
+    def deep_copy(self, board):
+        self.update(board)
+        tracker_copy = ChainTracker.__new__(ChainTracker)
+        tracker_copy.dimension = self.dimension
+        tracker_copy.colors = self.colors[:]
+        tracker_copy.parents = self.parents[:]
+        tracker_copy.members = {root: members[:] for root, members in self.members.items()}
+        tracker_copy.changed_squares = set()
+        tracker_copy.is_shared = False
+        return tracker_copy
+
+    # -------------------------------------------------------------------------
+    # ChainTracker method: snapshot
+    # This method returns a copy of the chain tracker of the indicated board
+    # that shares the chains with this chain tracker (see Board.snapshot).
+    # The chains are copied by the first update that changes them.
+    # -------------------------------------------------------------------------
+    def snapshot(self, board):
+        self.update(board)
+        tracker_copy = ChainTracker.__new__(ChainTracker)
+        tracker_copy.dimension = self.dimension
+        tracker_copy.colors = self.colors
+        tracker_copy.parents = self.parents
+        tracker_copy.members = self.members
+        tracker_copy.changed_squares = set()
+        tracker_copy.is_shared = True
+        self.is_shared = True
+        return tracker_copy
+
+    # -------------------------------------------------------------------------
+    # ChainTracker method: recalculate
+    # This method marks all squares as changed. This is needed when the
+    # squares of the board were changed without the chain tracker.
+    # -------------------------------------------------------------------------
+    def recalculate(self) -> None:
+        self.changed_squares = set(range(self.dimension * self.dimension))
+
+    # -------------------------------------------------------------------------
+    # ChainTracker method: mark_changed
+    # This method is called when the number or color of the beetles on the
+    # square changed.
+    # -------------------------------------------------------------------------
+    def mark_changed(self, square) -> None:
+        self.changed_squares.add(square.location.row * self.dimension + square.location.column)
+
+    # -------------------------------------------------------------------------
+    # ChainTracker method: update
+    # This method processes the changed squares of the board. First the
+    # squares that are no longer critical in their color are removed from
+    # their chain and then the new critical squares are added.
+    # -------------------------------------------------------------------------
+    def update(self, board) -> None:
+        if len(self.changed_squares) == 0:
+            return
+
+        if self.is_shared:
+            self.colors = self.colors[:]
+            self.parents = self.parents[:]
+            self.members = {root: members[:] for root, members in self.members.items()}
+            self.is_shared = False
+
+        new_critical_squares = []
+        for index in self.changed_squares:
+            square = board.squares[index]
+            color = square.color if len(square.beetles) > 0 and square.is_critical else None
+            if color == self.colors[index]:
+                continue
+            if self.colors[index] is not None:
+                self.remove(board, index)
+            if color is not None:
+                new_critical_squares.append((index, color))
+
+        for index, color in new_critical_squares:
+            self.add(board, index, color)
+
+        self.changed_squares.clear()
+
+    # -------------------------------------------------------------------------
+    # ChainTracker method: find
+    # This method returns the root of the chain of the square.
+    # -------------------------------------------------------------------------
+    def find(self, index) -> int:
+        parents = self.parents
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    # -------------------------------------------------------------------------
+    # ChainTracker method: union
+    # This method joins the chains of the two squares. The smaller chain is
+    # added to the larger one.
+    # -------------------------------------------------------------------------
+    def union(self, index, other_index) -> None:
+        root = self.find(index)
+        other_root = self.find(other_index)
+        if root == other_root:
+            return
+        if len(self.members[root]) < len(self.members[other_root]):
+            root, other_root = other_root, root
+        self.parents[other_root] = root
+        self.members[root].extend(self.members.pop(other_root))
+
+    # -------------------------------------------------------------------------
+    # ChainTracker method: add
+    # This method adds a critical square of the indicated color and joins it
+    # with the chains of its critical neighbors of the same color.
+    # -------------------------------------------------------------------------
+    def add(self, board, index, color) -> None:
+        self.colors[index] = color
+        self.parents[index] = index
+        self.members[index] = [index]
+        for neighbor_location in board.squares[index].neighbors:
+            neighbor_index = neighbor_location.row * self.dimension + neighbor_location.column
+            if self.colors[neighbor_index] == color:
+                self.union(index, neighbor_index)
+
+    # -------------------------------------------------------------------------
+    # ChainTracker method: remove
+    # This method removes a square from its chain. The other squares of the
+    # chain are added again, which splits the chain if needed.
+    # -------------------------------------------------------------------------
+    def remove(self, board, index) -> None:
+        color = self.colors[index]
+        members = self.members.pop(self.find(index))
+        for member in members:
+            self.colors[member] = None
+            self.parents[member] = member
+        for member in members:
+            if member != index:
+                self.add(board, member, color)
+
+    # -------------------------------------------------------------------------
+    # ChainTracker method: get_lengths
+    # This method returns the lengths of the chains of the indicated color.
+    # -------------------------------------------------------------------------
+    def get_lengths(self, board, color) -> list[int]:
+        self.update(board)
+        return [len(members) for root, members in self.members.items() if self.colors[root] == color]
+
 # -----------------------------------------------------------------------------
 # Class: Game
 # The game has a board and a list of beetles that are about to jump.
@@ -386,6 +1224,9 @@ class Game:
         self.beetles_to_jump = []
         self.turn = "red"
         self.moves = []
+        self.cascade_jump_limit = CASCADE_JUMP_LIMIT
+        self.cascade_statistics = None  # Statistics of the cascades, if they are kept (see CascadeStatistics)
+        self.events = None  # Values of the events that are recorded instead of calling the GUI (see do_move_events)
         self.gui.turn_changed(self, self.turn)
 
     # -------------------------------------------------------------------------
@@ -398,7 +1239,160 @@ class Game:
         game_copy.board = self.board.deep_copy()
         game_copy.turn = self.turn
         game_copy.moves = [move.deep_copy() for move in self.moves]
+        game_copy.cascade_jump_limit = self.cascade_jump_limit
+        game_copy.cascade_statistics = self.cascade_statistics
+        return game_copy
+
+    # -------------------------------------------------------------------------
+    # Game method: snapshot
+    # This method returns a copy of the game for which only the squares that
+    # change are copied (see Board.snapshot). Like deep_copy, this is done
+    # when there are no more beetles to jump and a dummy GUI is used. The
+    # moves themselves are never changed, so they are shared, but the list of
+    # moves is copied since the copy adds its own moves to it.
+    # -------------------------------------------------------------------------
+    def snapshot(self):
+        game_copy = Game.__new__(Game)
+        game_copy.gui = DummyGui()
+        game_copy.board = self.board.snapshot()
+        game_copy.beetles_to_jump = []
+        game_copy.turn = self.turn
+        game_copy.moves = self.moves[:]
+        game_copy.cascade_jump_limit = self.cascade_jump_limit
+        game_copy.cascade_statistics = self.cascade_statistics
+        game_copy.events = None
         return game_copy
+
+    # -------------------------------------------------------------------------
+    # Game method: to_simulation
+    # This method returns a simulation game with the position and moves of
+    # this game. This is done when there are no more beetles to jump.
+    # -------------------------------------------------------------------------
+    def to_simulation(self):
+        dimension = self.board.dimension
+        simulation = SimulationGame(dimension)
+        simulation.counts = [len(square.beetles) for square in self.board.squares]
+        simulation.colors = [None if square.is_empty else square.color for square in self.board.squares]
+        simulation.num_squares = {color: self.board.count_squares_by_color(color) for color in ("red", "blue")}
+        simulation.num_beetles = self.board.num_beetles
+        simulation.turn = self.turn
+        simulation.moves = [move.location.row * dimension + move.location.column for move in self.moves]
+        simulation.cascade_jump_limit = self.cascade_jump_limit
+        simulation.cascade_statistics = self.cascade_statistics
+        return simulation
+
+    # -------------------------------------------------------------------------
+    # Game method: to_bytes
+    # This method returns the position of the game as bytes. The format is:
+    #   version, dimension, flags (bit 0: blue to move, bit 1: moves included)
+    #   one nibble per square: number of beetles (bits 0-2), blue (bit 3)
+    #   optionally: number of moves (2 bytes) and one square index per move
+    # The colors of the moves are not stored since red and blue alternate.
+    # -------------------------------------------------------------------------
+    def to_bytes(self, include_moves=False) -> bytes:
+        dimension = self.board.dimension
+        move_indices = None
+        if include_moves:
+            move_indices = [move.location.row * dimension + move.location.column for move in self.moves]
+        return encode_position(dimension,
+                               [len(square.beetles) for square in self.board.squares],
+                               [square.color for square in self.board.squares],
+                               self.turn, move_indices)
+
+    # -------------------------------------------------------------------------
+    # Game method: from_bytes
+    # This method takes bytes created by to_bytes and returns the game with
+    # that position and a dummy GUI. If the moves were not included, the game
+    # has no moves.
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        if len(data) < 3 or data[0] != POSITION_FORMAT_VERSION:
+            raise ValueError("Unknown position format")
+
+        dimension = data[1]
+        flags = data[2]
+        num_squares = dimension * dimension
+        num_position_bytes = (num_squares + 1) // 2
+
+        counts = []
+        colors = []
+        for byte in data[3:3 + num_position_bytes]:
+            for nibble in (byte >> 4, byte & 15):
+                counts.append(nibble & 7)
+                colors.append("blue" if nibble & 8 else "red")
+
+        game = cls(dimension, DummyGui())
+        game.set_position(counts[:num_squares], colors[:num_squares], "blue" if flags & 1 else "red")
+
+        if flags & 2:
+            offset = 3 + num_position_bytes
+            num_moves = int.from_bytes(data[offset:offset + 2], "big")
+            for move_number, index in enumerate(data[offset + 2:offset + 2 + num_moves]):
+                color = "red" if move_number % 2 == 0 else "blue"
+                game.moves.append(Move(color, Location(index // dimension, index % dimension)))
+
+        return game
+
+    # -------------------------------------------------------------------------
+    # Game method: to_position_string
+    # This method returns the position of the game as a line of text. The
+    # rows are separated by slashes and each square is either "." when it is
+    # empty or the number of beetles followed by "r" or "b". The turn follows
+    # after a space, e.g. "1r../.2b./... r".
+    # -------------------------------------------------------------------------
+    def to_position_string(self) -> str:
+        rows = []
+        for row in range(self.board.dimension):
+            row_text = ""
+            for column in range(self.board.dimension):
+                square = self.board.get_square_by_location(row, column)
+                row_text += "." if square.is_empty else f"{len(square.beetles)}{square.color[0]}"
+            rows.append(row_text)
+        return "/".join(rows) + " " + self.turn[0]
+
+    # -------------------------------------------------------------------------
+    # Game method: from_position_string
+    # This method takes a string created by to_position_string and returns
+    # the game with that position and a dummy GUI.
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_position_string(cls, text: str):
+        board_text, turn_text = text.split()
+        color_names = {"r": "red", "b": "blue"}
+
+        counts = []
+        colors = []
+        rows = board_text.split("/")
+        for row_text in rows:
+            index = 0
+            while index < len(row_text):
+                if row_text[index] == ".":
+                    counts.append(0)
+                    colors.append("red")
+                    index += 1
+                else:
+                    counts.append(int(row_text[index]))
+                    colors.append(color_names[row_text[index + 1]])
+                    index += 2
+
+        if len(counts) != len(rows) * len(rows):
+            raise ValueError("Invalid position string: " + text)
+
+        game = cls(len(rows), DummyGui())
+        game.set_position(counts, colors, color_names[turn_text])
+        return game
+
+    # -------------------------------------------------------------------------
+    # Game method: set_position
+    # This method takes the number of beetles and the color for each square
+    # and the turn and places the beetles on the empty board of the game.
+    # -------------------------------------------------------------------------
+    def set_position(self, counts, colors, turn) -> None:
+        for square, count, color in zip(self.board.squares, counts, colors):
+            for _ in range(count):
+                self.board.place_new_beetle(color, square.location)
+        self.turn = turn
     
     # -------------------------------------------------------------------------
     # Game method: get_possible_moves
@@ -415,16 +1409,13 @@ class Game:
     # -------------------------------------------------------------------------
     def check_move(self, row, column) -> bool:
 
-        location = Location(row, column)
-
         # Check if the game is over.
         if self.get_winner() is not None:
             # No move is allowed if the game is over.
             return False
         
         # Check if the move is valid.
-        possible_moves = self.get_possible_moves()
-        return location in possible_moves
+        return self.board.is_possible_move(row, column, self.turn)
     
     # -------------------------------------------------------------------------
     # Game method: do_move
@@ -441,7 +1432,10 @@ class Game:
         color = self.turn
 
         new_beetle = self.board.place_new_beetle(color, location)
-        self.gui.new_beetle_added(self, new_beetle.id, color, location.row, location.column)
+        if self.events is not None:
+            self.events.extend((EVENT_BEETLE_ADDED, new_beetle.id, COLOR_CODES[color], location.row, location.column))
+        else:
+            self.gui.new_beetle_added(self, new_beetle.id, color, location.row, location.column)
 
         square = self.board.get_square_by_location(location.row, location.column)
         self.evaluate_square(square)
@@ -455,12 +1449,36 @@ class Game:
         # If there is a winner, then the game is over.
         winner = self.get_winner()
         if winner is not None:
-            self.gui.announce_winner(self, winner)
+            if self.events is not None:
+                self.events.extend((EVENT_WINNER, COLOR_CODES[winner], 0, 0, 0))
+            else:
+                self.gui.announce_winner(self, winner)
             return True
-        
-        self.gui.turn_changed(self, self.turn)
+
+        if self.events is not None:
+            self.events.extend((EVENT_TURN_CHANGED, COLOR_CODES[self.turn], 0, 0, 0))
+        else:
+            self.gui.turn_changed(self, self.turn)
         return True
 
+    # -------------------------------------------------------------------------
+    # Game method: do_move_events
+    # This method does the move like do_move, but instead of calling the GUI
+    # for every jump and color change, the calls are returned as events. The
+    # GUI of the game is not called: do_move and make_beetle_jump add the
+    # events to the array of values of the events themselves. If the move is
+    # not valid, None is returned.
+    # -------------------------------------------------------------------------
+    def do_move_events(self, row, column) -> Optional[GameEvents]:
+        events = GameEvents()
+        self.events = events.values
+        try:
+            if not self.do_move(row, column):
+                return None
+            return events
+        finally:
+            self.events = None
+
     # -------------------------------------------------------------------------
     # Game method: evaluate_square
     # This method takes a square and if the square is fully filled, then the
@@ -491,6 +1509,15 @@ class Game:
     # then the next beetle is considered. If the beetle can jump, then the beetle
     # is removed from the list of beetles that are about to jump and moved
     # to the destination square.
+    # The cascade is stopped when the jump limit is reached, when none of the
+    # beetles can jump or when the state after a wave of jumps is the same as
+    # after an earlier wave, in which case the cascade would never end. A wave
+    # consists of as many jumps as there were beetles about to jump when the
+    # wave started. Since the state has an entry per square, it is only
+    # compared once the cascade has CASCADE_CYCLE_JUMPS jumps; a cycle goes on
+    # forever, so it is still found. When the cascade is stopped, the jumps
+    # of the remaining beetles are cancelled and the beetles stay where they
+    # are.
     # -------------------------------------------------------------------------
     def transition(self) -> None:
 
@@ -498,6 +1525,12 @@ class Game:
         # of beetles that are skipped because they cannot jump to the destination.
         skipped_beetle_jumps = 0
 
+        # The states after each wave of jumps are kept to detect cycles.
+        jumps = 0
+        wave_end = len(self.beetles_to_jump)
+        wave_states = set()
+        stop_reason = None
+
         # Check if there is a winner.
         game_over = self.get_winner() is not None
 
@@ -505,6 +1538,11 @@ class Game:
         # are no beetles left or until there is a winner.
         while len(self.beetles_to_jump) > 0 and not game_over:
 
+            # If none of the beetles can jump, the cascade cannot continue.
+            if skipped_beetle_jumps == len(self.beetles_to_jump):
+                stop_reason = CASCADE_STOP_DEADLOCK
+                break
+
             beetle = self.beetles_to_jump[skipped_beetle_jumps]
             destination = beetle.destination
             destination_square = self.board.get_square_by_location(destination.row, destination.column)
@@ -515,10 +1553,26 @@ class Game:
 
                 # Make the beetle jump to the destination square.
                 self.make_beetle_jump(beetle)
+                jumps += 1
 
                 # Reset the number of skipped beetle jumps to start
                 # considering the beetle at the beginning of the list again.
                 skipped_beetle_jumps = 0
+
+                if jumps >= self.cascade_jump_limit:
+                    stop_reason = CASCADE_STOP_JUMP_LIMIT
+                    break
+
+                # At the end of a wave of a long cascade, check if the state
+                # was seen before.
+                if jumps == wave_end:
+                    if jumps >= CASCADE_CYCLE_JUMPS:
+                        state = self.get_cascade_state()
+                        if state in wave_states:
+                            stop_reason = CASCADE_STOP_CYCLE
+                            break
+                        wave_states.add(state)
+                    wave_end = jumps + len(self.beetles_to_jump)
             else:
                 # If the destination square is fully filled, then the beetle
                 # cannot jump to the destination square. Therefore, the beetle
@@ -529,6 +1583,32 @@ class Game:
             # If there is a winner, then the game is over.
             game_over = self.get_winner() is not None
 
+        if stop_reason is None:
+            if jumps > 0 and self.cascade_statistics is not None:
+                self.cascade_statistics.record(jumps)
+            return
+
+        # Cancel the jumps of the beetles that did not jump.
+        for beetle in self.beetles_to_jump:
+            beetle.destination = None
+        self.beetles_to_jump = []
+        if self.cascade_statistics is not None:
+            self.cascade_statistics.record(jumps, stop_reason, self.board.dimension,
+                                           [(move.location.row, move.location.column) for move in self.moves])
+
+    # -------------------------------------------------------------------------
+    # Game method: get_cascade_state
+    # This method returns the state of a cascade: the number of beetles and
+    # the color of each square and the beetles that are about to jump in
+    # order. The cascade continues in the same way from the same state.
+    # -------------------------------------------------------------------------
+    def get_cascade_state(self) -> tuple:
+        return (tuple(len(square.beetles) for square in self.board.squares),
+                tuple(self.board.square_colors),
+                tuple((beetle.location.row, beetle.location.column,
+                       beetle.destination.row, beetle.destination.column)
+                      for beetle in self.beetles_to_jump))
+
     # -------------------------------------------------------------------------
     # Game method: make_beetle_jump
     # This method takes a beetle and a destination and makes the beetle jump
@@ -536,8 +1616,8 @@ class Game:
     # -------------------------------------------------------------------------
     def make_beetle_jump(self, beetle) -> None:
 
-        current_square = self.board.get_square_by_location(beetle.location.row, beetle.location.column)
-        destination_square = self.board.get_square_by_location(beetle.destination.row, beetle.destination.column)
+        current_square = self.board.get_writable_square(beetle.location.row, beetle.location.column)
+        destination_square = self.board.get_writable_square(beetle.destination.row, beetle.destination.column)
 
         # The beetle is no longer about to jump so it is removed from the list.
         self.beetles_to_jump.remove(beetle)
@@ -547,15 +1627,27 @@ class Game:
 
         current_square.remove_beetle(beetle)
         destination_square.add_beetle(beetle)
-
-        self.gui.beetle_moved( self, current_square.location.row, current_square.location.column,
-            destination_square.location.row, destination_square.location.column )
+        self.board.square_changed(current_square)
+        self.board.square_changed(destination_square)
+
+        # While the events are recorded, they are added to their values
+        # directly instead of calling the GUI for every jump.
+        events = self.events
+        if events is not None:
+            events.extend((EVENT_BEETLE_MOVED, current_square.location.row, current_square.location.column,
+                           destination_square.location.row, destination_square.location.column))
+        else:
+            self.gui.beetle_moved( self, current_square.location.row, current_square.location.column,
+                destination_square.location.row, destination_square.location.column )
 
         # If the square was conquered, then the color of the beetles was changed.
         if original_destination_color != destination_square.color:
             for square_beetle in destination_square.beetles:
                 if square_beetle != beetle:
-                    self.gui.set_beetle_color(self, square_beetle.id, beetle.color)
+                    if events is not None:
+                        events.extend((EVENT_BEETLE_COLOR, square_beetle.id, COLOR_CODES[beetle.color], 0, 0))
+                    else:
+                        self.gui.set_beetle_color(self, square_beetle.id, beetle.color)
 
         self.evaluate_square(destination_square)
            
@@ -570,20 +1662,17 @@ class Game:
     # -------------------------------------------------------------------------
     def get_winner(self) -> Optional[str]:
 
-        # There can only be a winner from move 3 onwards.
-        if len(self.moves) < 3:
+        # There can only be a winner from move 3 onwards. Every move places
+        # one beetle, so the number of beetles is the number of moves.
+        if self.board.num_beetles < 3:
             return None
         
-        # Get the red squares and blue squares.
-        red_squares = self.board.get_squares_by_color("red")
-        blue_squares = self.board.get_squares_by_color("blue")
-
         # If there are no red squares left, then blue wins.
-        if len(red_squares) == 0:
+        if self.board.count_squares_by_color("red") == 0:
             return "blue"
         
         # If there are no blue squares left, then red wins.
-        if len(blue_squares) == 0:
+        if self.board.count_squares_by_color("blue") == 0:
             return "red"
         
         # Otherwise, there is no winner.
@@ -616,50 +1705,22 @@ class Game:
     # -------------------------------------------------------------------------
     # Game method: calculate_board_value
     # This method calculates the heuristic value of the current game state for
-    # the indicated player.
+    # the indicated player. The square values and beetle counts are kept by
+    # the board evaluator, which only evaluates the squares that changed.
     # -------------------------------------------------------------------------
     def calculate_board_value(self, player_color) -> int:
 
-        move_value = 0
+        evaluator = self.board.evaluator
 
         # Count the number of beetles for each player.
-        owned_beetles = 0
-        opponent_beetles = 0
-
-        # Loop through all squares.
-        for square in self.board.squares:
-
-            if square.color == player_color:
-
-                owned_beetles += square.num_beetles
-                flag_not_vulnerable = True
-
-                # Loop through all neighbors of the square.
-                for neighbor_location in square.neighbors:
-                    neighbor = self.board.get_square_by_location(neighbor_location.row, neighbor_location.column)
-                    
-                    # Check if the neighbor is owned by the opponent and if the
-                    # neighbor is critical.
-                    if neighbor.color != player_color and neighbor.is_critical:
-                        move_value -= 5 - square.capacity
-                        flag_not_vulnerable = False
-
-                if flag_not_vulnerable:
-                    #The edge Heuristic
-                    if square.capacity == 3:
-                        move_value += 2
-                    #The corner Heuristic
-                    elif square.capacity == 2:
-                        move_value += 3
-                    #The unstability Heuristic
-                    if square.is_critical:
-                        move_value += 2
+        owned_beetles = evaluator.get_beetles(self.board, player_color)
+        opponent_beetles = self.board.num_beetles - owned_beetles
 
-            else:
-                opponent_beetles += square.num_beetles
+        # The vulnerability, edge, corner and unstability Heuristics
+        move_value = evaluator.get_value(self.board, player_color)
 
         # The number of beetles Heuristic
-        move_value += owned_beetles
+        move_value += heuristic_weights["beetle"] * owned_beetles
 
         # You win when the opponent has no beetles
         if opponent_beetles == 0 and owned_beetles > 1:
@@ -670,48 +1731,43 @@ class Game:
             return -10000
         
         # The chain Heuristic
-        move_value += sum([2*i for i in self.chains(self.board, player_color) if i > 1])
+        move_value += sum([heuristic_weights["chain"]*i for i in self.chains(self.board, player_color) if i > 1])
         
-        return move_value
+        # Tuned weights need not be whole numbers, the value is.
+        return round(move_value)
     
     # -------------------------------------------------------------------------
     # Game method: chains
-    # This method calculates the length of the chains for the indicated player.
+    # This method returns the length of the chains for the indicated player.
+    # A chain is a group of connected critical squares of the player. The
+    # chains are kept by the chain tracker of the board.
     # -------------------------------------------------------------------------
     def chains(self, board, player_color) -> list[int]:
-
-        # Create a deep copy of all squares on the board.
-        squares = [square.deep_copy() for square in board.squares]
-
-        lengths = []
-
-        for square in squares:
-
-            # Check if the square is of the player and critical.
-            if square.color == player_color and square.is_critical:  
-
-                l = 0
-                visiting_stack = []
-                visiting_stack.append(square)
-                while len(visiting_stack) > 0:
-                    visiting_square = visiting_stack.pop()
-                    visiting_square.beetles = []
-                    l += 1
-                    for neighbor_location in visiting_square.neighbors:
-                        neighbor_square = board.get_square_by_location(neighbor_location.row, 
-                                                                neighbor_location.column)
-                        if neighbor_square.color == player_color and neighbor_square.is_critical:
-                            visiting_stack.append(neighbor_square)
-                lengths.append(l)
-
-        return lengths
+        return board.chain_tracker.get_lengths(board, player_color)
     
     # -------------------------------------------------------------------------
     # Game method: get_best_move
     # This method determines the best move for the current turn. If there is 
     # more than one best move, then one of the best moves is randomly selected.
+    # A forced win or loss that is found by the mate search takes precedence.
+    # With a time limit (in seconds) or a node limit, a search is done that
+    # returns the best move found when the budget runs out. The search tables
+    # of an earlier search can be passed to reuse them and setting the stop
+    # event ends the search early.
     # -------------------------------------------------------------------------
-    def get_best_move(self) -> Location:
+    def get_best_move(self, time_limit=None, node_limit=None, tables=None, stop_event=None) -> Location:
+
+        from game_search import MateSearch
+        from game_search import search_best_move
+
+        # With a budget, search as deep as the budget allows.
+        if time_limit is not None or node_limit is not None:
+            return search_best_move(self, time_limit, node_limit, tables, stop_event)
+
+        # In the endgame, first check for a forced win or loss.
+        forced_result = MateSearch(self, tables=tables).search()
+        if forced_result is not None:
+            return forced_result.move
 
         # Get the best possible moves.
         best_possible_moves = self.get_best_possible_moves()
@@ -732,7 +1788,7 @@ class Game:
 
         # Determine the move value for each of the possible moves.
         for move in possible_moves:
-            game_copy = self.deep_copy()
+            game_copy = self.snapshot()
             game_copy.do_move(move.row, move.column)
             move_value = game_copy.calculate_board_value(self.turn)
 
@@ -745,4 +1801,240 @@ class Game:
         return best_moves
 
 
-# =============================================================================
\ No newline at end of file
+# -----------------------------------------------------------------------------
+# Class: SimulationGame
+# The simulation game plays the same game as Game, but only keeps the number
+# of beetles and the color of each square. There are no beetle objects and
+# no GUI, so it is much faster. It is meant for search and self-play.
+# Squares are identified by their index (row * dimension + column) and the
+# moves are stored as square indices. A jumping beetle is stored as the pair
+# of the indices of its square and its destination. The beetles jump in the
+# same order as in Game.transition, so the positions are the same.
+# -----------------------------------------------------------------------------
+class SimulationGame:
+
+    # -------------------------------------------------------------------------
+    # SimulationGame constructor
+    # The constructor takes the dimension of the board and creates an empty
+    # board on which red has the first move.
+    # -------------------------------------------------------------------------
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self.neighbors = get_neighbor_indices(dimension)
+        self.counts = [0] * (dimension * dimension)
+        self.colors = [None] * (dimension * dimension)
+        self.num_squares = {"red": 0, "blue": 0}
+        self.num_beetles = 0
+        self.turn = "red"
+        self.moves = []
+        self.cascade_jump_limit = CASCADE_JUMP_LIMIT
+        self.cascade_statistics = None  # Statistics of the cascades, if they are kept (see CascadeStatistics)
+
+    # -------------------------------------------------------------------------
+    # SimulationGame method: copy
+    # This method returns a copy of the game.
+    # -------------------------------------------------------------------------
+    def copy(self):
+        game_copy = SimulationGame.__new__(SimulationGame)
+        game_copy.dimension = self.dimension
+        game_copy.neighbors = self.neighbors
+        game_copy.counts = self.counts[:]
+        game_copy.colors = self.colors[:]
+        game_copy.num_squares = dict(self.num_squares)
+        game_copy.num_beetles = self.num_beetles
+        game_copy.turn = self.turn
+        game_copy.moves = self.moves[:]
+        game_copy.cascade_jump_limit = self.cascade_jump_limit
+        game_copy.cascade_statistics = self.cascade_statistics
+        return game_copy
+
+    # -------------------------------------------------------------------------
+    # SimulationGame method: to_game
+    # This method returns a Game with a dummy GUI with the position and moves
+    # of this game.
+    # -------------------------------------------------------------------------
+    def to_game(self) -> Game:
+        game = Game(self.dimension, DummyGui())
+        game.set_position(self.counts, self.colors, self.turn)
+        for move_number, index in enumerate(self.moves):
+            color = "red" if move_number % 2 == 0 else "blue"
+            game.moves.append(Move(color, Location(index // self.dimension, index % self.dimension)))
+        game.cascade_jump_limit = self.cascade_jump_limit
+        game.cascade_statistics = self.cascade_statistics
+        return game
+
+    # -------------------------------------------------------------------------
+    # SimulationGame method: to_bytes
+    # This method returns the position as bytes in the format of Game.to_bytes.
+    # -------------------------------------------------------------------------
+    def to_bytes(self, include_moves=False) -> bytes:
+        return encode_position(self.dimension, self.counts, self.colors, self.turn,
+                               self.moves if include_moves else None)
+
+    # -------------------------------------------------------------------------
+    # SimulationGame method: get_possible_moves
+    # This method returns the indices of the squares on which the current turn
+    # can place a beetle: first the empty squares and then the squares of the
+    # current turn, like Game.get_possible_moves.
+    # -------------------------------------------------------------------------
+    def get_possible_moves(self) -> list[int]:
+        colors = self.colors
+        turn = self.turn
+        return ([index for index, color in enumerate(colors) if color is None] +
+                [index for index, color in enumerate(colors) if color == turn])
+
+    # -------------------------------------------------------------------------
+    # SimulationGame method: check_move
+    # This method takes a square index and checks if the move is valid given
+    # the current turn.
+    # -------------------------------------------------------------------------
+    def check_move(self, index) -> bool:
+        if self.get_winner() is not None:
+            return False
+        if index < 0 or index >= len(self.colors):
+            return False
+        color = self.colors[index]
+        return color is None or color == self.turn
+
+    # -------------------------------------------------------------------------
+    # SimulationGame method: do_move
+    # This method checks the move and if it is valid, places a new beetle of
+    # the current color on the square with the indicated index and resolves
+    # the cascade.
+    # -------------------------------------------------------------------------
+    def do_move(self, index) -> bool:
+        if not self.check_move(index):
+            return False
+
+        color = self.turn
+        if self.colors[index] is None:
+            self.colors[index] = color
+            self.num_squares[color] += 1
+        self.counts[index] += 1
+        self.num_beetles += 1
+        self.moves.append(index)
+
+        jumps = []
+        self.evaluate_square(index, jumps, 0)
+        self.transition(jumps)
+
+        self.turn = "blue" if color == "red" else "red"
+        return True
+
+    # -------------------------------------------------------------------------
+    # SimulationGame method: evaluate_square
+    # This method takes a square index and if the square is full, then a jump
+    # to each neighboring square is added to the list of jumps. The number of
+    # beetles on the square that are already jumping is indicated.
+    # -------------------------------------------------------------------------
+    def evaluate_square(self, index, jumps, jumping_beetles) -> None:
+        neighbors = self.neighbors[index]
+        if self.counts[index] - jumping_beetles < len(neighbors):
+            return
+        for neighbor in neighbors:
+            jumps.append((index, neighbor))
+
+    # -------------------------------------------------------------------------
+    # SimulationGame method: transition
+    # This method makes the beetles jump in the same order as Game.transition:
+    # the first jump in the list whose destination is not full is done and
+    # the list is considered from the beginning again. The cascade is stopped
+    # in the same cases as in Game.transition.
+    # -------------------------------------------------------------------------
+    def transition(self, jumps) -> None:
+        counts = self.counts
+        colors = self.colors
+        neighbors = self.neighbors
+        num_squares = self.num_squares
+        skipped_jumps = 0
+        num_jumps = 0
+        wave_end = len(jumps)
+        wave_states = set()
+        stop_reason = None
+
+        while len(jumps) > 0 and (self.num_beetles < 3 or (num_squares["red"] > 0 and num_squares["blue"] > 0)):
+
+            if skipped_jumps == len(jumps):
+                stop_reason = CASCADE_STOP_DEADLOCK
+                break
+
+            source, destination = jumps[skipped_jumps]
+
+            # If the destination is full, the beetle has to wait.
+            if counts[destination] >= len(neighbors[destination]):
+                skipped_jumps += 1
+                continue
+
+            del jumps[skipped_jumps]
+            skipped_jumps = 0
+
+            # The beetle takes the color of its square to the destination.
+            color = colors[source]
+            counts[source] -= 1
+            if counts[source] == 0:
+                colors[source] = None
+                num_squares[color] -= 1
+
+            destination_color = colors[destination]
+            if destination_color != color:
+                if destination_color is not None:
+                    num_squares[destination_color] -= 1
+                num_squares[color] += 1
+                colors[destination] = color
+            counts[destination] += 1
+
+            # Count the beetles on the destination that are still jumping.
+            jumping_beetles = sum(1 for jump in jumps if jump[0] == destination)
+            self.evaluate_square(destination, jumps, jumping_beetles)
+
+            num_jumps += 1
+            if num_jumps >= self.cascade_jump_limit:
+                stop_reason = CASCADE_STOP_JUMP_LIMIT
+                break
+
+            # At the end of a wave of a long cascade, check if the state was
+            # seen before.
+            if num_jumps == wave_end:
+                if num_jumps >= CASCADE_CYCLE_JUMPS:
+                    state = (tuple(counts), tuple(colors), tuple(jumps))
+                    if state in wave_states:
+                        stop_reason = CASCADE_STOP_CYCLE
+                        break
+                    wave_states.add(state)
+                wave_end = num_jumps + len(jumps)
+
+        if stop_reason is None:
+            if num_jumps > 0 and self.cascade_statistics is not None:
+                self.cascade_statistics.record(num_jumps)
+            return
+
+        # The remaining jumps are cancelled.
+        jumps.clear()
+        if self.cascade_statistics is not None:
+            self.cascade_statistics.record(num_jumps, stop_reason, self.dimension,
+                                           [divmod(index, self.dimension) for index in self.moves])
+
+    # -------------------------------------------------------------------------
+    # SimulationGame method: get_winner
+    # This method returns the color of the winner or None, like
+    # Game.get_winner.
+    # -------------------------------------------------------------------------
+    def get_winner(self) -> Optional[str]:
+        if self.num_beetles < 3:
+            return None
+        if self.num_squares["red"] == 0:
+            return "blue"
+        if self.num_squares["blue"] == 0:
+            return "red"
+        return None
+
+# =============================================================================
+# Startup
+# =============================================================================
+
+# A weights file that cannot be read must not keep the game from starting, so
+# the default weights are used then.
+try:
+    load_heuristic_weights()
+except (OSError, ValueError) as error:
+    warnings.warn(f"The heuristic weights are not loaded, the default weights are used: {error}")
@@ -0,0 +1,422 @@
+# =============================================================================
+# Beetle Battle - Game Fuzz Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Protocol
+from typing import Optional
+from multiprocessing import Pool
+import argparse
+import importlib
+import random
+import time
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_engine import Game
+from game_engine import DummyGui
+from game_engine import SimulationGame
+
+# =============================================================================
+# Constants
+# =============================================================================
+DEFAULT_DIMENSIONS = [3, 4, 5, 6, 7]  # Dimensions of the boards of the random games
+MAX_GAME_MOVES = 1000                 # Maximum number of moves of a random game
+MAX_MISMATCHES = 10                   # A worker stops after this many mismatches
+GAMES_PER_TASK = 100                  # Number of games per task of a worker
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: create_engine
+# This function takes the name of an engine and the dimension of the board
+# and returns the engine with an empty board. The name is "reference",
+# "simulation" or the name of a module with a Game class that has the same
+# interface as the Game class of the game engine module.
+# -----------------------------------------------------------------------------
+def create_engine(name: str, dimension: int):
+    if name == "reference":
+        return GameEngine(Game, dimension)
+    if name == "simulation":
+        return SimulationEngine(dimension)
+    return GameEngine(importlib.import_module(name).Game, dimension)
+
+# -----------------------------------------------------------------------------
+# Function: compare_engines
+# This function takes the reference and the candidate engine and the events
+# of the last move of both and returns a description of the first difference
+# or None if there is no difference. Events are only compared if both
+# engines return them.
+# -----------------------------------------------------------------------------
+def compare_engines(reference, candidate, reference_events, candidate_events) -> Optional[str]:
+    if reference_events is not None and candidate_events is not None:
+        if reference_events != candidate_events:
+            for number, (reference_event, candidate_event) in enumerate(zip(reference_events, candidate_events)):
+                if reference_event != candidate_event:
+                    return f"event {number}: {reference_event} != {candidate_event}"
+            return f"number of events: {len(reference_events)} != {len(candidate_events)}"
+
+    reference_counts, reference_colors, reference_turn = reference.get_position()
+    candidate_counts, candidate_colors, candidate_turn = candidate.get_position()
+    for index in range(len(reference_counts)):
+        if (reference_counts[index] != candidate_counts[index] or
+                reference_colors[index] != candidate_colors[index]):
+            return (f"square {index}: {reference_counts[index]} {reference_colors[index]} != "
+                    f"{candidate_counts[index]} {candidate_colors[index]}")
+    if reference_turn != candidate_turn:
+        return f"turn: {reference_turn} != {candidate_turn}"
+
+    if reference.get_winner() != candidate.get_winner():
+        return f"winner: {reference.get_winner()} != {candidate.get_winner()}"
+
+    if reference.get_possible_moves() != candidate.get_possible_moves():
+        return "possible moves differ"
+
+    return None
+
+# -----------------------------------------------------------------------------
+# Function: play_move
+# This function does the move (a square index) with both engines and returns
+# a description of the first difference or None if there is no difference.
+# An exception that is raised by the candidate engine is a difference as
+# well, so that a crash is recorded and minimized like any other mismatch.
+# -----------------------------------------------------------------------------
+def play_move(reference, candidate, index: int) -> Optional[str]:
+    reference_events = reference.do_move(index)
+    try:
+        return compare_engines(reference, candidate, reference_events, candidate.do_move(index))
+    except Exception as error:
+        return f"exception: {type(error).__name__}: {error}"
+
+# -----------------------------------------------------------------------------
+# Function: replay_moves
+# This function plays the moves (square indices) on a new board with both
+# engines and returns the number of the first move after which the engines
+# differ with a description of the difference. If the engines do not differ,
+# None is returned for both. If one of the moves is not valid in the
+# reference engine, the move number is returned without a description.
+# -----------------------------------------------------------------------------
+def replay_moves(candidate_name: str, dimension: int, moves: list[int]) -> tuple[Optional[int], Optional[str]]:
+    reference = create_engine("reference", dimension)
+    candidate = create_engine(candidate_name, dimension)
+    for move_number, index in enumerate(moves):
+        if not reference.check_move(index):
+            return move_number, None
+        difference = play_move(reference, candidate, index)
+        if difference is not None:
+            return move_number, difference
+    return None, None
+
+# -----------------------------------------------------------------------------
+# Function: minimize_moves
+# This function takes the moves of a game in which the engines differ and
+# returns a shorter list of moves for which they still differ. The moves
+# after the difference are dropped and then blocks of moves are removed as
+# long as the remaining moves are valid and the engines still differ. The
+# blocks start at half of the moves and get smaller down to single moves.
+# Blocks of an even size keep the colors of the later moves the same.
+# -----------------------------------------------------------------------------
+def minimize_moves(candidate_name: str, dimension: int, moves: list[int]) -> list[int]:
+    move_number, difference = replay_moves(candidate_name, dimension, moves)
+    if move_number is None or difference is None:
+        return moves
+    moves = moves[:move_number + 1]
+
+    block_size = get_block_size(len(moves))
+    while block_size >= 1:
+        removed = False
+        start = len(moves) - block_size - 1
+        while start >= 0:
+            shorter_moves = moves[:start] + moves[start + block_size:]
+            move_number, difference = replay_moves(candidate_name, dimension, shorter_moves)
+            if move_number is not None and difference is not None:
+                moves = shorter_moves[:move_number + 1]
+                removed = True
+                start = min(start, len(moves) - block_size - 1)
+            else:
+                start -= 1
+        if not removed:
+            block_size = get_block_size(block_size) if block_size > 1 else 0
+    return moves
+
+# -----------------------------------------------------------------------------
+# Function: get_block_size
+# This function returns the size of the blocks of moves that minimize_moves
+# tries to remove after the indicated size: half of it, but even if larger
+# than one.
+# -----------------------------------------------------------------------------
+def get_block_size(size: int) -> int:
+    block_size = max(size // 2, 1)
+    return block_size - 1 if block_size > 1 and block_size % 2 == 1 else block_size
+
+# -----------------------------------------------------------------------------
+# Function: play_random_game
+# This function plays a random game with the indicated seed on a board of
+# the indicated dimension with both engines and returns the mismatch or
+# None if the engines do not differ. The second value is the number of moves.
+# -----------------------------------------------------------------------------
+def play_random_game(candidate_name: str, dimension: int, seed: int) -> tuple[Optional["Mismatch"], int]:
+    rng = random.Random(seed)
+    reference = create_engine("reference", dimension)
+    candidate = create_engine(candidate_name, dimension)
+    moves = []
+
+    while reference.get_winner() is None and len(moves) < MAX_GAME_MOVES:
+        index = rng.choice(reference.get_possible_moves())
+        moves.append(index)
+        difference = play_move(reference, candidate, index)
+        if difference is not None:
+            return Mismatch(seed, dimension, moves, difference), len(moves)
+
+    return None, len(moves)
+
+# -----------------------------------------------------------------------------
+# Function: fuzz_worker
+# This function is run by the processes of the fuzzer. It takes the name of
+# the candidate engine, the dimensions, the first seed and the number of
+# games and returns the number of games that were played, the number of
+# moves and the mismatches that were found. Fewer games are played if the
+# worker stops at MAX_MISMATCHES.
+# -----------------------------------------------------------------------------
+def fuzz_worker(arguments) -> tuple[int, int, list["Mismatch"]]:
+    candidate_name, dimensions, first_seed, num_games = arguments
+    num_played = 0
+    num_moves = 0
+    mismatches = []
+    for seed in range(first_seed, first_seed + num_games):
+        dimension = dimensions[seed % len(dimensions)]
+        mismatch, game_moves = play_random_game(candidate_name, dimension, seed)
+        num_played += 1
+        num_moves += game_moves
+        if mismatch is not None:
+            mismatch.moves = minimize_moves(candidate_name, dimension, mismatch.moves)
+            mismatches.append(mismatch)
+            if len(mismatches) >= MAX_MISMATCHES:
+                break
+    return num_played, num_moves, mismatches
+
+# -----------------------------------------------------------------------------
+# Function: fuzz
+# This function plays the indicated number of random games with the reference
+# and the candidate engine, divided over the indicated number of processes,
+# and returns the result. The games are reproducible from the first seed.
+# -----------------------------------------------------------------------------
+def fuzz(candidate_name: str, num_games: int, dimensions=None, processes=1, first_seed=0) -> "FuzzResult":
+    dimensions = dimensions or DEFAULT_DIMENSIONS
+    start_time = time.perf_counter()
+    tasks = [(candidate_name, dimensions, seed, min(GAMES_PER_TASK, first_seed + num_games - seed))
+             for seed in range(first_seed, first_seed + num_games, GAMES_PER_TASK)]
+    result = FuzzResult()
+
+    if processes > 1:
+        with Pool(processes) as pool:
+            for task_games, task_moves, mismatches in pool.imap_unordered(fuzz_worker, tasks):
+                result.add(task_games, task_moves, mismatches)
+    else:
+        for task in tasks:
+            result.add(*fuzz_worker(task))
+
+    result.seconds = time.perf_counter() - start_time
+    return result
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: EngineProtocol
+# The interface of an engine for the fuzzer. Moves are square indices and a
+# position is the list of the number of beetles, the list of the colors
+# (None for an empty square) and the turn.
+# -----------------------------------------------------------------------------
+class EngineProtocol(Protocol):
+
+    def check_move(self, index: int) -> bool:
+        ...
+
+    def do_move(self, index: int) -> Optional[list[tuple]]:
+        ...
+
+    def get_position(self) -> tuple[list[int], list[Optional[str]], str]:
+        ...
+
+    def get_winner(self) -> Optional[str]:
+        ...
+
+    def get_possible_moves(self) -> list[int]:
+        ...
+
+# -----------------------------------------------------------------------------
+# Class: GameEngine
+# This class implements the EngineProtocol for a class with the interface of
+# Game. The events of a move are returned if the class supports them.
+# -----------------------------------------------------------------------------
+class GameEngine(EngineProtocol):
+
+    # -------------------------------------------------------------------------
+    # GameEngine constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, game_class, dimension):
+        self.game = game_class(dimension, DummyGui())
+        self.dimension = dimension
+
+    # -------------------------------------------------------------------------
+    # GameEngine method: check_move
+    # -------------------------------------------------------------------------
+    def check_move(self, index: int) -> bool:
+        return self.game.check_move(index // self.dimension, index % self.dimension)
+
+    # -------------------------------------------------------------------------
+    # GameEngine method: do_move
+    # -------------------------------------------------------------------------
+    def do_move(self, index: int) -> Optional[list[tuple]]:
+        row, column = divmod(index, self.dimension)
+        if hasattr(self.game, "do_move_events"):
+            events = self.game.do_move_events(row, column)
+            return None if events is None else list(events)
+        self.game.do_move(row, column)
+        return None
+
+    # -------------------------------------------------------------------------
+    # GameEngine method: get_position
+    # -------------------------------------------------------------------------
+    def get_position(self) -> tuple[list[int], list[Optional[str]], str]:
+        squares = self.game.board.squares
+        return ([len(square.beetles) for square in squares],
+                [square.beetles[0].color if len(square.beetles) > 0 else None for square in squares],
+                self.game.turn)
+
+    # -------------------------------------------------------------------------
+    # GameEngine method: get_winner
+    # -------------------------------------------------------------------------
+    def get_winner(self) -> Optional[str]:
+        return self.game.get_winner()
+
+    # -------------------------------------------------------------------------
+    # GameEngine method: get_possible_moves
+    # -------------------------------------------------------------------------
+    def get_possible_moves(self) -> list[int]:
+        return sorted(location.row * self.dimension + location.column
+                      for location in self.game.get_possible_moves())
+
+# -----------------------------------------------------------------------------
+# Class: SimulationEngine
+# This class implements the EngineProtocol for a SimulationGame. It has no
+# events, so only the positions, winners and possible moves are compared.
+# -----------------------------------------------------------------------------
+class SimulationEngine(EngineProtocol):
+
+    # -------------------------------------------------------------------------
+    # SimulationEngine constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, dimension):
+        self.game = SimulationGame(dimension)
+
+    # -------------------------------------------------------------------------
+    # SimulationEngine method: check_move
+    # -------------------------------------------------------------------------
+    def check_move(self, index: int) -> bool:
+        return self.game.check_move(index)
+
+    # -------------------------------------------------------------------------
+    # SimulationEngine method: do_move
+    # -------------------------------------------------------------------------
+    def do_move(self, index: int) -> Optional[list[tuple]]:
+        self.game.do_move(index)
+        return None
+
+    # -------------------------------------------------------------------------
+    # SimulationEngine method: get_position
+    # -------------------------------------------------------------------------
+    def get_position(self) -> tuple[list[int], list[Optional[str]], str]:
+        return self.game.counts, self.game.colors, self.game.turn
+
+    # -------------------------------------------------------------------------
+    # SimulationEngine method: get_winner
+    # -------------------------------------------------------------------------
+    def get_winner(self) -> Optional[str]:
+        return self.game.get_winner()
+
+    # -------------------------------------------------------------------------
+    # SimulationEngine method: get_possible_moves
+    # -------------------------------------------------------------------------
+    def get_possible_moves(self) -> list[int]:
+        return sorted(self.game.get_possible_moves())
+
+# -----------------------------------------------------------------------------
+# Class: Mismatch
+# A game in which the engines differ: the seed and dimension of the random
+# game, the (minimized) moves as square indices and the difference.
+# -----------------------------------------------------------------------------
+class Mismatch:
+
+    # -------------------------------------------------------------------------
+    # Mismatch constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, seed, dimension, moves, difference):
+        self.seed       = seed
+        self.dimension  = dimension
+        self.moves      = moves
+        self.difference = difference
+
+    # -------------------------------------------------------------------------
+    # Mismatch method: get_locations
+    # This method returns the moves as (row, column) tuples.
+    # -------------------------------------------------------------------------
+    def get_locations(self) -> list[tuple[int, int]]:
+        return [divmod(index, self.dimension) for index in self.moves]
+
+# -----------------------------------------------------------------------------
+# Class: FuzzResult
+# The result of the fuzzer: the number of games and moves, the mismatches
+# and the time it took in seconds.
+# -----------------------------------------------------------------------------
+class FuzzResult:
+
+    # -------------------------------------------------------------------------
+    # FuzzResult constructor
+    # -------------------------------------------------------------------------
+    def __init__(self):
+        self.games      = 0
+        self.moves      = 0
+        self.mismatches = []
+        self.seconds    = 0.0
+
+    # -------------------------------------------------------------------------
+    # FuzzResult method: add
+    # This method adds the result of a task of a worker.
+    # -------------------------------------------------------------------------
+    def add(self, games, moves, mismatches) -> None:
+        self.games += games
+        self.moves += moves
+        self.mismatches.extend(mismatches)
+
+# =============================================================================
+# Main
+# =============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare a candidate engine with the reference engine.")
+    parser.add_argument("candidate", help="'simulation' or the name of a module with a Game class")
+    parser.add_argument("--games", type=int, default=10000, help="number of random games")
+    parser.add_argument("--dimensions", type=int, nargs="+", default=DEFAULT_DIMENSIONS,
+                        help="dimensions of the boards")
+    parser.add_argument("--processes", type=int, default=1, help="number of processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    args = parser.parse_args()
+
+    result = fuzz(args.candidate, args.games, args.dimensions, args.processes, args.seed)
+
+    for mismatch in sorted(result.mismatches, key=lambda mismatch: mismatch.seed):
+        print(f"seed {mismatch.seed}, dimension {mismatch.dimension}: {mismatch.difference}")
+        print(f"  moves: {mismatch.get_locations()}")
+    print(f"games: {result.games}, moves: {result.moves}, mismatches: {len(result.mismatches)}")
+    print(f"time: {result.seconds:.1f} s ({result.moves / max(result.seconds, 1e-9):.0f} moves/s)")
+    if len(result.mismatches) > 0:
+        raise SystemExit(1)
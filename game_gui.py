@@ -19,6 +19,7 @@ from typing import Optional
 # Local Imports
 # =============================================================================
 from game_engine import Game
+from game_search import Ponderer
 
 # =============================================================================
 # Constants
@@ -26,6 +27,12 @@ from game_engine import Game
 WINDOW_SIZE = 500  # Size of the square window
 BOARD_SIZES = [3, 5, 7, 9, 11]  # Possible board sizes
 
+# Difficulty levels of the computer: name, time limit (seconds), node limit
+DIFFICULTY_LEVELS = [("Easy", None, 100),
+                     ("Normal", 1.0, None),
+                     ("Hard", 3.0, None)]
+DEFAULT_DIFFICULTY = "Normal"
+
 # =============================================================================
 # Global Variables
 # =============================================================================
@@ -59,6 +66,9 @@ class GameGui:
         self.computer_player = "blue"
         self.circles = []
         self.player_selection = None
+        self.pondering = None
+        self.difficulty = None
+        self.ponderer = Ponderer()
         self.last_move_rectangle = None
         self.root = root
         self.canvas = canvas
@@ -90,8 +100,17 @@ class GameGui:
     def new_game(self, dimension = None) -> None:
         if dimension is None:
             dimension = self.game.board.dimension
+        self.ponderer.stop()
         self.__init__(dimension, self.root, self.canvas)
 
+    # -----------------------------------------------------------------------------
+    # GameGui method: close_window
+    # This function stops the pondering and closes the root window.
+    # -----------------------------------------------------------------------------
+    def close_window(self) -> None:
+        self.ponderer.stop()
+        self.root.destroy()
+
     # -----------------------------------------------------------------------------
     # GameGui method: create_main_window
     # This function creates the root window.
@@ -111,7 +130,10 @@ class GameGui:
         game_menu = tk.Menu(menu_bar, tearoff=0)
         game_menu.add_command(label="New Game", command=lambda: [self.new_game()])
         game_menu.add_separator()
-        game_menu.add_command(label="Exit", command=self.root.destroy)
+        game_menu.add_command(label="Exit", command=self.close_window)
+
+        # Closing the window also stops the pondering.
+        self.root.protocol("WM_DELETE_WINDOW", self.close_window)
 
         # Add the File menu to the menu bar.
         menu_bar.add_cascade(label="Game", menu=game_menu)
@@ -130,6 +152,20 @@ class GameGui:
         player_menu.add_radiobutton(label="2 players", variable=self.player_selection, 
                                     value="2 players", command=lambda: self.player_choice(None))
 
+        # Add a radio button for each difficulty level.
+        self.difficulty = tk.StringVar(value=DEFAULT_DIFFICULTY)
+        player_menu.add_separator()
+        for name, _, _ in DIFFICULTY_LEVELS:
+            player_menu.add_radiobutton(label=name, variable=self.difficulty,
+                                        value=name, command=self.difficulty_choice)
+        self.difficulty_choice()
+
+        # Let the computer think while it is the turn of the player.
+        self.pondering = tk.BooleanVar(value=True)
+        player_menu.add_separator()
+        player_menu.add_checkbutton(label="Think during player's turn", variable=self.pondering,
+                                    command=self.pondering_choice)
+
         # Add the Player menu to the menu bar
         menu_bar.add_cascade(label="Player", menu=player_menu)
 
@@ -152,8 +188,50 @@ class GameGui:
 
         # Do the first move when the computer is set to red.
         if len(self.game.moves) == 0 and (self.computer_player == "red" or self.computer_player == "both"):
-            best_move = self.game.get_best_move()
+            best_move = self.get_computer_move()
             self.do_move(best_move.row, best_move.column)
+            return
+
+        # Start or stop pondering for the new selection.
+        self.pondering_choice()
+
+    # -----------------------------------------------------------------------------
+    # GameGui method: difficulty_choice
+    # This function sets the time and node limit of the computer for the
+    # selected difficulty level.
+    # -----------------------------------------------------------------------------
+    def difficulty_choice(self) -> None:
+        restart_pondering = self.ponderer.thread is not None
+        self.ponderer.stop()
+        for name, time_limit, node_limit in DIFFICULTY_LEVELS:
+            if name == self.difficulty.get():
+                self.ponderer.time_limit = time_limit
+                self.ponderer.node_limit = node_limit
+        if restart_pondering:
+            self.pondering_choice()
+
+    # -----------------------------------------------------------------------------
+    # GameGui method: pondering_choice
+    # This function is called when pondering is switched on or off. Pondering
+    # only happens while a player is thinking against the computer.
+    # -----------------------------------------------------------------------------
+    def pondering_choice(self) -> None:
+        self.ponderer.stop()
+        if (self.pondering.get() and self.game.get_winner() is None and
+                self.computer_player in ("red", "blue") and self.computer_player != self.game.turn):
+            self.ponderer.start(self.game)
+
+    # -----------------------------------------------------------------------------
+    # GameGui method: get_computer_move
+    # This function returns the move of the computer within the limits of the
+    # difficulty level. When pondering is on, the move found while the player
+    # was thinking is used if available.
+    # -----------------------------------------------------------------------------
+    def get_computer_move(self):
+        if self.pondering.get():
+            return self.ponderer.get_best_move(self.game)
+        return self.game.get_best_move(self.ponderer.time_limit, self.ponderer.node_limit,
+                                       self.ponderer.tables)
 
     # -----------------------------------------------------------------------------
     # GameGui method: init_canvas
@@ -280,14 +358,14 @@ class GameGui:
                 self.canvas.itemconfig(rectangle, fill="white")
             return
         
-        # Get the empty squares and the squares that have beetles of the current turn's color.
-        valid_squares = self.game.board.get_empty_squares() + self.game.board.get_squares_by_color(turn)
+        # Get the indices of the empty squares and the squares that have beetles of the
+        # current turn's color.
+        valid_squares = self.game.board.get_possible_move_indices(turn)
 
         for index, rectangle in enumerate(self.rectangles):
-            square = self.game.board.squares[index]
 
             # Check if the square at the specified location is is part of the valid squares.
-            if square in valid_squares:
+            if index in valid_squares:
                 self.canvas.itemconfig(rectangle, fill="white")
             else:
                 self.canvas.itemconfig(rectangle, fill="light gray")
@@ -424,12 +502,13 @@ class GameGui:
                 self.canvas.itemconfig(rectangle, fill="white")
             return
         
-        # Get the empty squares and the squares that have beetles of the current turn's color.
-        valid_squares = self.game.board.get_empty_squares() + self.game.board.get_squares_by_color(turn)
+        # Get the indices of the empty squares and the squares that have beetles of the
+        # current turn's color.
+        valid_squares = self.game.board.get_possible_move_indices(turn)
 
-        for index, square in enumerate(self.game.board.squares):
+        for index in range(len(self.game.board.squares)):
             # Check if the square at the specified location is is part of the valid squares.
-            if square in valid_squares:
+            if index in valid_squares:
                 self.canvas.itemconfig(self.rectangles[index], fill="white")
             else:
                 self.canvas.itemconfig(self.rectangles[index], fill="light gray")
@@ -497,10 +576,13 @@ class GameGui:
             # Enable the canvas again.
             self.canvas.bind("<Button-1>", self.on_canvas_click)
 
+            # Let the computer think while the player is thinking.
+            self.pondering_choice()
+
             return
         
         # Get the best move for the current turn.
-        best_move = self.game.get_best_move()
+        best_move = self.get_computer_move()
         self.do_move(best_move.row, best_move.column)
 
     # -------------------------------------------------------------------------
@@ -533,9 +615,11 @@ class GameGui:
 
     # -------------------------------------------------------------------------
     # GameGui method: announce_winner
+    # The game is over, so the pondering on the replies is stopped.
     # -------------------------------------------------------------------------
     def announce_winner(self, sender,
                         color: str) -> None:
+        self.ponderer.stop()
         message = "The winner is " + color + "!"
 
         # Create a top-level window to act as the message box
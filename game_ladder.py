@@ -0,0 +1,485 @@
+# =============================================================================
+# Beetle Battle - Game Ladder Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Optional
+from multiprocessing import Pool
+import argparse
+import math
+import random
+import sqlite3
+import time
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_engine import Game
+from game_engine import DummyGui
+from game_engine import heuristic_weights
+from game_engine import read_heuristic_weights
+from game_engine import set_heuristic_weights
+from game_search import Search
+from game_search import SearchTables
+
+# =============================================================================
+# Constants
+# =============================================================================
+ROUND_ROBIN = "round-robin"  # Every pair of players plays in the first round
+SWISS = "swiss"              # Each round, players with similar scores play
+
+DEFAULT_DIMENSION = 5
+DEFAULT_GAMES_PER_PAIR = 2   # Number of games of a pairing; the colors alternate
+MAX_GAME_MOVES = 500         # A game without a winner after this many moves is a draw
+
+ELO_SCALE = 400 / math.log(10)  # Rating points per unit of the natural log of the strength
+MAX_RATING = 2000               # Ratings are limited to this distance from the average
+BAYESELO_PRIOR = 2.0            # Virtual draws of each player against an average player
+MAX_RATING_ITERATIONS = 10000
+RATING_TOLERANCE = 1e-9
+
+CONFIDENCE_Z = 1.96  # Normal quantile of the 95% confidence intervals
+
+# Schema of the ladder database.
+DATABASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS players (name TEXT PRIMARY KEY, config TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    round INTEGER NOT NULL,
+    red TEXT NOT NULL REFERENCES players(name),
+    blue TEXT NOT NULL REFERENCES players(name),
+    seed INTEGER NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0,
+    winner TEXT,
+    moves INTEGER,
+    seconds REAL
+);
+"""
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: split_config
+# This function takes the configuration of a player and returns the search
+# configuration and the path of the weights file, which is None if the
+# player uses the weights of the engine.
+# -----------------------------------------------------------------------------
+def split_config(config: str) -> tuple[str, Optional[str]]:
+    search_config, weights_path = config, None
+    for part in config.split(","):
+        if part.startswith("weights:"):
+            weights_path = part[len("weights:"):]
+            search_config = ",".join(other for other in config.split(",") if other != part) or "greedy"
+            break
+    return search_config, weights_path
+
+# -----------------------------------------------------------------------------
+# Function: get_player_move
+# This function takes a game and the configuration of a player and returns
+# the move of the player. The configurations are:
+#   greedy      the move of Game.get_best_move without a budget
+#   random      a random possible move
+#   depth:N     the move of a search of N plies
+#   time:S      the move of Game.get_best_move with a time limit of S seconds
+#   nodes:N     the move of Game.get_best_move with a limit of N nodes
+# Any of these can be followed by ",weights:FILE" for a player that uses the
+# heuristic weights of the file (see read_heuristic_weights), e.g.
+# "depth:2,weights:tuned_weights.json". Without a search configuration, such
+# a player is greedy. The weights are set by play_game; here only the
+# search configuration is used.
+# -----------------------------------------------------------------------------
+def get_player_move(game: Game, config: str, tables: SearchTables):
+    kind, _, value = split_config(config)[0].partition(":")
+    if kind == "greedy":
+        return game.get_best_move(tables=tables)
+    if kind == "random":
+        return random.choice(game.get_possible_moves())
+    if kind == "depth":
+        return Search(game, tables.transposition_table, tables.move_ordering).search(int(value)).move
+    if kind == "time":
+        return game.get_best_move(time_limit=float(value), tables=tables)
+    if kind == "nodes":
+        return game.get_best_move(node_limit=int(value), tables=tables)
+    raise ValueError(f"Unknown player configuration: {config}")
+
+# -----------------------------------------------------------------------------
+# Function: check_config
+# This function raises a ValueError if the player configuration is not valid.
+# The weights file of the configuration, if any, is read to check it.
+# -----------------------------------------------------------------------------
+def check_config(config: str) -> None:
+    search_config, weights_path = split_config(config)
+    if weights_path is not None:
+        try:
+            read_heuristic_weights(weights_path)
+        except (OSError, ValueError) as error:
+            raise ValueError(f"Invalid weights of player configuration {config}: {error}") from error
+    kind, _, value = search_config.partition(":")
+    if kind in ("greedy", "random") and value == "":
+        return
+    if kind in ("depth", "nodes") and value.isdigit() and int(value) > 0:
+        return
+    if kind == "time":
+        try:
+            if float(value) > 0:
+                return
+        except ValueError:
+            pass
+    raise ValueError(f"Unknown player configuration: {config}")
+
+# -----------------------------------------------------------------------------
+# Function: play_game
+# This function is run by the processes of the ladder. It takes the id of
+# the game, the configurations of red and blue, the dimension and the seed
+# and plays the game. It returns the id, the winner (None for a draw), the
+# number of moves and the time it took in seconds. If a player has its own
+# weights, the weights of the player to move are set before each move and
+# the square values of the board are evaluated again, like in the tuner
+# (see play_tuning_game). The weights of the process are restored at the
+# end.
+# -----------------------------------------------------------------------------
+def play_game(arguments) -> tuple[int, Optional[str], int, float]:
+    game_id, red_config, blue_config, dimension, seed = arguments
+    start_time = time.perf_counter()
+    random.seed(seed)
+
+    game = Game(dimension, DummyGui())
+    configs = {"red": red_config, "blue": blue_config}
+    tables = {"red": SearchTables(), "blue": SearchTables()}
+    engine_weights = dict(heuristic_weights)
+    weights = {}
+    for color, config in configs.items():
+        weights_path = split_config(config)[1]
+        weights[color] = engine_weights if weights_path is None else read_heuristic_weights(weights_path)
+    own_weights = any(split_config(config)[1] is not None for config in configs.values())
+
+    try:
+        while game.get_winner() is None and len(game.moves) < MAX_GAME_MOVES:
+            if own_weights:
+                set_heuristic_weights(weights[game.turn])
+                game.board.evaluator.recalculate()
+            move = get_player_move(game, configs[game.turn], tables[game.turn])
+            game.do_move(move.row, move.column)
+    finally:
+        set_heuristic_weights(engine_weights)
+
+    return game_id, game.get_winner(), len(game.moves), time.perf_counter() - start_time
+
+# -----------------------------------------------------------------------------
+# Function: compute_ratings
+# This function takes the games as (red, blue, red points) tuples, with 1 for
+# a win of red, 0.5 for a draw and 0 for a loss, and returns the rating and
+# the 95% confidence interval (half width) of each player. The ratings are
+# the maximum likelihood Bradley-Terry (Elo) ratings, computed with the
+# minorization-maximization algorithm, relative to the average player. With
+# a prior, each player also has that number of virtual draws against an
+# average player, like BayesElo, which keeps the ratings of players that
+# won or lost all games finite.
+# -----------------------------------------------------------------------------
+def compute_ratings(results: list[tuple[str, str, float]], prior=0.0) -> dict[str, tuple[float, float]]:
+    players = sorted({name for red, blue, _ in results for name in (red, blue)})
+    if len(players) == 0:
+        return {}
+
+    # Count the points and the games between each pair of players.
+    points = {player: prior / 2 for player in players}
+    games = {player: {} for player in players}
+    for red, blue, red_points in results:
+        points[red] += red_points
+        points[blue] += 1 - red_points
+        games[red][blue] = games[red].get(blue, 0) + 1
+        games[blue][red] = games[blue].get(red, 0) + 1
+
+    minimum_strength = math.exp(-MAX_RATING / ELO_SCALE)
+    maximum_strength = math.exp(MAX_RATING / ELO_SCALE)
+    strengths = {player: 1.0 for player in players}
+    for _ in range(MAX_RATING_ITERATIONS):
+        change = 0.0
+        for player in players:
+            strength = strengths[player]
+            denominator = prior / (strength + 1.0)
+            for opponent, num_games in games[player].items():
+                denominator += num_games / (strength + strengths[opponent])
+            new_strength = points[player] / denominator if denominator > 0 else 1.0
+            new_strength = min(max(new_strength, minimum_strength), maximum_strength)
+            change = max(change, abs(math.log(new_strength / strength)))
+            strengths[player] = new_strength
+
+        # Without a prior, only the differences are defined: keep the average at 0.
+        if prior == 0:
+            mean = sum(math.log(strength) for strength in strengths.values()) / len(players)
+            for player in players:
+                strengths[player] /= math.exp(mean)
+
+        if change < RATING_TOLERANCE:
+            break
+
+    # The confidence intervals follow from the Fisher information.
+    mean_rating = sum(math.log(strength) for strength in strengths.values()) * ELO_SCALE / len(players)
+    ratings = {}
+    for player in players:
+        strength = strengths[player]
+        information = prior * strength / (strength + 1.0) ** 2
+        for opponent, num_games in games[player].items():
+            probability = strength / (strength + strengths[opponent])
+            information += num_games * probability * (1 - probability)
+        interval = CONFIDENCE_Z * ELO_SCALE / math.sqrt(information) if information > 0 else math.inf
+        ratings[player] = (math.log(strength) * ELO_SCALE - mean_rating, interval)
+    return ratings
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: Ladder
+# A ladder is a tournament between named player configurations that is
+# stored in a SQLite database. Games are scheduled before they are played
+# and each result is stored as soon as the game is finished, so a ladder
+# that is interrupted continues with the unfinished games when it is run
+# again. Each game has its own seed, so the games are reproducible.
+# -----------------------------------------------------------------------------
+class Ladder:
+
+    # -------------------------------------------------------------------------
+    # Ladder constructor
+    # The constructor takes the path of the database and opens it.
+    # -------------------------------------------------------------------------
+    def __init__(self, database_path):
+        self.connection = sqlite3.connect(database_path)
+        self.connection.executescript(DATABASE_SCHEMA)
+        self.connection.commit()
+
+    # -------------------------------------------------------------------------
+    # Ladder method: close
+    # This method closes the database.
+    # -------------------------------------------------------------------------
+    def close(self) -> None:
+        self.connection.close()
+
+    # -------------------------------------------------------------------------
+    # Ladder method: get_setting
+    # This method returns the value of a setting or the default if the setting
+    # is not stored.
+    # -------------------------------------------------------------------------
+    def get_setting(self, key, default=None) -> Optional[str]:
+        row = self.connection.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    # -------------------------------------------------------------------------
+    # Ladder method: setup
+    # This method stores the players and the settings of a new ladder. For a
+    # round-robin ladder, all games are scheduled; for a Swiss ladder, each
+    # round is scheduled when the previous round is finished.
+    # -------------------------------------------------------------------------
+    def setup(self, players: dict[str, str], tournament_format=ROUND_ROBIN, rounds=1,
+              games_per_pair=DEFAULT_GAMES_PER_PAIR, dimension=DEFAULT_DIMENSION, seed=0) -> None:
+        if self.get_setting("format") is not None:
+            raise ValueError("The ladder has already been set up")
+        if tournament_format not in (ROUND_ROBIN, SWISS):
+            raise ValueError(f"Unknown format: {tournament_format}")
+        if len(players) < 2:
+            raise ValueError("A ladder needs at least two players")
+        for config in players.values():
+            check_config(config)
+
+        with self.connection:
+            self.connection.executemany("INSERT INTO players (name, config) VALUES (?, ?)", players.items())
+            settings = {"format": tournament_format, "rounds": rounds, "games_per_pair": games_per_pair,
+                        "dimension": dimension, "seed": seed}
+            self.connection.executemany("INSERT INTO settings (key, value) VALUES (?, ?)",
+                                        [(key, str(value)) for key, value in settings.items()])
+
+        if tournament_format == ROUND_ROBIN:
+            names = sorted(players)
+            pairs = [(names[first], names[second])
+                     for first in range(len(names)) for second in range(first + 1, len(names))]
+            for round_number in range(1, rounds + 1):
+                self.schedule_round(round_number, pairs)
+
+    # -------------------------------------------------------------------------
+    # Ladder method: schedule_round
+    # This method schedules the games of the pairs of a round. The colors of
+    # the games of a pair alternate.
+    # -------------------------------------------------------------------------
+    def schedule_round(self, round_number, pairs) -> None:
+        games_per_pair = int(self.get_setting("games_per_pair"))
+        seed = int(self.get_setting("seed"))
+        number_of_games = self.connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+        games = []
+        for first, second in pairs:
+            for game_number in range(games_per_pair):
+                red, blue = (first, second) if game_number % 2 == 0 else (second, first)
+                games.append((round_number, red, blue, seed + number_of_games + len(games)))
+        with self.connection:
+            self.connection.executemany("INSERT INTO games (round, red, blue, seed) VALUES (?, ?, ?, ?)", games)
+
+    # -------------------------------------------------------------------------
+    # Ladder method: get_points
+    # This method returns the points of each player: 1 for a win and 0.5 for
+    # a draw.
+    # -------------------------------------------------------------------------
+    def get_points(self) -> dict[str, float]:
+        points = {name: 0.0 for name, in self.connection.execute("SELECT name FROM players")}
+        for red, blue, red_points in self.get_results():
+            points[red] += red_points
+            points[blue] += 1 - red_points
+        return points
+
+    # -------------------------------------------------------------------------
+    # Ladder method: schedule_swiss_round
+    # This method schedules the next round of a Swiss ladder. The players are
+    # ordered by their points and each player is paired with the next player
+    # in that order against whom it played the least. With an odd number of
+    # players, the lowest ranked of the players with the most games does not
+    # play this round.
+    # -------------------------------------------------------------------------
+    def schedule_swiss_round(self, round_number) -> None:
+        points = self.get_points()
+        met = {}
+        games = {name: 0 for name in points}
+        for red, blue in self.connection.execute("SELECT red, blue FROM games"):
+            met[(red, blue)] = met.get((red, blue), 0) + 1
+            met[(blue, red)] = met.get((blue, red), 0) + 1
+            games[red] += 1
+            games[blue] += 1
+
+        unpaired = sorted(points, key=lambda name: (-points[name], name))
+        if len(unpaired) % 2 == 1:
+            most_games = max(games.values())
+            unpaired.remove([name for name in unpaired if games[name] == most_games][-1])
+        pairs = []
+        while len(unpaired) > 1:
+            player = unpaired.pop(0)
+            opponent = min(unpaired, key=lambda name: met.get((player, name), 0))
+            unpaired.remove(opponent)
+            pairs.append((player, opponent))
+        self.schedule_round(round_number, pairs)
+
+    # -------------------------------------------------------------------------
+    # Ladder method: run
+    # This method plays the unfinished games, divided over the indicated
+    # number of processes, and stores each result when the game is finished.
+    # For a Swiss ladder, the next round is scheduled when a round is
+    # finished, until all rounds are played. The callback is called with the
+    # id, the winner and the number of moves of each finished game.
+    # -------------------------------------------------------------------------
+    def run(self, processes=1, callback=None) -> None:
+        if self.get_setting("format") is None:
+            raise ValueError("The ladder has not been set up")
+        rounds = int(self.get_setting("rounds"))
+        while True:
+            self.play_unfinished_games(processes, callback)
+            if self.get_setting("format") != SWISS:
+                return
+            last_round = self.connection.execute("SELECT MAX(round) FROM games").fetchone()[0] or 0
+            if last_round >= rounds:
+                return
+            self.schedule_swiss_round(last_round + 1)
+
+    # -------------------------------------------------------------------------
+    # Ladder method: play_unfinished_games
+    # This method plays the games that are scheduled but not finished.
+    # -------------------------------------------------------------------------
+    def play_unfinished_games(self, processes, callback) -> None:
+        dimension = int(self.get_setting("dimension"))
+        configs = dict(self.connection.execute("SELECT name, config FROM players"))
+        arguments = [(game_id, configs[red], configs[blue], dimension, seed)
+                     for game_id, red, blue, seed in self.connection.execute(
+                         "SELECT id, red, blue, seed FROM games WHERE finished = 0 ORDER BY id")]
+
+        if processes > 1:
+            with Pool(processes) as pool:
+                for result in pool.imap_unordered(play_game, arguments):
+                    self.store_result(*result, callback=callback)
+        else:
+            for argument in arguments:
+                self.store_result(*play_game(argument), callback=callback)
+
+    # -------------------------------------------------------------------------
+    # Ladder method: store_result
+    # This method stores the result of a finished game.
+    # -------------------------------------------------------------------------
+    def store_result(self, game_id, winner, moves, seconds, callback=None) -> None:
+        with self.connection:
+            self.connection.execute("UPDATE games SET finished = 1, winner = ?, moves = ?, seconds = ? "
+                                    "WHERE id = ?", (winner, moves, seconds, game_id))
+        if callback is not None:
+            callback(game_id, winner, moves)
+
+    # -------------------------------------------------------------------------
+    # Ladder method: get_results
+    # This method returns the finished games as (red, blue, red points).
+    # -------------------------------------------------------------------------
+    def get_results(self) -> list[tuple[str, str, float]]:
+        points = {"red": 1.0, "blue": 0.0, None: 0.5}
+        return [(red, blue, points[winner]) for red, blue, winner in self.connection.execute(
+            "SELECT red, blue, winner FROM games WHERE finished = 1")]
+
+    # -------------------------------------------------------------------------
+    # Ladder method: get_standings
+    # This method returns for each player, ordered by rating: the name, the
+    # number of games, the points, the Elo rating with its confidence
+    # interval and the BayesElo rating with its confidence interval.
+    # -------------------------------------------------------------------------
+    def get_standings(self) -> list[tuple[str, int, float, float, float, float, float]]:
+        results = self.get_results()
+        elo = compute_ratings(results)
+        bayeselo = compute_ratings(results, BAYESELO_PRIOR)
+        points = self.get_points()
+        games = {name: 0 for name in points}
+        for red, blue, _ in results:
+            games[red] += 1
+            games[blue] += 1
+
+        standings = []
+        for name in points:
+            elo_rating, elo_interval = elo.get(name, (0.0, math.inf))
+            bayeselo_rating, bayeselo_interval = bayeselo.get(name, (0.0, math.inf))
+            standings.append((name, games[name], points[name],
+                              elo_rating, elo_interval, bayeselo_rating, bayeselo_interval))
+        standings.sort(key=lambda standing: -standing[5])
+        return standings
+
+# =============================================================================
+# Main
+# =============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rate AI configurations in a tournament.")
+    parser.add_argument("database", help="SQLite database of the ladder")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    setup_parser = subparsers.add_parser("setup", help="create a new ladder")
+    setup_parser.add_argument("players", nargs="+",
+                              help="players as name=config, e.g. d2=depth:2 or tuned=depth:2,weights:tuned.json")
+    setup_parser.add_argument("--format", choices=[ROUND_ROBIN, SWISS], default=ROUND_ROBIN)
+    setup_parser.add_argument("--rounds", type=int, default=1)
+    setup_parser.add_argument("--games-per-pair", type=int, default=DEFAULT_GAMES_PER_PAIR)
+    setup_parser.add_argument("--dimension", type=int, default=DEFAULT_DIMENSION)
+    setup_parser.add_argument("--seed", type=int, default=0)
+
+    run_parser = subparsers.add_parser("run", help="play the unfinished games")
+    run_parser.add_argument("--processes", type=int, default=1)
+
+    subparsers.add_parser("standings", help="show the ratings")
+    args = parser.parse_args()
+
+    ladder = Ladder(args.database)
+    if args.command == "setup":
+        players = dict(player.split("=", 1) for player in args.players)
+        ladder.setup(players, args.format, args.rounds, args.games_per_pair, args.dimension, args.seed)
+    elif args.command == "run":
+        ladder.run(args.processes, lambda game_id, winner, moves:
+                   print(f"game {game_id}: {winner or 'draw'} in {moves} moves"))
+    print(" player           games  points      elo  (95%)   bayeselo  (95%)")
+    for name, games, points, elo, elo_interval, bayeselo, bayeselo_interval in ladder.get_standings():
+        print(f" {name:16} {games:5} {points:7.1f} {elo:8.0f} ±{elo_interval:<6.0f} "
+              f"{bayeselo:8.0f} ±{bayeselo_interval:.0f}")
+    ladder.close()
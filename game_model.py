@@ -0,0 +1,301 @@
+# =============================================================================
+# Beetle Battle - Game Model Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+import argparse
+import struct
+import time
+import zlib
+import numpy as np
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_dataset import DatasetReader
+from game_engine import Game
+from game_engine import Location
+from game_search import WIN_SCORE
+from game_search import Evaluator
+from game_search import set_default_evaluator
+from game_vector import BLUE
+from game_vector import RED
+from game_vector import count_neighbors
+from game_vector import get_capacities
+from game_vector import get_position_planes
+from game_vector import simulate_candidates
+
+# =============================================================================
+# Constants
+# =============================================================================
+# The feature planes, seen from the player to move. "Own" squares are those
+# of the player to move.
+FEATURE_PLANES = (
+    "own beetles",            # Number of beetles on own squares
+    "opponent beetles",       # Number of beetles on opponent squares
+    "own critical",           # Own squares that are critical
+    "opponent critical",      # Opponent squares that are critical
+    "own threats",            # Critical opponent neighbors of own squares
+    "opponent threats",       # Critical own neighbors of opponent squares
+    "own chains",             # Own critical squares next to another one
+    "opponent chains",        # Opponent critical squares next to another one
+    "edges",                  # Squares with capacity 3
+    "corners",                # Squares with capacity 2
+    "empty",                  # Empty squares
+)
+NUM_FEATURE_PLANES = len(FEATURE_PLANES)
+
+DEFAULT_VALUE_SCALE = 1000            # Search score of a predicted value of 1
+MAX_MODEL_SCORE = WIN_SCORE - 2000    # Scores stay below those of won positions
+DEFAULT_HIDDEN_SIZE = 32              # Hidden units of a new MLP
+DEFAULT_FIT_SAMPLES = 200000          # Records used to fit a linear model
+MODEL_FINGERPRINT = 1 << 63           # Set in the fingerprints of models, which heuristics never have
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: get_feature_planes
+# This function takes positions as (K, 2, N, N) planes (see
+# get_position_planes) and returns (K, F, N, N) feature planes (see
+# FEATURE_PLANES).
+# -----------------------------------------------------------------------------
+def get_feature_planes(planes: np.ndarray) -> np.ndarray:
+    num_positions, _, dimension, _ = planes.shape
+    capacity = get_capacities(dimension)
+    counts = planes.astype(np.int16)
+    occupied = counts > 0
+    critical = occupied & (counts == capacity - 1)
+    critical_neighbors = count_neighbors(critical.reshape(-1, dimension, dimension)).reshape(counts.shape)
+
+    # The planes of the player to move and the opponent are done together.
+    features = np.empty((num_positions, NUM_FEATURE_PLANES, dimension, dimension), dtype=np.float32)
+    features[:, 0:2] = counts
+    features[:, 2:4] = critical
+    features[:, 4:6] = critical_neighbors[:, ::-1] * occupied
+    features[:, 6:8] = critical & (critical_neighbors > 0)
+    features[:, 8] = capacity == 3
+    features[:, 9] = capacity == 2
+    features[:, 10] = ~occupied.any(axis=1)
+    return features
+
+# -----------------------------------------------------------------------------
+# Function: get_game_planes
+# This function returns the positions of the games as (K, 2, N, N) planes
+# (see get_position_planes). The planes are made directly from the squares,
+# with the beetles of the opponent counted negative, since this is done for
+# every leaf of a search.
+# -----------------------------------------------------------------------------
+def get_game_planes(games: list[Game]) -> np.ndarray:
+    rows = [[len(square.beetles) if color == game.turn else -len(square.beetles)
+             for square, color in zip(game.board.squares, game.board.square_colors)] for game in games]
+    signed_counts = np.array(rows, dtype=np.int8)
+    dimension = games[0].board.dimension
+    planes = np.empty((len(games), 2, dimension, dimension), dtype=np.uint8)
+    np.maximum(signed_counts, 0, out=planes[:, 0].reshape(len(games), -1), casting="unsafe")
+    np.maximum(-signed_counts, 0, out=planes[:, 1].reshape(len(games), -1), casting="unsafe")
+    return planes
+
+# -----------------------------------------------------------------------------
+# Function: fit_linear_model
+# This function fits a linear model to the outcomes of randomly chosen
+# records of a dataset (see DatasetReader) with ridge regression.
+# -----------------------------------------------------------------------------
+def fit_linear_model(reader, num_samples=DEFAULT_FIT_SAMPLES, regularization=1.0,
+                     scale=DEFAULT_VALUE_SCALE) -> "EvaluationModel":
+    batch = reader.sample_batch(num_samples)
+    inputs = get_feature_planes(batch.planes).reshape(len(batch), -1).astype(np.float64)
+    inputs = np.hstack((inputs, np.ones((len(batch), 1))))
+    targets = batch.outcomes.astype(np.float64)
+    penalty = regularization * np.eye(inputs.shape[1])
+    penalty[-1, -1] = 0.0  # The bias is not regularized
+    solution = np.linalg.solve(inputs.T @ inputs + penalty, inputs.T @ targets)
+    return EvaluationModel(reader.dimension, [(solution[:-1, np.newaxis], solution[-1:])], scale)
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: EvaluationModel
+# A model that predicts the outcome of positions for the player to move from
+# their feature planes: a linear model (one layer) or an MLP (several layers
+# with ReLU between them). The layers are (weights, biases) pairs; the input
+# of the first layer is the flattened feature planes. The predicted value
+# times the scale is the search score.
+# The model is stored as a NumPy .npz file with the dimension, the scale and
+# the weights and biases of each layer.
+# -----------------------------------------------------------------------------
+class EvaluationModel:
+
+    # -------------------------------------------------------------------------
+    # EvaluationModel constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, dimension, layers, scale=DEFAULT_VALUE_SCALE):
+        self.dimension = dimension
+        self.layers    = [(np.asarray(weights, dtype=np.float32), np.asarray(biases, dtype=np.float32))
+                          for weights, biases in layers]
+        self.scale     = scale
+        input_size = NUM_FEATURE_PLANES * dimension * dimension
+        if self.layers[0][0].shape[0] != input_size or self.layers[-1][0].shape[1] != 1:
+            raise ValueError(f"The layers do not fit a board of dimension {dimension}")
+
+    # -------------------------------------------------------------------------
+    # EvaluationModel method: create_random
+    # This method returns a new MLP with random weights and the indicated
+    # hidden layer sizes; without hidden layers, it is a linear model.
+    # -------------------------------------------------------------------------
+    @classmethod
+    def create_random(cls, dimension, hidden_sizes=(DEFAULT_HIDDEN_SIZE,), seed=None):
+        rng = np.random.default_rng(seed)
+        sizes = [NUM_FEATURE_PLANES * dimension * dimension] + list(hidden_sizes) + [1]
+        layers = [(rng.normal(0.0, np.sqrt(2.0 / inputs), (inputs, outputs)), np.zeros(outputs))
+                  for inputs, outputs in zip(sizes[:-1], sizes[1:])]
+        return cls(dimension, layers)
+
+    # -------------------------------------------------------------------------
+    # EvaluationModel method: load
+    # This method returns the model stored in the file.
+    # -------------------------------------------------------------------------
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            num_layers = int(data["num_layers"])
+            layers = [(data[f"weights_{number}"], data[f"biases_{number}"]) for number in range(num_layers)]
+            return cls(int(data["dimension"]), layers, float(data["scale"]))
+
+    # -------------------------------------------------------------------------
+    # EvaluationModel method: save
+    # -------------------------------------------------------------------------
+    def save(self, path) -> None:
+        arrays = {}
+        for number, (weights, biases) in enumerate(self.layers):
+            arrays[f"weights_{number}"] = weights
+            arrays[f"biases_{number}"] = biases
+        with open(path, "wb") as file:
+            np.savez(file, dimension=self.dimension, scale=self.scale, num_layers=len(self.layers), **arrays)
+
+    # -------------------------------------------------------------------------
+    # EvaluationModel method: predict
+    # This method takes positions as (K, 2, N, N) planes and returns the
+    # predicted value of each position.
+    # -------------------------------------------------------------------------
+    def predict(self, planes: np.ndarray) -> np.ndarray:
+        values = get_feature_planes(planes).reshape(len(planes), -1)
+        for number, (weights, biases) in enumerate(self.layers):
+            values = values @ weights + biases
+            if number < len(self.layers) - 1:
+                np.maximum(values, 0.0, out=values)
+        return values[:, 0]
+
+    # -------------------------------------------------------------------------
+    # EvaluationModel method: get_scores
+    # This method takes positions as (K, 2, N, N) planes and returns their
+    # search scores.
+    # -------------------------------------------------------------------------
+    def get_scores(self, planes: np.ndarray) -> np.ndarray:
+        scores = np.rint(self.predict(planes) * self.scale)
+        return np.clip(scores, -MAX_MODEL_SCORE, MAX_MODEL_SCORE).astype(np.int64)
+
+# -----------------------------------------------------------------------------
+# Class: ModelEvaluator
+# An evaluator (see Evaluator) with an evaluation model. It is batched: the
+# search evaluates the children at its leaves together (see
+# Search.get_children), so the cost of the model is shared by many
+# positions.
+# -----------------------------------------------------------------------------
+class ModelEvaluator(Evaluator):
+    batched = True
+
+    # -------------------------------------------------------------------------
+    # ModelEvaluator constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, model: EvaluationModel):
+        self.model = model
+
+    # -------------------------------------------------------------------------
+    # ModelEvaluator method: evaluate
+    # -------------------------------------------------------------------------
+    def evaluate(self, game: Game) -> int:
+        return self.evaluate_batch([game])[0]
+
+    # -------------------------------------------------------------------------
+    # ModelEvaluator method: evaluate_batch
+    # -------------------------------------------------------------------------
+    def evaluate_batch(self, games: list[Game]) -> list[int]:
+        return self.model.get_scores(get_game_planes(games)).tolist()
+
+    # -------------------------------------------------------------------------
+    # ModelEvaluator method: evaluate_moves
+    # This method evaluates the positions after the moves without making the
+    # children: they are simulated together (see simulate_candidates).
+    # -------------------------------------------------------------------------
+    def evaluate_moves(self, game: Game, moves: list[Location]) -> list[int]:
+        dimension = game.board.dimension
+        simulation = simulate_candidates(game, [location.row * dimension + location.column for location in moves],
+                                         exact=True)
+        turns = np.full(len(moves), BLUE if simulation.turn == RED else RED, dtype=np.int8)
+        return self.model.get_scores(get_position_planes(simulation.counts, simulation.owners, turns)).tolist()
+
+    # -------------------------------------------------------------------------
+    # ModelEvaluator method: fingerprint
+    # This method returns a checksum of the dimension, the scale and the
+    # layers of the model (see Evaluator.fingerprint).
+    # -------------------------------------------------------------------------
+    def fingerprint(self) -> int:
+        checksum = zlib.crc32(struct.pack("<id", self.model.dimension, self.model.scale))
+        for weights, biases in self.model.layers:
+            checksum = zlib.crc32(struct.pack("<ii", *weights.shape), checksum)
+            checksum = zlib.crc32(weights.tobytes(), checksum)
+            checksum = zlib.crc32(biases.tobytes(), checksum)
+        return MODEL_FINGERPRINT | checksum
+
+    # -------------------------------------------------------------------------
+    # ModelEvaluator method: load
+    # This method returns an evaluator with the model stored in the file. If
+    # it is made the default, all searches that are not given an evaluator
+    # use it.
+    # -------------------------------------------------------------------------
+    @classmethod
+    def load(cls, path, make_default=False):
+        evaluator = cls(EvaluationModel.load(path))
+        if make_default:
+            set_default_evaluator(evaluator)
+        return evaluator
+
+# =============================================================================
+# Main
+# =============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fit and inspect evaluation models.")
+    parser.add_argument("model", help=".npz file of the model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fit_parser = subparsers.add_parser("fit", help="fit a linear model to a dataset")
+    fit_parser.add_argument("dataset", help="directory of the dataset")
+    fit_parser.add_argument("--samples", type=int, default=DEFAULT_FIT_SAMPLES, help="number of records")
+    fit_parser.add_argument("--regularization", type=float, default=1.0, help="ridge regularization")
+
+    test_parser = subparsers.add_parser("test", help="measure the model on a dataset")
+    test_parser.add_argument("dataset", help="directory of the dataset")
+    test_parser.add_argument("--samples", type=int, default=100000, help="number of records")
+    args = parser.parse_args()
+
+    reader = DatasetReader(args.dataset, seed=1)
+    if args.command == "fit":
+        fit_linear_model(reader, args.samples, args.regularization).save(args.model)
+        print(f"saved a linear model for dimension {reader.dimension} in {args.model}")
+    else:
+        model = EvaluationModel.load(args.model)
+        batch = reader.sample_batch(args.samples)
+        start_time = time.perf_counter()
+        values = model.predict(batch.planes)
+        seconds = time.perf_counter() - start_time
+        accuracy = np.mean(np.sign(values) == batch.outcomes)
+        print(f"records: {len(batch)}, outcomes predicted: {accuracy:.1%}, "
+              f"time: {seconds / len(batch) * 1e6:.2f} us per position")
@@ -0,0 +1,170 @@
+# =============================================================================
+# Beetle Battle - Game Parallel Search Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Optional
+import multiprocessing
+import os
+import queue
+import random
+import time
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_engine import Game
+from game_engine import Location
+from game_search import MAX_SEARCH_DEPTH
+from game_search import WIN_SCORE
+from game_search import MoveOrdering
+from game_search import Search
+from game_search import SearchAborted
+from game_search import SearchBudget
+from game_search import SearchResult
+from game_search import evaluate
+from game_shared_table import SharedTranspositionTable
+
+# =============================================================================
+# Constants
+# =============================================================================
+HISTORY_NOISE = 1.0        # Random history scores of the helper workers stay below this
+RESULT_POLL_INTERVAL = 0.01  # Seconds between checks of the deadline while waiting
+STOP_GRACE_PERIOD = 0.5      # Seconds that stopped workers get to finish before they are terminated
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: lazy_smp_worker
+# This function is run by each worker process of lazy_smp_search. It searches
+# the position with iterative deepening, using the shared table, and puts the
+# result of every completed depth in the result queue as (worker number,
+# depth, move index, score, nodes). Worker 0 searches every depth with the
+# normal move ordering. The other workers skip the first depth if their number
+# is odd and start with random history scores, so that they search the
+# moves in a slightly different order and fill the table with other entries.
+# When the worker is done, also after an error, it puts (worker number, None,
+# None, None, nodes) in the result queue.
+# -----------------------------------------------------------------------------
+def lazy_smp_worker(worker_number, position, table, max_depth, node_limit, stop_event, result_queue) -> None:
+    search = None
+    try:
+        game = Game.from_bytes(position)
+        move_ordering = MoveOrdering()
+        if worker_number > 0:
+            rng = random.Random(worker_number)
+            for color in ("red", "blue"):
+                for index in range(len(game.board.squares)):
+                    move_ordering.history[(color, index)] = rng.random() * HISTORY_NOISE
+
+        search = Search(game, table, move_ordering, budget=SearchBudget(None, node_limit, stop_event))
+        first_depth = 1 + worker_number % 2 if worker_number > 0 else 1
+        for depth in range(first_depth, max_depth + 1):
+            try:
+                result = search.search_root(depth)
+            except SearchAborted:
+                break
+            if result.move is None:
+                break
+            move_index = result.move.row * game.board.dimension + result.move.column
+            result_queue.put((worker_number, depth, move_index, result.score, search.nodes))
+            if abs(result.score) >= WIN_SCORE - 1000:
+                break
+    finally:
+        result_queue.put((worker_number, None, None, None, 0 if search is None else search.nodes))
+
+# -----------------------------------------------------------------------------
+# Function: lazy_smp_search
+# This function searches the position of the game with several worker
+# processes (Lazy SMP). All workers search the same position and only share
+# the transposition table. The result of the deepest depth that a worker
+# completed is returned, with the nodes of all workers. The search stops
+# when the time limit is reached, when a worker completed the maximum depth
+# or when all workers are done. The node limit applies to each worker. If a
+# shared table is indicated, it is used and kept; otherwise a new table is
+# created for the search.
+# A worker that ended without its end message, e.g. because it was killed,
+# counts as done. After the search is stopped, the workers get
+# STOP_GRACE_PERIOD seconds to report and end; the ones that are still
+# running then are terminated.
+# -----------------------------------------------------------------------------
+def lazy_smp_search(game: Game, num_workers: Optional[int] = None, time_limit: Optional[float] = None,
+                    node_limit: Optional[int] = None, max_depth: int = MAX_SEARCH_DEPTH,
+                    table: Optional[SharedTranspositionTable] = None) -> SearchResult:
+    num_workers = num_workers or os.cpu_count()
+    own_table = table is None
+    if own_table:
+        table = SharedTranspositionTable()
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+
+    context = multiprocessing.get_context()
+    stop_event = context.Event()
+    result_queue = context.Queue()
+    position = game.to_bytes()
+    workers = [context.Process(target=lazy_smp_worker,
+                               args=(worker_number, position, table, max_depth, node_limit,
+                                     stop_event, result_queue),
+                               daemon=True)
+               for worker_number in range(num_workers)]
+    for worker in workers:
+        worker.start()
+
+    best = None
+    nodes = {}
+    done_workers = set()
+    ended_workers = set()
+    stop_time = None
+    try:
+        while len(done_workers) < num_workers:
+            now = time.monotonic()
+            if stop_time is None and deadline is not None and now >= deadline:
+                stop_event.set()
+                stop_time = now
+            if stop_time is not None and now >= stop_time + STOP_GRACE_PERIOD:
+                break
+            try:
+                worker_number, depth, move_index, score, worker_nodes = result_queue.get(
+                    timeout=RESULT_POLL_INTERVAL)
+            except queue.Empty:
+                # The messages of a worker that had already ended at the
+                # previous check have all been received by now.
+                done_workers.update(ended_workers)
+                ended_workers = {number for number, worker in enumerate(workers) if worker.exitcode is not None}
+                continue
+
+            nodes[worker_number] = worker_nodes
+            if depth is None:
+                done_workers.add(worker_number)
+                continue
+
+            # A deeper result replaces the best result, at the same depth the
+            # first result is kept.
+            if best is None or depth > best[0]:
+                best = (depth, move_index, score)
+            if stop_time is None and (depth >= max_depth or abs(score) >= WIN_SCORE - 1000):
+                stop_event.set()
+                stop_time = time.monotonic()
+    finally:
+        stop_event.set()
+        join_deadline = (time.monotonic() if stop_time is None else stop_time) + STOP_GRACE_PERIOD
+        for worker in workers:
+            worker.join(max(join_deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        if own_table:
+            table.close()
+
+    dimension = game.board.dimension
+    if best is None:
+        location = game.get_possible_moves()[0]
+        return SearchResult(location, evaluate(game), 0, sum(nodes.values()))
+    depth, move_index, score = best
+    return SearchResult(Location(move_index // dimension, move_index % dimension), score, depth,
+                        sum(nodes.values()))
@@ -0,0 +1,195 @@
+# =============================================================================
+# Beetle Battle - Game Perft Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Optional
+from multiprocessing import Pool
+import argparse
+import time
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_engine import Game
+from game_engine import DummyGui
+from game_engine import SimulationGame
+
+# =============================================================================
+# Constants
+# =============================================================================
+ENGINES = ["game", "simulation"]  # Engines that can be enumerated
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: get_children
+# This function takes a Game or a SimulationGame and yields for each possible
+# move the square index of the move and a copy of the game in which the move
+# is done. A game that is over has no children.
+# -----------------------------------------------------------------------------
+def get_children(game):
+    if game.get_winner() is not None:
+        return
+    if isinstance(game, SimulationGame):
+        for index in game.get_possible_moves():
+            child = game.copy()
+            child.do_move(index)
+            yield index, child
+    else:
+        dimension = game.board.dimension
+        for location in game.get_possible_moves():
+            child = game.snapshot()
+            child.do_move(location.row, location.column)
+            yield location.row * dimension + location.column, child
+
+# -----------------------------------------------------------------------------
+# Function: count_leaves
+# This function returns the number of positions that are reached from the
+# game in exactly the indicated number of moves. If a set of positions is
+# indicated, the positions (see Game.to_bytes) are added to it.
+# -----------------------------------------------------------------------------
+def count_leaves(game, depth: int, positions: Optional[set] = None) -> int:
+    if depth == 0:
+        if positions is not None:
+            positions.add(game.to_bytes())
+        return 1
+    return sum(count_leaves(child, depth - 1, positions) for _, child in get_children(game))
+
+# -----------------------------------------------------------------------------
+# Function: load_game
+# This function takes a position (see Game.to_bytes) and the name of the
+# engine and returns the game for that engine.
+# -----------------------------------------------------------------------------
+def load_game(position: bytes, engine: str):
+    game = Game.from_bytes(position)
+    return game.to_simulation() if engine == "simulation" else game
+
+# -----------------------------------------------------------------------------
+# Function: count_leaves_worker
+# This function is run by the processes of a parallel perft. It takes the
+# position, the engine, the square index of a root move, the depth and
+# whether the positions are needed and returns the square index with the
+# number of leaves and the positions below that root move.
+# -----------------------------------------------------------------------------
+def count_leaves_worker(arguments) -> tuple[int, int, Optional[set]]:
+    position, engine, index, depth, unique = arguments
+    game = load_game(position, engine)
+    if isinstance(game, SimulationGame):
+        game.do_move(index)
+    else:
+        dimension = game.board.dimension
+        game.do_move(index // dimension, index % dimension)
+    positions = set() if unique else None
+    return index, count_leaves(game, depth - 1, positions), positions
+
+# -----------------------------------------------------------------------------
+# Function: perft
+# This function takes a Game or a SimulationGame and counts the positions
+# that are reached in exactly the indicated number of moves. Optionally, the
+# number of unique positions is determined and the count is broken down per
+# root move (divide). With more than one process, the root moves are divided
+# over the processes, which always gives the divide counts.
+# -----------------------------------------------------------------------------
+def perft(game, depth: int, unique=False, divide=False, processes=1):
+    start_time = time.perf_counter()
+    positions = set() if unique else None
+    root_counts = None
+
+    if depth == 0:
+        leaves = count_leaves(game, 0, positions)
+
+    elif processes > 1:
+        engine = "simulation" if isinstance(game, SimulationGame) else "game"
+        position = game.to_bytes()
+        arguments = [(position, engine, index, depth, unique) for index, _ in get_children(game)]
+        root_counts = {}
+        with Pool(processes) as pool:
+            for index, count, child_positions in pool.imap_unordered(count_leaves_worker, arguments):
+                root_counts[index] = count
+                if positions is not None:
+                    positions.update(child_positions)
+        leaves = sum(root_counts.values())
+
+    elif divide:
+        root_counts = {}
+        for index, child in get_children(game):
+            root_counts[index] = count_leaves(child, depth - 1, positions)
+        leaves = sum(root_counts.values())
+
+    else:
+        leaves = count_leaves(game, depth, positions)
+
+    dimension = game.dimension if isinstance(game, SimulationGame) else game.board.dimension
+    if root_counts is not None:
+        root_counts = {divmod(index, dimension): count for index, count in sorted(root_counts.items())}
+
+    return PerftResult(depth, leaves, None if positions is None else len(positions),
+                       root_counts, time.perf_counter() - start_time)
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: PerftResult
+# The result of a perft: the number of leaves, optionally the number of unique
+# positions and the number of leaves per root move (row, column) and the
+# time it took in seconds.
+# -----------------------------------------------------------------------------
+class PerftResult:
+
+    # -------------------------------------------------------------------------
+    # PerftResult constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, depth, leaves, unique_positions, root_counts, seconds):
+        self.depth            = depth
+        self.leaves           = leaves
+        self.unique_positions = unique_positions
+        self.root_counts      = root_counts
+        self.seconds          = seconds
+
+    # -------------------------------------------------------------------------
+    # PerftResult method: get_nodes_per_second
+    # This method returns the number of leaves per second.
+    # -------------------------------------------------------------------------
+    def get_nodes_per_second(self) -> float:
+        return self.leaves / self.seconds if self.seconds > 0 else 0.0
+
+# =============================================================================
+# Main
+# =============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Count the positions reached in a number of moves.")
+    parser.add_argument("depth", type=int, help="number of moves")
+    parser.add_argument("--dimension", type=int, default=5, help="dimension of the empty board")
+    parser.add_argument("--position", help="start position (see Game.to_position_string)")
+    parser.add_argument("--engine", choices=ENGINES, default="game", help="engine to enumerate")
+    parser.add_argument("--unique", action="store_true", help="also count the unique positions")
+    parser.add_argument("--divide", action="store_true", help="show the count per root move")
+    parser.add_argument("--processes", type=int, default=1, help="number of processes")
+    args = parser.parse_args()
+
+    if args.position is not None:
+        game = Game.from_position_string(args.position)
+    else:
+        game = Game(args.dimension, DummyGui())
+    if args.engine == "simulation":
+        game = game.to_simulation()
+
+    result = perft(game, args.depth, args.unique, args.divide, args.processes)
+
+    if args.divide and result.root_counts is not None:
+        for (row, column), count in result.root_counts.items():
+            print(f"{row},{column}: {count}")
+    print(f"depth: {result.depth}")
+    print(f"leaves: {result.leaves}")
+    if result.unique_positions is not None:
+        print(f"unique positions: {result.unique_positions}")
+    print(f"time: {result.seconds:.3f} s ({result.get_nodes_per_second():.0f} nodes/s)")
@@ -0,0 +1,1032 @@
+# =============================================================================
+# Beetle Battle - Game Search Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Optional
+import random
+import threading
+import time
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_engine import Game
+from game_engine import Location
+from game_engine import get_heuristic_fingerprint
+
+# =============================================================================
+# Constants
+# =============================================================================
+WIN_SCORE = 10000       # Score of a won position (see calculate_board_value)
+INFINITE_SCORE = 1000000  # Bound that is larger than any possible score
+
+EXACT_BOUND = 0  # The stored score is the exact value of the position
+LOWER_BOUND = 1  # The stored score is a lower bound (fail high)
+UPPER_BOUND = 2  # The stored score is an upper bound (fail low)
+
+ZOBRIST_SEED = 20231101  # Fixed seed so hashes are equal across processes
+COLORS = ["red", "blue"]
+
+# Move ordering scores. The sources are tried in this order.
+TT_MOVE_SCORE = 4000000
+KILLER_MOVE_SCORE = 3000000
+CASCADE_MOVE_SCORE = 2000000
+NUM_KILLER_MOVES = 2
+
+# Limits of the quiescence search at the leaves of the search.
+MAX_QUIESCENCE_DEPTH = 8    # Maximum number of cascade plies per leaf
+MAX_QUIESCENCE_NODES = 200  # Maximum number of nodes per leaf
+
+# Limits of the search for forced wins and losses.
+MATE_SEARCH_MAX_PLIES = 4       # Maximum length of a forced win or loss
+MATE_SEARCH_MAX_NODES = 2000    # Maximum number of nodes per search
+MATE_SEARCH_MAX_SQUARES = 4     # Endgame when a player has at most this many squares
+
+MAX_SEARCH_DEPTH = 64  # Maximum depth of a search with a budget
+
+# =============================================================================
+# Global Variables
+# =============================================================================
+zobrist_keys = {}  # Zobrist keys per board dimension
+default_evaluator = None  # Evaluator of the searches that are not given one (see set_default_evaluator)
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: get_opponent
+# This function returns the color of the opponent of the indicated player.
+# -----------------------------------------------------------------------------
+def get_opponent(color: str) -> str:
+    return "blue" if color == "red" else "red"
+
+# -----------------------------------------------------------------------------
+# Function: get_zobrist_keys
+# This function returns the Zobrist keys for the indicated dimension. There is
+# a key for every square, color and number of beetles and one key for the turn.
+# The keys are generated once with a fixed seed.
+# -----------------------------------------------------------------------------
+def get_zobrist_keys(dimension: int) -> tuple[list[int], int]:
+    if dimension not in zobrist_keys:
+        generator = random.Random(ZOBRIST_SEED + dimension)
+        square_keys = [generator.getrandbits(64) for _ in range(dimension * dimension * len(COLORS) * 5)]
+        zobrist_keys[dimension] = (square_keys, generator.getrandbits(64))
+    return zobrist_keys[dimension]
+
+# -----------------------------------------------------------------------------
+# Function: get_position_hash
+# This function returns the 64-bit Zobrist hash of the position of the game,
+# i.e. the number of beetles and their color on each square and the turn.
+# -----------------------------------------------------------------------------
+def get_position_hash(game: Game) -> int:
+    square_keys, turn_key = get_zobrist_keys(game.board.dimension)
+    position_hash = turn_key if game.turn == "blue" else 0
+    for index, square in enumerate(game.board.squares):
+        num_beetles = len(square.beetles)
+        if num_beetles > 0:
+            color_index = COLORS.index(square.beetles[0].color)
+            position_hash ^= square_keys[(index * len(COLORS) + color_index) * 5 + num_beetles]
+    return position_hash
+
+# -----------------------------------------------------------------------------
+# Function: get_move_index
+# This function returns the index of the square of the move on the board.
+# This index is used to identify a move in the search tables.
+# -----------------------------------------------------------------------------
+def get_move_index(game: Game, location: Location) -> int:
+    return location.row * game.board.dimension + location.column
+
+# -----------------------------------------------------------------------------
+# Function: get_child
+# This function returns a copy of the game in which the move is done.
+# -----------------------------------------------------------------------------
+def get_child(game: Game, location: Location) -> Game:
+    child = game.snapshot()
+    child.do_move(location.row, location.column)
+    return child
+
+# -----------------------------------------------------------------------------
+# Function: is_endgame
+# This function returns whether one of the players holds so few squares that
+# a forced win or loss is likely. Like in Game.get_winner, the number of
+# beetles is used instead of the number of moves, since a game that is
+# restored from its position has no moves.
+# -----------------------------------------------------------------------------
+def is_endgame(game: Game) -> bool:
+    if game.board.num_beetles < 3:
+        return False
+    return min(len(game.board.get_squares_by_color(color)) for color in COLORS) <= MATE_SEARCH_MAX_SQUARES
+
+# -----------------------------------------------------------------------------
+# Function: is_cascade_move
+# This function returns whether a move of the current turn at the location
+# fills a critical square and therefore starts a cascade.
+# -----------------------------------------------------------------------------
+def is_cascade_move(game: Game, location: Location) -> bool:
+    square = game.board.get_square_by_location(location.row, location.column)
+    return square.color == game.turn and square.is_critical
+
+# -----------------------------------------------------------------------------
+# Function: is_quiet
+# This function returns whether the position is quiet, i.e. there are no
+# critical squares of opposite colors next to each other. In that case the
+# next move cannot set off a cascade that flips the squares of the opponent.
+# -----------------------------------------------------------------------------
+def is_quiet(game: Game) -> bool:
+    board = game.board
+    for square in board.squares:
+        if square.is_empty or not square.is_critical:
+            continue
+        for neighbor_location in square.neighbors:
+            neighbor = board.get_square_by_location(neighbor_location.row, neighbor_location.column)
+            if not neighbor.is_empty and neighbor.is_critical and neighbor.color != square.color:
+                return False
+    return True
+
+# -----------------------------------------------------------------------------
+# Function: get_cascade_moves
+# This function returns the moves of the current turn that start a cascade.
+# -----------------------------------------------------------------------------
+def get_cascade_moves(game: Game) -> list[Location]:
+    return [square.location for square in game.board.get_squares_by_color(game.turn) if square.is_critical]
+
+# -----------------------------------------------------------------------------
+# Function: evaluate
+# This function returns the static value of the position from the point of
+# view of the player to move. The heuristic in calculate_board_value is meant
+# for the player that just moved, so its value is negated.
+# -----------------------------------------------------------------------------
+def evaluate(game: Game) -> int:
+    return -game.calculate_board_value(get_opponent(game.turn))
+
+# -----------------------------------------------------------------------------
+# Function: set_default_evaluator
+# This function sets the evaluator of the searches that are not given one,
+# for example a learned evaluation that is loaded at startup. With None,
+# the heuristic of calculate_board_value is used again.
+# -----------------------------------------------------------------------------
+def set_default_evaluator(evaluator) -> None:
+    global default_evaluator
+    default_evaluator = evaluator
+
+# -----------------------------------------------------------------------------
+# Function: get_evaluator_fingerprint
+# This function returns the fingerprint of the evaluator of the searches
+# that are not given one (see Evaluator.fingerprint).
+# -----------------------------------------------------------------------------
+def get_evaluator_fingerprint() -> int:
+    return (default_evaluator if default_evaluator is not None else Evaluator()).fingerprint()
+
+# -----------------------------------------------------------------------------
+# Function: score_to_table
+# This function converts a win or loss score relative to the root into a
+# score relative to the current position so it can be stored in the table.
+# -----------------------------------------------------------------------------
+def score_to_table(score: int, ply: int) -> int:
+    if score >= WIN_SCORE - 1000:
+        return score + ply
+    if score <= -WIN_SCORE + 1000:
+        return score - ply
+    return score
+
+# -----------------------------------------------------------------------------
+# Function: score_from_table
+# This function converts a stored win or loss score back into a score
+# relative to the root.
+# -----------------------------------------------------------------------------
+def score_from_table(score: int, ply: int) -> int:
+    if score >= WIN_SCORE - 1000:
+        return score - ply
+    if score <= -WIN_SCORE + 1000:
+        return score + ply
+    return score
+
+# -----------------------------------------------------------------------------
+# Function: search_best_move
+# This function returns the best move for the game that is found within the
+# indicated time (in seconds) and number of nodes. First, at most half of the
+# budget is used to look for a forced win or loss. The rest is used for an
+# iterative deepening search. When the budget runs out, the best move found
+# so far is returned. The search tables of an earlier search can be passed
+# to reuse them and setting the stop event ends the search early. Without an
+# evaluator, the default evaluator is used.
+# -----------------------------------------------------------------------------
+def search_best_move(game: Game, time_limit: Optional[float] = None, node_limit: Optional[int] = None,
+                     tables=None, stop_event: Optional[threading.Event] = None, evaluator=None) -> Location:
+    if tables is None:
+        tables = SearchTables()
+    start_time = time.monotonic()
+
+    mate_search = MateSearch(game, tables=tables,
+                             budget=SearchBudget(None if time_limit is None else time_limit / 2,
+                                                 None if node_limit is None else node_limit // 2,
+                                                 stop_event))
+    forced_result = mate_search.search()
+    if forced_result is not None:
+        return forced_result.move
+
+    budget = SearchBudget(None if time_limit is None else time_limit - (time.monotonic() - start_time),
+                          None if node_limit is None else node_limit - mate_search.nodes,
+                          stop_event)
+    search = Search(game, tables.transposition_table, tables.move_ordering, budget=budget, evaluator=evaluator)
+    return search.search(MAX_SEARCH_DEPTH).move
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: Evaluator
+# An evaluator returns the static value of positions from the point of view
+# of the player to move. This evaluator uses the heuristic of
+# calculate_board_value. Other evaluators, such as a learned evaluation,
+# implement the same methods. An evaluator that is batched evaluates many
+# positions faster together than each position on its own; the search then
+# evaluates the children of a node at the leaves together (see
+# Search.get_children).
+# -----------------------------------------------------------------------------
+class Evaluator:
+    batched = False
+
+    # -------------------------------------------------------------------------
+    # Evaluator method: evaluate
+    # -------------------------------------------------------------------------
+    def evaluate(self, game: Game) -> int:
+        return evaluate(game)
+
+    # -------------------------------------------------------------------------
+    # Evaluator method: evaluate_batch
+    # -------------------------------------------------------------------------
+    def evaluate_batch(self, games: list[Game]) -> list[int]:
+        return [self.evaluate(game) for game in games]
+
+    # -------------------------------------------------------------------------
+    # Evaluator method: evaluate_moves
+    # This method returns the values of the positions after each of the
+    # moves, from the point of view of the player to move after the move.
+    # The values of positions that are won are not used.
+    # -------------------------------------------------------------------------
+    def evaluate_moves(self, game: Game, moves: list[Location]) -> list[int]:
+        return self.evaluate_batch([get_child(game, location) for location in moves])
+
+    # -------------------------------------------------------------------------
+    # Evaluator method: fingerprint
+    # This method returns a number that identifies the values of the
+    # evaluator, so that stored scores of another evaluation can be
+    # recognized (see game_cache.PositionCache). For the heuristic, it
+    # depends on the weights in use.
+    # -------------------------------------------------------------------------
+    def fingerprint(self) -> int:
+        return get_heuristic_fingerprint()
+
+# -----------------------------------------------------------------------------
+# Class: SearchAborted
+# This exception is raised when a search runs out of its budget.
+# -----------------------------------------------------------------------------
+class SearchAborted(Exception):
+    pass
+
+# -----------------------------------------------------------------------------
+# Class: SearchBudget
+# A search budget limits a search in time (in seconds) and in number of
+# nodes. A search can also be stopped from another thread with the stop
+# event. Each limit is optional.
+# -----------------------------------------------------------------------------
+class SearchBudget:
+
+    # -------------------------------------------------------------------------
+    # SearchBudget constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, time_limit: Optional[float] = None, max_nodes: Optional[int] = None,
+                 stop_event: Optional[threading.Event] = None):
+        self.deadline = None if time_limit is None else time.monotonic() + time_limit
+        self.max_nodes = max_nodes
+        self.stop_event = stop_event
+        self.nodes = 0
+
+    # -------------------------------------------------------------------------
+    # SearchBudget method: count_node
+    # This method counts a node and raises SearchAborted when the budget is
+    # used up.
+    # -------------------------------------------------------------------------
+    def count_node(self) -> None:
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchAborted()
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SearchAborted()
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchAborted()
+
+# -----------------------------------------------------------------------------
+# Class: TableEntry
+# A table entry stores the result of searching a position: the depth of the
+# search, the score, the kind of bound and the index of the best move.
+# -----------------------------------------------------------------------------
+class TableEntry:
+
+    # -------------------------------------------------------------------------
+    def __init__(self, depth, score, bound, best_move):
+        self.depth     = depth
+        self.score     = score
+        self.bound     = bound
+        self.best_move = best_move
+
+# -----------------------------------------------------------------------------
+# Class: TranspositionTable
+# The transposition table stores table entries by position hash so that a
+# position that is reached again does not have to be searched again.
+# Optionally, the table is backed by a position cache (see game_cache): the
+# entries that are not in the table are looked up in the cache and stored
+# entries are also stored in the cache, so that later runs start warm.
+# -----------------------------------------------------------------------------
+class TranspositionTable:
+
+    # -------------------------------------------------------------------------
+    # TranspositionTable constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, max_entries=1000000, cache=None):
+        self.max_entries = max_entries
+        self.entries = {}
+        self.cache = cache
+
+    # -------------------------------------------------------------------------
+    # TranspositionTable method: probe
+    # This method takes a position hash and returns the stored entry or None.
+    # -------------------------------------------------------------------------
+    def probe(self, position_hash) -> Optional[TableEntry]:
+        entry = self.entries.get(position_hash)
+        if entry is None and self.cache is not None:
+            cache_entry = self.cache.probe(position_hash)
+            if cache_entry is not None:
+                entry = TableEntry(cache_entry.depth, cache_entry.score, cache_entry.bound, cache_entry.best_move)
+                self.entries[position_hash] = entry
+        return entry
+
+    # -------------------------------------------------------------------------
+    # TranspositionTable method: store
+    # This method stores an entry for the position. An existing entry is only
+    # replaced by the result of a search that is at least as deep. When the
+    # table is full, it is cleared.
+    # -------------------------------------------------------------------------
+    def store(self, position_hash, depth, score, bound, best_move) -> None:
+        entry = self.entries.get(position_hash)
+        if entry is not None and entry.depth > depth:
+            return
+        if entry is None and len(self.entries) >= self.max_entries:
+            self.entries.clear()
+        self.entries[position_hash] = TableEntry(depth, score, bound, best_move)
+        if self.cache is not None:
+            self.cache.store_search(position_hash, depth, score, bound, best_move)
+
+    # -------------------------------------------------------------------------
+    # TranspositionTable method: clear
+    # -------------------------------------------------------------------------
+    def clear(self) -> None:
+        self.entries.clear()
+
+# -----------------------------------------------------------------------------
+# Class: MoveOrdering
+# The move ordering ranks the possible moves so that the moves that are most
+# likely to be best are searched first. The sources are, in order: the best
+# move from the transposition table, the killer moves of the ply, moves that
+# start a cascade and the history table that is updated on cutoffs. The
+# killer moves come before the cascades, since most positions have several
+# cascade moves and the one that caused a cutoff in a sibling is more
+# likely to cause one again.
+# -----------------------------------------------------------------------------
+class MoveOrdering:
+
+    # -------------------------------------------------------------------------
+    # MoveOrdering constructor
+    # -------------------------------------------------------------------------
+    def __init__(self):
+        self.killer_moves = []
+        self.history = {}
+
+    # -------------------------------------------------------------------------
+    # MoveOrdering method: clear
+    # This method forgets the killer moves and the history.
+    # -------------------------------------------------------------------------
+    def clear(self) -> None:
+        self.killer_moves = []
+        self.history = {}
+
+    # -------------------------------------------------------------------------
+    # MoveOrdering method: get_killer_moves
+    # This method returns the list of killer moves of the indicated ply.
+    # -------------------------------------------------------------------------
+    def get_killer_moves(self, ply) -> list[int]:
+        while len(self.killer_moves) <= ply:
+            self.killer_moves.append([])
+        return self.killer_moves[ply]
+
+    # -------------------------------------------------------------------------
+    # MoveOrdering method: get_move_score
+    # This method returns the ordering score of a move. Moves with a higher
+    # score are searched first.
+    # -------------------------------------------------------------------------
+    def get_move_score(self, game, location, ply, tt_move) -> int:
+        move_index = get_move_index(game, location)
+
+        if move_index == tt_move:
+            return TT_MOVE_SCORE
+
+        killer_moves = self.get_killer_moves(ply)
+        if move_index in killer_moves:
+            return KILLER_MOVE_SCORE - killer_moves.index(move_index)
+
+        # Prefer the cascades that reach the most squares of the opponent.
+        if is_cascade_move(game, location):
+            square = game.board.get_square_by_location(location.row, location.column)
+            opponent = get_opponent(game.turn)
+            captures = sum(1 for neighbor in square.neighbors
+                           if game.board.get_square_by_location(neighbor.row, neighbor.column).color == opponent)
+            return CASCADE_MOVE_SCORE + captures
+
+        return self.history.get((game.turn, move_index), 0)
+
+    # -------------------------------------------------------------------------
+    # MoveOrdering method: order_moves
+    # This method takes the possible moves and returns them sorted on their
+    # ordering score. Moves with the same score keep their original order.
+    # -------------------------------------------------------------------------
+    def order_moves(self, game, moves, ply, tt_move=None) -> list[Location]:
+        return sorted(moves, key=lambda location: -self.get_move_score(game, location, ply, tt_move))
+
+    # -------------------------------------------------------------------------
+    # MoveOrdering method: update_cutoff
+    # This method is called when a move caused a beta cutoff. The move becomes
+    # a killer move of the ply and its history score is increased.
+    # -------------------------------------------------------------------------
+    def update_cutoff(self, game, location, ply, depth) -> None:
+        move_index = get_move_index(game, location)
+        killer_moves = self.get_killer_moves(ply)
+        if move_index in killer_moves:
+            killer_moves.remove(move_index)
+        killer_moves.insert(0, move_index)
+        del killer_moves[NUM_KILLER_MOVES:]
+
+        key = (game.turn, move_index)
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+# -----------------------------------------------------------------------------
+# Class: SearchResult
+# A search result has the best move that was found, its score from the point
+# of view of the player to move, the depth that was searched and the number
+# of nodes that were visited.
+# -----------------------------------------------------------------------------
+class SearchResult:
+
+    # -------------------------------------------------------------------------
+    def __init__(self, move, score, depth, nodes):
+        self.move  = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+
+# -----------------------------------------------------------------------------
+# Class: Search
+# The search performs an alpha-beta search of the game tree from the position
+# of a game. Children are created with Game.snapshot so the game itself is
+# never changed. Without move ordering, the moves are searched in the order
+# of Game.get_possible_moves. Unless disabled, the leaves are extended with a
+# quiescence search over the cascades that are about to happen. With a
+# budget, the search is aborted when the budget runs out.
+# -----------------------------------------------------------------------------
+class Search:
+
+    # -------------------------------------------------------------------------
+    # Search constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, game: Game,
+                 transposition_table: TranspositionTable = None,
+                 move_ordering: Optional[MoveOrdering] = None,
+                 use_move_ordering: bool = True,
+                 use_quiescence: bool = True,
+                 max_quiescence_depth: int = MAX_QUIESCENCE_DEPTH,
+                 max_quiescence_nodes: int = MAX_QUIESCENCE_NODES,
+                 budget: Optional[SearchBudget] = None,
+                 evaluator: Optional[Evaluator] = None):
+        self.game = game
+        self.budget = budget
+        if evaluator is None:
+            evaluator = default_evaluator if default_evaluator is not None else Evaluator()
+        self.evaluator = evaluator
+        self.leaf_values = {}  # Values of the children that are searched, by id of the child
+        self.transposition_table = transposition_table if transposition_table is not None else TranspositionTable()
+        self.move_ordering = None
+        if use_move_ordering:
+            self.move_ordering = move_ordering if move_ordering is not None else MoveOrdering()
+        self.use_quiescence = use_quiescence
+        self.max_quiescence_depth = max_quiescence_depth
+        self.max_quiescence_nodes = max_quiescence_nodes
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.leaf_quiescence_nodes = 0
+        self.root_best_move = None
+        self.root_best_score = None
+
+    # -------------------------------------------------------------------------
+    # Search method: get_ordered_moves
+    # This method returns the possible moves of the game in search order.
+    # -------------------------------------------------------------------------
+    def get_ordered_moves(self, game, ply, tt_move) -> list[Location]:
+        moves = game.get_possible_moves()
+        if self.move_ordering is None:
+            return moves
+        return self.move_ordering.order_moves(game, moves, ply, tt_move)
+
+    # -------------------------------------------------------------------------
+    # Search method: get_children
+    # This method yields the moves with the positions after the moves. Each
+    # child is made when it is searched. If the children are leaves and the
+    # evaluator is batched, their values are computed before the children are
+    # made, so that the value of each child is ready when it is needed. The
+    # first move often causes a cutoff, so it is evaluated on its own; the
+    # other moves are evaluated in one call when the second child is needed.
+    # The value of a child is forgotten when the next child is made or when
+    # the search of the node ends, as its id can then be used again.
+    # -------------------------------------------------------------------------
+    def get_children(self, game, moves, leaves):
+        if not leaves or not self.evaluator.batched:
+            for location in moves:
+                yield location, get_child(game, location)
+            return
+
+        for chunk in (moves[:1], moves[1:]):
+            if len(chunk) == 0:
+                continue
+            for location, value in zip(chunk, self.evaluator.evaluate_moves(game, chunk)):
+                child = get_child(game, location)
+                self.leaf_values[id(child)] = value
+                try:
+                    yield location, child
+                finally:
+                    self.leaf_values.pop(id(child), None)
+
+    # -------------------------------------------------------------------------
+    # Search method: evaluate
+    # This method returns the static value of the position from the point of
+    # view of the player to move.
+    # -------------------------------------------------------------------------
+    def evaluate(self, game) -> int:
+        value = self.leaf_values.pop(id(game), None)
+        return value if value is not None else self.evaluator.evaluate(game)
+
+    # -------------------------------------------------------------------------
+    # Search method: count_node
+    # This method counts a node, also in the budget if there is one.
+    # -------------------------------------------------------------------------
+    def count_node(self) -> None:
+        self.nodes += 1
+        if self.budget is not None:
+            self.budget.count_node()
+
+    # -------------------------------------------------------------------------
+    # Search method: search
+    # This method performs an iterative deepening search up to the indicated
+    # depth and returns the result of the deepest iteration. The deepening
+    # stops when a win or loss is found. When the budget runs out during an
+    # iteration, the best move of that iteration is used if at least one move
+    # was searched, since the best move of the previous iteration is searched
+    # first. Otherwise the result of the previous iteration is returned or,
+    # if there is none, the first move in search order.
+    # -------------------------------------------------------------------------
+    def search(self, depth) -> SearchResult:
+        result = None
+        for iteration_depth in range(1, depth + 1):
+            try:
+                result = self.search_root(iteration_depth)
+            except SearchAborted:
+                if self.root_best_move is not None:
+                    result = SearchResult(self.root_best_move, self.root_best_score, iteration_depth, self.nodes)
+                break
+
+            if result.move is None or abs(result.score) >= WIN_SCORE - 1000:
+                break
+
+        if result is None:
+            moves = self.get_ordered_moves(self.game, 0, None)
+            result = SearchResult(moves[0], self.evaluate(self.game), 0, self.nodes)
+
+        return result
+
+    # -------------------------------------------------------------------------
+    # Search method: search_root
+    # This method searches the root position to the indicated depth and
+    # returns the best move.
+    # -------------------------------------------------------------------------
+    def search_root(self, depth) -> SearchResult:
+        game = self.game
+
+        # There are no moves if the game is over.
+        if game.get_winner() is not None:
+            return SearchResult(None, self.evaluate(game), depth, self.nodes)
+
+        self.leaf_values.clear()
+        position_hash = get_position_hash(game)
+        entry = self.transposition_table.probe(position_hash)
+        tt_move = entry.best_move if entry is not None else None
+
+        alpha = -INFINITE_SCORE
+        best_move = None
+        self.root_best_move = None
+        for location, child in self.get_children(game, self.get_ordered_moves(game, 0, tt_move), depth == 1):
+            score = -self.alpha_beta(child, depth - 1, -INFINITE_SCORE, -alpha, 1)
+            if best_move is None or score > alpha:
+                alpha = score
+                best_move = location
+                self.root_best_move = best_move
+                self.root_best_score = alpha
+
+        self.transposition_table.store(position_hash, depth, alpha, EXACT_BOUND,
+                                       get_move_index(game, best_move))
+        return SearchResult(best_move, alpha, depth, self.nodes)
+
+    # -------------------------------------------------------------------------
+    # Search method: alpha_beta
+    # This method returns the score of the position from the point of view of
+    # the player to move, searched to the indicated depth within the window
+    # defined by alpha and beta. A won position scores higher the fewer
+    # plies are needed.
+    # -------------------------------------------------------------------------
+    def alpha_beta(self, game, depth, alpha, beta, ply) -> int:
+        self.count_node()
+
+        # The winner is always the player that just moved.
+        winner = game.get_winner()
+        if winner is not None:
+            return WIN_SCORE - ply if winner == game.turn else -(WIN_SCORE - ply)
+
+        if depth <= 0:
+            if not self.use_quiescence:
+                return self.evaluate(game)
+            self.leaf_quiescence_nodes = 0
+            return self.quiescence(game, alpha, beta, ply, 0)
+
+        # Check the transposition table.
+        position_hash = get_position_hash(game)
+        entry = self.transposition_table.probe(position_hash)
+        tt_move = None
+        if entry is not None:
+            tt_move = entry.best_move
+            if entry.depth >= depth:
+                score = score_from_table(entry.score, ply)
+                if entry.bound == EXACT_BOUND:
+                    return score
+                if entry.bound == LOWER_BOUND and score >= beta:
+                    return score
+                if entry.bound == UPPER_BOUND and score <= alpha:
+                    return score
+
+        original_alpha = alpha
+        best_score = -INFINITE_SCORE
+        best_move = None
+
+        children = self.get_children(game, self.get_ordered_moves(game, ply, tt_move), depth == 1)
+        for location, child in children:
+            score = -self.alpha_beta(child, depth - 1, -beta, -alpha, ply + 1)
+
+            if score > best_score:
+                best_score = score
+                best_move = get_move_index(game, location)
+
+            if score > alpha:
+                alpha = score
+
+            # The opponent will avoid this position.
+            if alpha >= beta:
+                if self.move_ordering is not None:
+                    self.move_ordering.update_cutoff(game, location, ply, depth)
+                break
+        children.close()
+
+        if best_score <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT_BOUND
+        self.transposition_table.store(position_hash, depth, score_to_table(best_score, ply), bound, best_move)
+
+        return best_score
+
+    # -------------------------------------------------------------------------
+    # Search method: quiescence
+    # This method returns the score of a leaf position. As long as the
+    # position is not quiet, only the moves that start a cascade are searched.
+    # The player to move may also keep the static value of the position
+    # ("stand pat"). The search is limited in depth and in number of nodes per
+    # leaf; when a limit is reached, the static value is returned.
+    # -------------------------------------------------------------------------
+    def quiescence(self, game, alpha, beta, ply, quiescence_depth) -> int:
+        self.count_node()
+        self.quiescence_nodes += 1
+        self.leaf_quiescence_nodes += 1
+
+        winner = game.get_winner()
+        if winner is not None:
+            return WIN_SCORE - ply if winner == game.turn else -(WIN_SCORE - ply)
+
+        if is_quiet(game):
+            return self.evaluate(game)
+
+        stand_pat = self.evaluate(game)
+
+        if (quiescence_depth >= self.max_quiescence_depth or
+                self.leaf_quiescence_nodes >= self.max_quiescence_nodes):
+            return stand_pat
+
+        if stand_pat >= beta:
+            return stand_pat
+
+        best_score = stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        moves = get_cascade_moves(game)
+        if self.move_ordering is not None:
+            moves = self.move_ordering.order_moves(game, moves, ply)
+
+        children = self.get_children(game, moves, True)
+        for _, child in children:
+            score = -self.quiescence(child, -beta, -alpha, ply + 1, quiescence_depth + 1)
+
+            if score > best_score:
+                best_score = score
+
+            if score > alpha:
+                alpha = score
+
+            if alpha >= beta:
+                break
+        children.close()
+
+        return best_score
+
+# -----------------------------------------------------------------------------
+# Class: ForcedResult
+# A forced result has the move to play, the color of the player that wins by
+# force and the number of plies, including the move, until the game is won.
+# -----------------------------------------------------------------------------
+class ForcedResult:
+
+    # -------------------------------------------------------------------------
+    def __init__(self, move, winner, plies):
+        self.move   = move
+        self.winner = winner
+        self.plies  = plies
+
+# -----------------------------------------------------------------------------
+# Class: SearchTables
+# The search tables hold the results that stay valid from one search to the
+# next, so that a later search can start with warm tables: the transposition
+# table, the move ordering and the results of the mate search, which are
+# stored by position hash and number of plies.
+# -----------------------------------------------------------------------------
+class SearchTables:
+
+    # -------------------------------------------------------------------------
+    def __init__(self):
+        self.transposition_table = TranspositionTable()
+        self.move_ordering       = MoveOrdering()
+        self.mate_wins           = {}
+        self.mate_losses         = {}
+
+# -----------------------------------------------------------------------------
+# Class: MateSearch
+# The mate search proves forced wins and forced losses of the player to move
+# within a number of plies. A win in N plies exists if there is a move that
+# wins or after which every reply allows a win in N-2 plies. The last move of
+# a win must start a cascade, so only those moves are tried there. Proven
+# results are stored by position hash and number of plies, in the search
+# tables if these are given.
+# -----------------------------------------------------------------------------
+class MateSearch:
+
+    # -------------------------------------------------------------------------
+    # MateSearch constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, game: Game,
+                 max_plies: int = MATE_SEARCH_MAX_PLIES,
+                 max_nodes: int = MATE_SEARCH_MAX_NODES,
+                 tables: SearchTables = None,
+                 budget: Optional[SearchBudget] = None):
+        self.game = game
+        self.budget = budget
+        self.max_plies = max_plies
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.wins = tables.mate_wins if tables is not None else {}
+        self.losses = tables.mate_losses if tables is not None else {}
+
+    # -------------------------------------------------------------------------
+    # MateSearch method: search
+    # This method looks for a forced win or loss of the player to move, the
+    # shortest first. In case of a loss, the move that delays it the most is
+    # returned. If nothing is proven within the budget, or the game is not in
+    # the endgame, None is returned.
+    # -------------------------------------------------------------------------
+    def search(self) -> Optional[ForcedResult]:
+        game = self.game
+        if game.get_winner() is not None or not is_endgame(game):
+            return None
+
+        try:
+            for plies in range(1, self.max_plies + 1):
+                if plies % 2 == 1:
+                    move = self.find_win(game, plies)
+                    if move is not None:
+                        return ForcedResult(move, game.turn, plies)
+                elif self.is_lost(game, plies):
+                    return self.get_delaying_move(plies)
+        except SearchAborted:
+            pass
+
+        return None
+
+    # -------------------------------------------------------------------------
+    # MateSearch method: get_delaying_move
+    # This method is called when the player to move is lost within the
+    # indicated number of plies. It returns the move after which the opponent
+    # needs the most plies to win.
+    # -------------------------------------------------------------------------
+    def get_delaying_move(self, plies) -> ForcedResult:
+        game = self.game
+        best_move = None
+        best_plies = 0
+        for location in game.get_possible_moves():
+            child = get_child(game, location)
+            for win_plies in range(1, plies, 2):
+                if self.find_win(child, win_plies) is not None:
+                    break
+            if win_plies > best_plies:
+                best_move = location
+                best_plies = win_plies
+        return ForcedResult(best_move, get_opponent(game.turn), best_plies + 1)
+
+    # -------------------------------------------------------------------------
+    # MateSearch method: count_node
+    # This method counts a node and aborts the search when the budget is used.
+    # -------------------------------------------------------------------------
+    def count_node(self) -> None:
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise SearchAborted()
+        if self.budget is not None:
+            self.budget.count_node()
+
+    # -------------------------------------------------------------------------
+    # MateSearch method: get_moves
+    # This method returns the moves of the game with the cascades first.
+    # -------------------------------------------------------------------------
+    def get_moves(self, game) -> list[Location]:
+        moves = game.get_possible_moves()
+        return sorted(moves, key=lambda location: not is_cascade_move(game, location))
+
+    # -------------------------------------------------------------------------
+    # MateSearch method: find_win
+    # This method returns a move with which the player to move wins within the
+    # indicated number of plies, or None if there is no such move.
+    # -------------------------------------------------------------------------
+    def find_win(self, game, plies) -> Optional[Location]:
+        if plies <= 0:
+            return None
+
+        key = (get_position_hash(game), plies)
+        if key in self.wins:
+            move_index = self.wins[key]
+            if move_index is None:
+                return None
+            return game.board.squares[move_index].location
+
+        self.count_node()
+
+        moves = get_cascade_moves(game) if plies < 3 else self.get_moves(game)
+        winning_move = None
+        for location in moves:
+            child = get_child(game, location)
+            winner = child.get_winner()
+            if winner == game.turn or (winner is None and plies >= 3 and self.is_lost(child, plies - 1)):
+                winning_move = location
+                break
+
+        self.wins[key] = None if winning_move is None else get_move_index(game, winning_move)
+        return winning_move
+
+    # -------------------------------------------------------------------------
+    # MateSearch method: is_lost
+    # This method returns whether the opponent wins within the indicated
+    # number of plies whatever the player to move does.
+    # -------------------------------------------------------------------------
+    def is_lost(self, game, plies) -> bool:
+        if plies < 2:
+            return False
+
+        key = (get_position_hash(game), plies)
+        if key in self.losses:
+            return self.losses[key]
+
+        self.count_node()
+
+        lost = True
+        for location in self.get_moves(game):
+            child = get_child(game, location)
+            if child.get_winner() == game.turn or self.find_win(child, plies - 1) is None:
+                lost = False
+                break
+
+        self.losses[key] = lost
+        return lost
+
+# -----------------------------------------------------------------------------
+# Class: Ponderer
+# The ponderer uses the time in which the opponent thinks. In a background
+# thread it determines the likely replies of the opponent and for each of
+# them the best move of the computer, which is stored by position hash. When
+# the opponent moves, a stored move is played right away. Otherwise, the
+# move is determined with the warm search tables of the ponderer. The moves
+# are searched with the time and node limits of the ponderer.
+# The ponderer works on a snapshot of the game, so the game itself can be
+# changed while pondering.
+# -----------------------------------------------------------------------------
+class Ponderer:
+
+    # -------------------------------------------------------------------------
+    # Ponderer constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, time_limit: Optional[float] = None, node_limit: Optional[int] = None):
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.tables = SearchTables()
+        self.best_moves = {}
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    # -------------------------------------------------------------------------
+    # Ponderer method: start
+    # This method starts pondering on the game, in which it is the turn of
+    # the opponent.
+    # -------------------------------------------------------------------------
+    def start(self, game) -> None:
+        self.stop()
+        self.best_moves = {}
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.ponder, args=(game.snapshot(),), daemon=True)
+        self.thread.start()
+
+    # -------------------------------------------------------------------------
+    # Ponderer method: stop
+    # This method stops pondering and waits until the thread is finished.
+    # The search that is running is aborted.
+    # -------------------------------------------------------------------------
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    # -------------------------------------------------------------------------
+    # Ponderer method: get_best_move
+    # This method stops pondering and returns the best move for the game.
+    # -------------------------------------------------------------------------
+    def get_best_move(self, game) -> Location:
+        self.stop()
+        best_move = self.best_moves.get(get_position_hash(game))
+        if best_move is not None:
+            return best_move
+        return game.get_best_move(self.time_limit, self.node_limit, self.tables)
+
+    # -------------------------------------------------------------------------
+    # Ponderer method: get_likely_replies
+    # This method returns the positions after the moves of the opponent, the
+    # best moves according to the heuristic first.
+    # -------------------------------------------------------------------------
+    def get_likely_replies(self, game) -> list[Game]:
+        children = [get_child(game, location) for location in game.get_possible_moves()]
+        return sorted(children, key=lambda child: -child.calculate_board_value(game.turn))
+
+    # -------------------------------------------------------------------------
+    # Ponderer method: ponder
+    # This method runs in the background thread. It stores the best move for
+    # each likely reply until all replies are done or it is stopped. The move
+    # of a search that was stopped is not stored.
+    # -------------------------------------------------------------------------
+    def ponder(self, game) -> None:
+        for child in self.get_likely_replies(game):
+            if self.stop_event.is_set():
+                return
+            if child.get_winner() is None:
+                best_move = child.get_best_move(self.time_limit, self.node_limit, self.tables, self.stop_event)
+                if not self.stop_event.is_set():
+                    self.best_moves[get_position_hash(child)] = best_move
+
+# =============================================================================
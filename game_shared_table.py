@@ -0,0 +1,161 @@
+# =============================================================================
+# Beetle Battle - Game Shared Table Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Optional
+from multiprocessing import shared_memory
+import struct
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_search import TableEntry
+
+# =============================================================================
+# Constants
+# =============================================================================
+ENTRY_FORMAT = struct.Struct("<QQQ")  # position hash, data, check (hash XOR data)
+ENTRY_SIZE = ENTRY_FORMAT.size
+BUCKET_SIZE = 2  # Per bucket: an entry that keeps the deepest search and one that is always replaced
+
+DEFAULT_SHARED_ENTRIES = 1 << 20  # Number of entries of a new table
+
+# The data of an entry is a 64-bit number with these fields:
+VALID_BIT = 1 << 63  # Set for every stored entry, so that an empty entry is never valid
+DEPTH_SHIFT = 50     # 8 bits: depth + DEPTH_OFFSET
+BOUND_SHIFT = 48     # 2 bits: bound
+MOVE_SHIFT = 32      # 16 bits: best move + 1, 0 without a best move
+SCORE_OFFSET = 1 << 31  # 32 bits: score + SCORE_OFFSET
+DEPTH_OFFSET = 128
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: pack_data
+# This function returns the data of an entry as a 64-bit number.
+# -----------------------------------------------------------------------------
+def pack_data(depth, score, bound, best_move) -> int:
+    return (VALID_BIT |
+            (depth + DEPTH_OFFSET) << DEPTH_SHIFT |
+            bound << BOUND_SHIFT |
+            (0 if best_move is None else best_move + 1) << MOVE_SHIFT |
+            (score + SCORE_OFFSET))
+
+# -----------------------------------------------------------------------------
+# Function: unpack_data
+# This function returns the table entry for the data of an entry.
+# -----------------------------------------------------------------------------
+def unpack_data(data) -> TableEntry:
+    move = (data >> MOVE_SHIFT) & 0xFFFF
+    return TableEntry(((data >> DEPTH_SHIFT) & 0xFF) - DEPTH_OFFSET,
+                      (data & 0xFFFFFFFF) - SCORE_OFFSET,
+                      (data >> BOUND_SHIFT) & 3,
+                      None if move == 0 else move - 1)
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: SharedTranspositionTable
+# A transposition table in shared memory, so that the searches of several
+# processes use the same entries. It has the same methods as
+# TranspositionTable and can be passed to a Search.
+# The table consists of buckets of two fixed-size entries: one keeps the
+# deepest search and the other one is always replaced. No locks are used.
+# Each entry stores the position hash, its data and the hash XOR the data.
+# An entry that is read while another process writes it (a torn entry) has
+# a check that does not match; it is counted and treated as not stored.
+# The process that creates the table owns it and unlinks it when done. The
+# table can be passed to other processes, which then attach to it by name.
+# -----------------------------------------------------------------------------
+class SharedTranspositionTable:
+
+    # -------------------------------------------------------------------------
+    # SharedTranspositionTable constructor
+    # The constructor creates a new table with at least the indicated number
+    # of entries or, if a name is indicated, attaches to an existing table.
+    # -------------------------------------------------------------------------
+    def __init__(self, num_entries=DEFAULT_SHARED_ENTRIES, name=None):
+        if name is None:
+            num_buckets = 1 << max(num_entries // BUCKET_SIZE - 1, 1).bit_length()
+            self.memory = shared_memory.SharedMemory(create=True, size=num_buckets * BUCKET_SIZE * ENTRY_SIZE)
+            self.memory.buf[:] = bytes(len(self.memory.buf))
+            self.owner = True
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.memory.name
+        self.mask = len(self.memory.buf) // (BUCKET_SIZE * ENTRY_SIZE) - 1
+        self.torn_entries = 0
+
+    # -------------------------------------------------------------------------
+    # SharedTranspositionTable method: __reduce__
+    # A table that is passed to another process is attached to by name.
+    # -------------------------------------------------------------------------
+    def __reduce__(self):
+        return SharedTranspositionTable, (0, self.name)
+
+    # -------------------------------------------------------------------------
+    # SharedTranspositionTable method: close
+    # This method detaches from the table. The owner also removes it.
+    # -------------------------------------------------------------------------
+    def close(self) -> None:
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    # -------------------------------------------------------------------------
+    # SharedTranspositionTable method: read_entry
+    # This method returns the hash and the data of the entry at the offset or
+    # None if the entry is empty or torn. Torn entries are counted.
+    # -------------------------------------------------------------------------
+    def read_entry(self, offset) -> Optional[tuple[int, int]]:
+        stored_hash, data, check = ENTRY_FORMAT.unpack_from(self.memory.buf, offset)
+        if data & VALID_BIT == 0:
+            return None
+        if stored_hash ^ data != check:
+            self.torn_entries += 1
+            return None
+        return stored_hash, data
+
+    # -------------------------------------------------------------------------
+    # SharedTranspositionTable method: probe
+    # This method takes a position hash and returns the stored entry or None.
+    # -------------------------------------------------------------------------
+    def probe(self, position_hash) -> Optional[TableEntry]:
+        offset = (position_hash & self.mask) * BUCKET_SIZE * ENTRY_SIZE
+        for entry_offset in (offset, offset + ENTRY_SIZE):
+            entry = self.read_entry(entry_offset)
+            if entry is not None and entry[0] == position_hash:
+                return unpack_data(entry[1])
+        return None
+
+    # -------------------------------------------------------------------------
+    # SharedTranspositionTable method: store
+    # This method stores an entry for the position. The first entry of the
+    # bucket is replaced if it is for the same position or for a search that
+    # is not deeper, otherwise the second entry is replaced.
+    # -------------------------------------------------------------------------
+    def store(self, position_hash, depth, score, bound, best_move) -> None:
+        offset = (position_hash & self.mask) * BUCKET_SIZE * ENTRY_SIZE
+        entry = self.read_entry(offset)
+        if entry is not None and entry[0] != position_hash:
+            stored_depth = ((entry[1] >> DEPTH_SHIFT) & 0xFF) - DEPTH_OFFSET
+            if stored_depth > depth:
+                offset += ENTRY_SIZE
+        data = pack_data(depth, score, bound, best_move)
+        ENTRY_FORMAT.pack_into(self.memory.buf, offset, position_hash, data, position_hash ^ data)
+
+    # -------------------------------------------------------------------------
+    # SharedTranspositionTable method: clear
+    # -------------------------------------------------------------------------
+    def clear(self) -> None:
+        self.memory.buf[:] = bytes(len(self.memory.buf))
@@ -0,0 +1,284 @@
+# =============================================================================
+# Beetle Battle - Game Tuning Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Optional
+from multiprocessing import Pool
+import argparse
+import json
+import os
+import random
+import time
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_engine import HEURISTIC_WEIGHTS_FILE
+from game_engine import HEURISTIC_WEIGHTS_VARIABLE
+from game_engine import HEURISTIC_WEIGHT_STEPS
+from game_engine import DummyGui
+from game_engine import Game
+from game_engine import heuristic_weights
+from game_engine import set_heuristic_weights
+from game_ladder import MAX_GAME_MOVES
+from game_ladder import check_config
+from game_ladder import get_player_move
+from game_search import SearchTables
+
+# =============================================================================
+# Constants
+# =============================================================================
+DEFAULT_DIMENSION = 5
+DEFAULT_PLAYER = "depth:2"     # Configuration of both players (see get_player_move)
+DEFAULT_GAME_PAIRS = 8         # Game pairs per iteration; each opening is played with both colors
+DEFAULT_OPENING_MOVES = 4      # Random moves at the start of each game pair
+DEFAULT_ITERATIONS = 200
+
+# SPSA gains: the step of iteration k is LEARNING_RATE / (k + 1 + A) ** 0.602
+# times the estimated gradient, where A is STABILITY * iterations, and the
+# weights are perturbed by PERTURBATION / (k + 1) ** 0.101.
+LEARNING_RATE = 5.0
+PERTURBATION = 1.0
+STABILITY = 0.1
+LEARNING_RATE_DECAY = 0.602
+PERTURBATION_DECAY = 0.101
+
+MIN_WEIGHT = 0.0   # The weights are kept between these bounds
+MAX_WEIGHT = 20.0
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: play_opening
+# This function plays the indicated number of random moves, chosen with the
+# seed, on a new board and returns the game.
+# -----------------------------------------------------------------------------
+def play_opening(dimension, num_moves, seed) -> Game:
+    rng = random.Random(seed)
+    game = Game(dimension, DummyGui())
+    for _ in range(num_moves):
+        if game.get_winner() is not None:
+            break
+        move = rng.choice(game.get_possible_moves())
+        game.do_move(move.row, move.column)
+    return game
+
+# -----------------------------------------------------------------------------
+# Function: play_tuning_game
+# This function is run by the processes of the tuning pool. It takes the
+# weights of red and blue, the player configuration, the dimension, the
+# number of opening moves and the seed, and plays the game. Before each
+# move, the weights of the player to move are set and the square values of
+# the board are evaluated again, so that both players use their own weights
+# in the same process. It returns the color of the winner or None.
+# -----------------------------------------------------------------------------
+def play_tuning_game(arguments) -> Optional[str]:
+    red_weights, blue_weights, config, dimension, opening_moves, seed = arguments
+    random.seed(seed)
+    game = play_opening(dimension, opening_moves, seed)
+    weights = {"red": red_weights, "blue": blue_weights}
+    tables = {"red": SearchTables(), "blue": SearchTables()}
+    while game.get_winner() is None and len(game.moves) < MAX_GAME_MOVES:
+        set_heuristic_weights(weights[game.turn])
+        game.board.evaluator.recalculate()
+        move = get_player_move(game, config, tables[game.turn])
+        game.do_move(move.row, move.column)
+    return game.get_winner()
+
+# -----------------------------------------------------------------------------
+# Function: write_json
+# This function writes the data to a JSON file. The file is replaced at once,
+# so that it is never half written when the run is stopped.
+# -----------------------------------------------------------------------------
+def write_json(path, data) -> None:
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+    os.replace(temporary_path, path)
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: SpsaTuner
+# The tuner improves the weights of the heuristic with SPSA (simultaneous
+# perturbation stochastic approximation). Each iteration, all weights are
+# perturbed at once in a random direction, by plus and minus a step, and
+# the two weight vectors play a match against each other. The difference
+# in score estimates the gradient in that direction, and the weights are
+# moved along it. The games of a match are played by a pool of processes
+# that is kept for the whole run.
+# The settings and the progress are kept in a checkpoint file that is
+# written after every iteration, so that a stopped run can be continued.
+# The tuned weights are written in the format of the weights file of the
+# engine (see load_heuristic_weights).
+# -----------------------------------------------------------------------------
+class SpsaTuner:
+
+    # -------------------------------------------------------------------------
+    # SpsaTuner constructor
+    # The constructor continues the run of the checkpoint file if it exists,
+    # with the settings of that run; the indicated settings are then not
+    # used. Otherwise, a new run with the indicated settings is started from
+    # the current weights.
+    # -------------------------------------------------------------------------
+    def __init__(self, checkpoint_path, dimension=DEFAULT_DIMENSION, config=DEFAULT_PLAYER,
+                 game_pairs=DEFAULT_GAME_PAIRS, opening_moves=DEFAULT_OPENING_MOVES,
+                 iterations=DEFAULT_ITERATIONS, seed=0, weights=None):
+        self.checkpoint_path = checkpoint_path
+        self.resumed = os.path.exists(checkpoint_path)
+        if self.resumed:
+            with open(checkpoint_path, encoding="utf-8") as file:
+                self.state = json.load(file)
+            return
+
+        check_config(config)
+        weights = dict(heuristic_weights if weights is None else weights)
+        self.state = {
+            "settings": {"dimension": dimension, "config": config, "game_pairs": game_pairs,
+                         "opening_moves": opening_moves, "iterations": iterations, "seed": seed},
+            "iteration": 0,
+            "weights": {name: float(value) for name, value in weights.items()},
+            "history": [],
+        }
+
+    # -------------------------------------------------------------------------
+    # SpsaTuner method: get_gains
+    # This method returns the learning rate and the perturbation of the
+    # indicated iteration.
+    # -------------------------------------------------------------------------
+    def get_gains(self, iteration) -> tuple[float, float]:
+        stability = STABILITY * self.state["settings"]["iterations"]
+        learning_rate = LEARNING_RATE / (iteration + 1 + stability) ** LEARNING_RATE_DECAY
+        perturbation = PERTURBATION / (iteration + 1) ** PERTURBATION_DECAY
+        return learning_rate, perturbation
+
+    # -------------------------------------------------------------------------
+    # SpsaTuner method: get_tasks
+    # This method returns the games of the match of an iteration: for each
+    # game pair, the same opening is played once with the plus weights as red
+    # and once with the plus weights as blue.
+    # -------------------------------------------------------------------------
+    def get_tasks(self, iteration, plus_weights, minus_weights) -> list[tuple]:
+        settings = self.state["settings"]
+        tasks = []
+        for pair in range(settings["game_pairs"]):
+            seed = (settings["seed"] * 1000003 + iteration) * 1009 + pair
+            for red_weights, blue_weights in ((plus_weights, minus_weights), (minus_weights, plus_weights)):
+                tasks.append((red_weights, blue_weights, settings["config"], settings["dimension"],
+                              settings["opening_moves"], seed))
+        return tasks
+
+    # -------------------------------------------------------------------------
+    # SpsaTuner method: run_iteration
+    # This method plays the match of the next iteration with the pool and
+    # updates the weights. It returns the score of the plus weights.
+    # -------------------------------------------------------------------------
+    def run_iteration(self, pool) -> float:
+        iteration = self.state["iteration"]
+        weights = self.state["weights"]
+        learning_rate, perturbation = self.get_gains(iteration)
+
+        rng = random.Random(self.state["settings"]["seed"] * 1000003 + iteration)
+        directions = {name: rng.choice((-1, 1)) for name in weights}
+        plus_weights = {name: value + perturbation * directions[name] for name, value in weights.items()}
+        minus_weights = {name: value - perturbation * directions[name] for name, value in weights.items()}
+
+        tasks = self.get_tasks(iteration, plus_weights, minus_weights)
+        winners = pool.map(play_tuning_game, tasks) if pool is not None else list(map(play_tuning_game, tasks))
+        points = 0.0
+        for number, winner in enumerate(winners):
+            plus_color = "red" if number % 2 == 0 else "blue"
+            points += 0.5 if winner is None else float(winner == plus_color)
+        score = points / len(tasks)
+
+        # The score difference of the plus and minus weights is 2 * score - 1.
+        for name in weights:
+            gradient = (2 * score - 1) / (2 * perturbation * directions[name])
+            weights[name] = min(max(weights[name] + learning_rate * gradient, MIN_WEIGHT), MAX_WEIGHT)
+
+        self.state["iteration"] = iteration + 1
+        self.state["history"].append({"iteration": iteration + 1, "score": score, "weights": dict(weights)})
+        return score
+
+    # -------------------------------------------------------------------------
+    # SpsaTuner method: run
+    # This method runs the remaining iterations with the indicated number of
+    # processes. After each iteration, the checkpoint and the weights are
+    # written and the progress is reported to the callback. Without a pool,
+    # the games are played in this process, whose weights are restored
+    # afterwards.
+    # -------------------------------------------------------------------------
+    def run(self, processes=1, output_path=None, callback=None) -> dict:
+        pool = Pool(processes) if processes > 1 else None
+        original_weights = dict(heuristic_weights)
+        try:
+            while self.state["iteration"] < self.state["settings"]["iterations"]:
+                start_time = time.perf_counter()
+                score = self.run_iteration(pool)
+                write_json(self.checkpoint_path, self.state)
+                if output_path is not None:
+                    self.write_weights(output_path)
+                if callback is not None:
+                    callback(self.state["iteration"], score, self.state["weights"],
+                             time.perf_counter() - start_time)
+        finally:
+            set_heuristic_weights(original_weights)
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return self.state["weights"]
+
+    # -------------------------------------------------------------------------
+    # SpsaTuner method: write_weights
+    # This method writes the weights to a file that the engine can load,
+    # rounded like the engine does (see set_heuristic_weights).
+    # -------------------------------------------------------------------------
+    def write_weights(self, path) -> None:
+        write_json(path, {name: round(value * HEURISTIC_WEIGHT_STEPS) / HEURISTIC_WEIGHT_STEPS
+                          for name, value in self.state["weights"].items()})
+
+# =============================================================================
+# Main
+# =============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tune the weights of the heuristic with SPSA.")
+    parser.add_argument("checkpoint", help="checkpoint file of the run; an existing run is continued")
+    parser.add_argument("--output", default="tuned_weights.json", help="file for the tuned weights")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="number of processes")
+    # The settings of a new run; a continued run keeps its own settings.
+    parser.add_argument("--iterations", type=int, help=f"number of iterations (default {DEFAULT_ITERATIONS})")
+    parser.add_argument("--game-pairs", type=int,
+                        help=f"game pairs per iteration (default {DEFAULT_GAME_PAIRS})")
+    parser.add_argument("--player", help=f"player configuration (default {DEFAULT_PLAYER})")
+    parser.add_argument("--dimension", type=int, help=f"board dimension (default {DEFAULT_DIMENSION})")
+    parser.add_argument("--opening-moves", type=int,
+                        help=f"random moves at the start of each game pair (default {DEFAULT_OPENING_MOVES})")
+    parser.add_argument("--seed", type=int, help="seed of the run (default 0)")
+    args = parser.parse_args()
+
+    settings = {"dimension": args.dimension, "config": args.player, "game_pairs": args.game_pairs,
+                "opening_moves": args.opening_moves, "iterations": args.iterations, "seed": args.seed}
+    settings = {name: value for name, value in settings.items() if value is not None}
+    tuner = SpsaTuner(args.checkpoint, **settings)
+    if tuner.resumed:
+        for name, value in settings.items():
+            if value != tuner.state["settings"][name]:
+                print(f"Warning: the run of {args.checkpoint} is continued with {name} "
+                      f"{tuner.state['settings'][name]}; {value} is only used for new runs.")
+    names = list(tuner.state["weights"])
+    print("iteration  score  " + "  ".join(f"{name:>13}" for name in names))
+    tuner.run(args.processes, args.output,
+              lambda iteration, score, weights, seconds:
+              print(f"{iteration:9}  {score:5.2f}  " + "  ".join(f"{weights[name]:13.3f}" for name in names) +
+                    f"  ({seconds:.1f} s)"))
+    print(f"The weights are in {args.output}. The engine loads them at startup from "
+          f"{HEURISTIC_WEIGHTS_FILE} or from the file in {HEURISTIC_WEIGHTS_VARIABLE}.")
@@ -0,0 +1,578 @@
+# =============================================================================
+# Beetle Battle - Game Vector Module
+# By Fred Dijkstra
+# (c) 2023 - Computerguided Systems B.V.
+# =============================================================================
+
+# =============================================================================
+# Imports
+# =============================================================================
+from typing import Optional
+import argparse
+import time
+import numpy as np
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+from game_engine import DummyGui
+from game_engine import Game
+from game_engine import Location
+from game_engine import SimulationGame
+from game_engine import heuristic_weights
+
+# =============================================================================
+# Constants
+# =============================================================================
+EMPTY = 0  # Owner of an empty square
+RED = 1
+BLUE = 2
+OWNER_CODES = {None: EMPTY, "red": RED, "blue": BLUE}
+OWNER_NAMES = [None, "red", "blue"]
+
+MAX_WAVES = 1000  # A cascade that is not resolved after this many waves is left to the engine
+
+WIN_VALUE = 10000  # Value of a won position (see Game.calculate_board_value)
+
+MAX_GAME_MOVES = 1000  # A self-play game without a winner after this many moves is a draw
+
+# =============================================================================
+# Global Variables
+# =============================================================================
+capacities = {}  # Capacity of each square per board dimension
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Function: get_capacities
+# This function returns an (N, N) array with the capacity of each square of a
+# board with the indicated dimension: the number of neighbors.
+# -----------------------------------------------------------------------------
+def get_capacities(dimension: int) -> np.ndarray:
+    if dimension not in capacities:
+        capacity = np.full((dimension, dimension), 4, dtype=np.int16)
+        capacity[0, :] -= 1
+        capacity[-1, :] -= 1
+        capacity[:, 0] -= 1
+        capacity[:, -1] -= 1
+        capacities[dimension] = capacity
+    return capacities[dimension]
+
+# -----------------------------------------------------------------------------
+# Function: count_neighbors
+# This function takes a (K, N, N) boolean or integer array and returns for
+# each square the sum of the values of its neighbors.
+# -----------------------------------------------------------------------------
+def count_neighbors(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.int16, copy=False)
+    result = np.zeros_like(values)
+    result[:, 1:, :] += values[:, :-1, :]
+    result[:, :-1, :] += values[:, 1:, :]
+    result[:, :, 1:] += values[:, :, :-1]
+    result[:, :, :-1] += values[:, :, 1:]
+    return result
+
+# -----------------------------------------------------------------------------
+# Function: get_position_arrays
+# This function takes a Game or a SimulationGame and returns the (N, N) arrays
+# of the number of beetles and the owner of each square and the owner code
+# of the player to move.
+# -----------------------------------------------------------------------------
+def get_position_arrays(game) -> tuple[np.ndarray, np.ndarray, int]:
+    if isinstance(game, SimulationGame):
+        dimension = game.dimension
+        counts = np.array(game.counts, dtype=np.int16)
+        owners = np.array([OWNER_CODES[color] for color in game.colors], dtype=np.int8)
+    else:
+        dimension = game.board.dimension
+        counts = np.array([len(square.beetles) for square in game.board.squares], dtype=np.int16)
+        owners = np.array([OWNER_CODES[color] for color in game.board.square_colors], dtype=np.int8)
+    return (counts.reshape(dimension, dimension), owners.reshape(dimension, dimension),
+            OWNER_CODES[game.turn])
+
+# -----------------------------------------------------------------------------
+# Function: get_candidate_indices
+# This function returns the square indices of the possible moves of the
+# player to move, in the order of Game.get_possible_moves.
+# -----------------------------------------------------------------------------
+def get_candidate_indices(owners: np.ndarray, turn: int) -> np.ndarray:
+    flat_owners = owners.ravel()
+    return np.concatenate((np.flatnonzero(flat_owners == EMPTY), np.flatnonzero(flat_owners == turn)))
+
+# -----------------------------------------------------------------------------
+# Function: get_position_planes
+# This function takes (K, N, N) arrays of the number of beetles and the
+# owners and the owner codes of the players to move and returns the
+# positions as (K, 2, N, N) planes, seen from the player to move: the number
+# of beetles of the player to move and those of the opponent.
+# -----------------------------------------------------------------------------
+def get_position_planes(counts: np.ndarray, owners: np.ndarray, turns: np.ndarray) -> np.ndarray:
+    own = owners == np.asarray(turns, dtype=np.int8)[:, np.newaxis, np.newaxis]
+    planes = np.empty((counts.shape[0], 2) + counts.shape[1:], dtype=np.uint8)
+    np.multiply(counts, own, out=planes[:, 0], casting="unsafe")
+    np.subtract(counts, planes[:, 0], out=planes[:, 1], casting="unsafe")
+    return planes
+
+# -----------------------------------------------------------------------------
+# Function: simulate_candidates
+# This function takes a Game or a SimulationGame and the square indices of K
+# candidate moves (by default all possible moves) and returns the positions
+# after each of the moves. The cascades of all candidates are resolved
+# together, wave by wave: in each wave, every square with at least as many
+# beetles as its capacity sends one beetle to each neighbor.
+# All beetles of a cascade have the color of the player to move, so the
+# squares that are reached get that color whatever the order of the jumps.
+# Beetles are also never lost, so, as long as the cascade runs until it is
+# resolved, the result is the same as that of the jump by jump order of
+# Game.transition. The order matters when the cascade is stopped: when the
+# opponent loses its last square, Game.transition stops right away, while
+# the rest of the wave is done here, and when the cascade is not resolved
+# after the maximum number of waves. These candidates are marked as
+# different. With exact set, they are played again with SimulationGame so
+# that all positions are the same as those of the engine.
+# -----------------------------------------------------------------------------
+def simulate_candidates(game, candidates=None, exact=False, max_waves=MAX_WAVES) -> "CandidateSimulation":
+    counts, owners, turn = get_position_arrays(game)
+    dimension = counts.shape[0]
+    if candidates is None:
+        candidates = get_candidate_indices(owners, turn)
+    candidates = np.asarray(candidates, dtype=np.intp)
+    num_candidates = len(candidates)
+
+    # Expand the position and place the beetle of each candidate.
+    counts = np.repeat(counts[np.newaxis], num_candidates, axis=0)
+    owners = np.repeat(owners[np.newaxis], num_candidates, axis=0)
+    rows, columns = np.divmod(candidates, dimension)
+    candidate_numbers = np.arange(num_candidates)
+    counts[candidate_numbers, rows, columns] += 1
+    owners[candidate_numbers, rows, columns] = turn
+    num_beetles = np.full(num_candidates, counts[0].sum() if num_candidates > 0 else 0)
+    movers = np.full(num_candidates, turn, dtype=np.int8)
+
+    winners, jumps, waves, differs = resolve_cascades(counts, owners, movers, num_beetles, max_waves)
+
+    result = CandidateSimulation(dimension, turn, candidates, counts, owners, winners, jumps, waves, differs)
+    if exact:
+        result.replace_with_engine(game, np.flatnonzero(differs))
+    return result
+
+# -----------------------------------------------------------------------------
+# Function: resolve_cascades
+# This function takes (K, N, N) arrays of the number of beetles and the
+# owners right after a beetle was placed, the owner code of the player that
+# moved and the total number of beetles of each position, and resolves the
+# cascades of all positions together, wave by wave (see simulate_candidates).
+# The arrays are changed in place. Positions whose cascade is resolved are
+# left out of the next waves, so a long cascade of one position only costs
+# the work for that position. It returns for each position the winner (owner
+# code, 0 if none), the number of jumps and waves and whether the position
+# may differ from the position of Game.transition.
+# -----------------------------------------------------------------------------
+def resolve_cascades(counts, owners, movers, num_beetles, max_waves=MAX_WAVES) -> tuple:
+    num_positions = counts.shape[0]
+    capacity = get_capacities(counts.shape[1])
+    jumps = np.zeros(num_positions, dtype=np.int64)
+    waves = np.zeros(num_positions, dtype=np.int32)
+    winners = np.zeros(num_positions, dtype=np.int8)
+    differs = np.zeros(num_positions, dtype=bool)
+
+    # The positions with a cascade that is not resolved yet. When positions
+    # drop out, they are written back and the others are taken apart.
+    positions = np.arange(num_positions)
+    active_counts = counts
+    active_owners = owners
+    movers = np.asarray(movers, dtype=np.int8)[:, np.newaxis, np.newaxis]
+    opponents = np.where(movers == RED, BLUE, RED).astype(np.int8)
+    checks_winner = np.asarray(num_beetles) >= 3
+    won = np.zeros(num_positions, dtype=bool)
+
+    for _ in range(max_waves):
+        unstable = active_counts >= capacity
+        keep = unstable.any(axis=(1, 2)) & ~won
+        if not keep.all():
+            counts[positions] = active_counts
+            owners[positions] = active_owners
+            positions, movers, opponents, checks_winner, unstable = (
+                positions[keep], movers[keep], opponents[keep], checks_winner[keep], unstable[keep])
+            active_counts = counts[positions]
+            active_owners = owners[positions]
+            if len(positions) == 0:
+                break
+
+        sent = unstable * capacity
+        incoming = count_neighbors(unstable)
+        active_counts += incoming - sent
+        active_owners[:] = np.where(incoming > 0, movers, active_owners)
+        active_owners[active_counts == 0] = EMPTY
+        jumps[positions] += sent.sum(axis=(1, 2))
+        waves[positions] += 1
+
+        # The game is over when the opponent has no squares left.
+        won = checks_winner & ~(active_owners == opponents).any(axis=(1, 2))
+        winners[positions[won]] = movers[won, 0, 0]
+        differs[positions[won]] = True
+    else:
+        differs[positions[(active_counts >= capacity).any(axis=(1, 2)) & ~won]] = True
+
+    counts[positions] = active_counts
+    owners[positions] = active_owners
+    return winners, jumps, waves, differs
+
+# -----------------------------------------------------------------------------
+# Function: score_positions
+# This function takes (K, N, N) arrays of the number of beetles and the
+# owners and returns the value of each position for the indicated owner,
+# computed like Game.calculate_board_value.
+# -----------------------------------------------------------------------------
+def score_positions(counts: np.ndarray, owners: np.ndarray, color: int) -> np.ndarray:
+    capacity = get_capacities(counts.shape[1])
+    opponent = BLUE if color == RED else RED
+    critical = counts == capacity - 1
+    owned = owners == color
+
+    weights = heuristic_weights
+
+    # The vulnerability, edge, corner and unstability Heuristics
+    threats = count_neighbors(critical & (owners == opponent))
+    safe_values = ((weights["edge"] * (capacity == 3) + weights["corner"] * (capacity == 2))[np.newaxis] +
+                   weights["instability"] * critical)
+    square_values = np.where(threats > 0, -(weights["vulnerability"] - capacity) * threats, safe_values)
+    values = (square_values * owned).sum(axis=(1, 2))
+
+    # The number of beetles Heuristic
+    owned_beetles = (counts * owned).sum(axis=(1, 2))
+    opponent_beetles = counts.sum(axis=(1, 2)) - owned_beetles
+    values = values + weights["beetle"] * owned_beetles
+
+    # The chain Heuristic
+    values = np.rint(values + weights["chain"] * get_chain_lengths(critical & owned)).astype(np.int64)
+
+    # You win when the opponent has no beetles and lose when you have none.
+    values = np.where((opponent_beetles == 0) & (owned_beetles > 1), WIN_VALUE, values)
+    values = np.where((owned_beetles == 0) & (opponent_beetles > 1), -WIN_VALUE, values)
+    return values
+
+# -----------------------------------------------------------------------------
+# Function: get_chain_lengths
+# This function takes a (K, N, N) boolean array of the squares that can be
+# part of a chain and returns for each position the total length of the
+# chains of more than one square. Each square starts with its own label and
+# takes the smallest label of its neighbors in the chain until no label
+# changes, so the squares of a chain end up with the same label.
+# -----------------------------------------------------------------------------
+def get_chain_lengths(members: np.ndarray) -> np.ndarray:
+    num_positions, dimension, _ = members.shape
+    num_squares = dimension * dimension
+    no_label = num_positions * num_squares
+    labels = np.where(members, np.arange(no_label).reshape(members.shape), no_label)
+
+    while True:
+        smallest = labels.copy()
+        np.minimum(smallest[:, 1:, :], labels[:, :-1, :], out=smallest[:, 1:, :])
+        np.minimum(smallest[:, :-1, :], labels[:, 1:, :], out=smallest[:, :-1, :])
+        np.minimum(smallest[:, :, 1:], labels[:, :, :-1], out=smallest[:, :, 1:])
+        np.minimum(smallest[:, :, :-1], labels[:, :, 1:], out=smallest[:, :, :-1])
+        smallest = np.where(members, smallest, no_label)
+        if np.array_equal(smallest, labels):
+            break
+        labels = smallest
+
+    sizes = np.bincount(labels[members], minlength=no_label)
+    chain_sizes = np.where(sizes > 1, sizes, 0)
+    return chain_sizes.reshape(num_positions, num_squares).sum(axis=1)
+
+# -----------------------------------------------------------------------------
+# Function: get_best_possible_moves
+# This function returns the same moves as Game.get_best_possible_moves: the
+# possible moves with the highest value for the player to move. All moves
+# are simulated and scored together.
+# -----------------------------------------------------------------------------
+def get_best_possible_moves(game) -> list[Location]:
+    simulation = simulate_candidates(game)
+    values = score_positions(simulation.counts, simulation.owners, simulation.turn)
+    best_value = values.max()
+    return [Location(*divmod(int(index), simulation.dimension))
+            for index in simulation.candidates[values == best_value]]
+
+# -----------------------------------------------------------------------------
+# Function: verify_games
+# This function plays the finished self-play games again with Game and
+# returns a description of each difference: a move that is not possible, a
+# winner before the last move, a different winner after the last move or,
+# for a game without a winner, a different final position. Games that were
+# stopped because a cascade was not resolved are skipped.
+# -----------------------------------------------------------------------------
+def verify_games(dimension: int, finished_games) -> list[str]:
+    differences = []
+    for number, finished_game in enumerate(finished_games):
+        if finished_game.unresolved:
+            continue
+        game = Game(dimension, DummyGui())
+        for move_number, index in enumerate(finished_game.moves):
+            if game.get_winner() is not None:
+                differences.append(f"game {number}: winner before move {move_number}")
+                break
+            if not game.do_move(int(index) // dimension, int(index) % dimension):
+                differences.append(f"game {number}: move {move_number} is not possible")
+                break
+        else:
+            if game.get_winner() != finished_game.winner:
+                differences.append(f"game {number}: winner {game.get_winner()} instead of {finished_game.winner}")
+            elif finished_game.winner is None:
+                counts, owners, _ = get_position_arrays(game)
+                if not np.array_equal(counts, finished_game.counts) or not np.array_equal(owners, finished_game.owners):
+                    differences.append(f"game {number}: different final position")
+    return differences
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Class: CandidateSimulation
+# The result of simulate_candidates: for each candidate move, the position
+# after the move as (K, N, N) arrays of the number of beetles and the owners,
+# the winner (owner code, 0 if none), the number of jumps and waves and
+# whether the position may differ from the position of the engine. The
+# replaced array marks the candidates that were played by the engine.
+# -----------------------------------------------------------------------------
+class CandidateSimulation:
+
+    # -------------------------------------------------------------------------
+    # CandidateSimulation constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, dimension, turn, candidates, counts, owners, winners, jumps, waves, differs):
+        self.dimension  = dimension
+        self.turn       = turn
+        self.candidates = candidates
+        self.counts     = counts
+        self.owners     = owners
+        self.winners    = winners
+        self.jumps      = jumps
+        self.waves      = waves
+        self.differs    = differs
+        self.replaced   = np.zeros(len(candidates), dtype=bool)
+
+    # -------------------------------------------------------------------------
+    # CandidateSimulation method: replace_with_engine
+    # This method plays the indicated candidates with SimulationGame and
+    # replaces their positions and winners with the results.
+    # -------------------------------------------------------------------------
+    def replace_with_engine(self, game, candidate_numbers) -> None:
+        if len(candidate_numbers) == 0:
+            return
+        simulation = game.copy() if isinstance(game, SimulationGame) else game.to_simulation()
+        for number in candidate_numbers:
+            child = simulation.copy()
+            child.do_move(int(self.candidates[number]))
+            self.counts[number] = np.array(child.counts, dtype=np.int16).reshape(self.dimension, self.dimension)
+            self.owners[number] = np.array([OWNER_CODES[color] for color in child.colors],
+                                           dtype=np.int8).reshape(self.dimension, self.dimension)
+            self.winners[number] = OWNER_CODES[child.get_winner()]
+            self.replaced[number] = True
+
+    # -------------------------------------------------------------------------
+    # CandidateSimulation method: get_winner
+    # This method returns the color of the winner after the candidate with the
+    # indicated number or None.
+    # -------------------------------------------------------------------------
+    def get_winner(self, number) -> Optional[str]:
+        return OWNER_NAMES[self.winners[number]]
+
+# -----------------------------------------------------------------------------
+# Class: FinishedGame
+# A game of VectorSelfPlay that is over: the color of the winner (None for a
+# draw), the square indices of the moves and the final position. A game is
+# unresolved if it was stopped because a cascade was not resolved.
+# -----------------------------------------------------------------------------
+class FinishedGame:
+
+    # -------------------------------------------------------------------------
+    # FinishedGame constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, winner, moves, counts, owners, unresolved=False):
+        self.winner     = winner
+        self.moves      = moves
+        self.counts     = counts
+        self.owners     = owners
+        self.unresolved = unresolved
+
+# -----------------------------------------------------------------------------
+# Class: VectorSelfPlay
+# Self-play of a batch of games that are played in lockstep: every step, a
+# move is chosen and played in each game of the batch at the same time. The
+# positions are (B, N, N) arrays of the number of beetles and the owners.
+# The moves are sampled from the possible moves, uniformly or with the
+# probabilities of a policy. A policy is a function that takes the counts,
+# the owners, the owner codes of the players to move and the (B, N * N)
+# mask of the possible moves and returns (B, N * N) logits.
+# A game that is over is stored (if the moves are recorded) and replaced by
+# a new game in the same slot, so the batch always stays full.
+# -----------------------------------------------------------------------------
+class VectorSelfPlay:
+
+    # -------------------------------------------------------------------------
+    # VectorSelfPlay constructor
+    # -------------------------------------------------------------------------
+    def __init__(self, dimension, batch_size, seed=None, policy=None, max_moves=MAX_GAME_MOVES,
+                 record_moves=False, max_waves=MAX_WAVES):
+        self.dimension    = dimension
+        self.batch_size   = batch_size
+        self.policy       = policy
+        self.max_moves    = max_moves
+        self.record_moves = record_moves
+        self.max_waves    = max_waves
+        self.rng          = np.random.default_rng(seed)
+        self.capacity     = get_capacities(dimension).ravel()
+
+        self.counts      = np.zeros((batch_size, dimension, dimension), dtype=np.int16)
+        self.owners      = np.zeros((batch_size, dimension, dimension), dtype=np.int8)
+        self.turns       = np.full(batch_size, RED, dtype=np.int8)
+        self.move_counts = np.zeros(batch_size, dtype=np.int32)
+        self.history     = np.zeros((batch_size, max_moves), dtype=np.int16) if record_moves else None
+
+        # The games that were finished by the last step, with the owner code
+        # of the winner of each slot and whether its game was unresolved.
+        self.finished_numbers = np.zeros(0, dtype=np.intp)
+        self.winners          = np.zeros(batch_size, dtype=np.int8)
+        self.unresolved_games = np.zeros(batch_size, dtype=bool)
+
+        self.moves          = 0  # Number of moves played
+        self.games          = 0  # Number of finished games
+        self.wins           = {RED: 0, BLUE: 0}
+        self.draws          = 0
+        self.unresolved     = 0
+        self.finished_games = []
+
+    # -------------------------------------------------------------------------
+    # VectorSelfPlay method: get_legal_masks
+    # This method returns a (B, N * N) boolean array of the possible moves:
+    # the empty squares and the squares of the player to move.
+    # -------------------------------------------------------------------------
+    def get_legal_masks(self) -> np.ndarray:
+        owners = self.owners.reshape(self.batch_size, -1)
+        return (owners == EMPTY) | (owners == self.turns[:, np.newaxis])
+
+    # -------------------------------------------------------------------------
+    # VectorSelfPlay method: sample_moves
+    # This method takes the masks of the possible moves and returns a square
+    # index for each game. Without a policy, each possible move is equally
+    # likely. With a policy, a move is chosen with the softmax of the logits,
+    # by adding Gumbel noise to the logits and taking the largest one.
+    # -------------------------------------------------------------------------
+    def sample_moves(self, masks) -> np.ndarray:
+        if self.policy is None:
+            keys = self.rng.random(masks.shape, dtype=np.float32)
+        else:
+            logits = self.policy(self.counts, self.owners, self.turns, masks)
+            keys = logits + self.rng.gumbel(size=masks.shape)
+        return np.where(masks, keys, -np.inf).argmax(axis=1)
+
+    # -------------------------------------------------------------------------
+    # VectorSelfPlay method: step
+    # This method plays one move in every game: the indicated square indices
+    # or, by default, sampled moves. Only the games in which the new beetle
+    # fills its square have a cascade to resolve. The games that are over
+    # after the move are finished and replaced; they are kept in
+    # finished_numbers until the next step. It returns the moves.
+    # -------------------------------------------------------------------------
+    def step(self, moves=None) -> np.ndarray:
+        if moves is None:
+            moves = self.sample_moves(self.get_legal_masks())
+        games = np.arange(self.batch_size)
+        counts = self.counts.reshape(self.batch_size, -1)
+        owners = self.owners.reshape(self.batch_size, -1)
+        counts[games, moves] += 1
+        owners[games, moves] = self.turns
+        if self.history is not None:
+            self.history[games, self.move_counts] = moves
+        self.move_counts += 1
+        self.moves += self.batch_size
+
+        winners = np.zeros(self.batch_size, dtype=np.int8)
+        unresolved = np.zeros(self.batch_size, dtype=bool)
+        cascading = np.flatnonzero(counts[games, moves] >= self.capacity[moves])
+        if len(cascading) > 0:
+            cascade_counts = self.counts[cascading]
+            cascade_owners = self.owners[cascading]
+            cascade_winners, _, _, differs = resolve_cascades(cascade_counts, cascade_owners,
+                                                              self.turns[cascading],
+                                                              self.move_counts[cascading], self.max_waves)
+            self.counts[cascading] = cascade_counts
+            self.owners[cascading] = cascade_owners
+            winners[cascading] = cascade_winners
+            unresolved[cascading] = differs & (cascade_winners == EMPTY)
+
+        self.turns = np.where(self.turns == RED, BLUE, RED).astype(np.int8)
+        finished = (winners != EMPTY) | unresolved | (self.move_counts >= self.max_moves)
+        self.finished_numbers = np.flatnonzero(finished)
+        self.winners = winners
+        self.unresolved_games = unresolved
+        if len(self.finished_numbers) > 0:
+            self.finish_games(self.finished_numbers, winners, unresolved)
+        return moves
+
+    # -------------------------------------------------------------------------
+    # VectorSelfPlay method: finish_games
+    # This method counts the results of the indicated games, stores them if
+    # the moves are recorded and starts new games in their slots.
+    # -------------------------------------------------------------------------
+    def finish_games(self, numbers, winners, unresolved) -> None:
+        for number in numbers:
+            winner = int(winners[number])
+            self.games += 1
+            if unresolved[number]:
+                self.unresolved += 1
+            elif winner == EMPTY:
+                self.draws += 1
+            else:
+                self.wins[winner] += 1
+            if self.history is not None:
+                self.finished_games.append(FinishedGame(OWNER_NAMES[winner],
+                                                        self.history[number, :self.move_counts[number]].copy(),
+                                                        self.counts[number].copy(), self.owners[number].copy(),
+                                                        bool(unresolved[number])))
+
+        self.counts[numbers] = 0
+        self.owners[numbers] = EMPTY
+        self.turns[numbers] = RED
+        self.move_counts[numbers] = 0
+
+    # -------------------------------------------------------------------------
+    # VectorSelfPlay method: run
+    # This method plays the indicated number of steps and returns the number
+    # of seconds it took.
+    # -------------------------------------------------------------------------
+    def run(self, num_steps) -> float:
+        start_time = time.perf_counter()
+        for _ in range(num_steps):
+            self.step()
+        return time.perf_counter() - start_time
+
+# =============================================================================
+# Main
+# =============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play random games in lockstep with NumPy.")
+    parser.add_argument("--dimension", type=int, default=5, help="dimension of the board")
+    parser.add_argument("--batch", type=int, default=1024, help="number of games that are played at the same time")
+    parser.add_argument("--steps", type=int, default=1000, help="number of moves per game slot")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random moves")
+    parser.add_argument("--verify", action="store_true", help="play the finished games again with Game")
+    args = parser.parse_args()
+
+    self_play = VectorSelfPlay(args.dimension, args.batch, args.seed, record_moves=args.verify)
+    seconds = self_play.run(args.steps)
+    print(f"moves: {self_play.moves}, games: {self_play.games}, red: {self_play.wins[RED]}, "
+          f"blue: {self_play.wins[BLUE]}, draws: {self_play.draws}, unresolved: {self_play.unresolved}")
+    print(f"time: {seconds:.1f} s ({self_play.moves / max(seconds, 1e-9):.0f} moves/s)")
+
+    if args.verify:
+        differences = verify_games(args.dimension, self_play.finished_games)
+        for difference in differences:
+            print(difference)
+        print(f"verified: {len(self_play.finished_games)} games, differences: {len(differences)}")
+        if len(differences) > 0:
+            raise SystemExit(1)